@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+
+os.environ['VIKTOR_ENV'] = "PRODUCTION"
+import uvicorn
+
+from viktor.app import app
+from viktor.asgi import asgi_app
+
+
+@app.route('/')
+def index():
+    return 'VIKTOR'
+
+
+if __name__ == '__main__':
+    uvicorn.run(asgi_app, port=5003)
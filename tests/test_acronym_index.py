@@ -0,0 +1,54 @@
+from unittest import (
+    TestCase,
+    main,
+)
+from unittest.mock import MagicMock
+
+from viktor.core.acronym_index import AcronymIndex
+from viktor.model import AcronymType
+
+
+class TestAcronymIndex(TestCase):
+
+    def setUp(self) -> None:
+        self.mock_eng = MagicMock(name='PSQLClient')
+        self.mock_session = self.mock_eng.session_mgr.return_value.__enter__.return_value
+        self.mock_session.query.return_value.all.return_value = [
+            (AcronymType.STANDARD, 'Sheep\n'),
+            (AcronymType.STANDARD, 'soggy'),
+            (AcronymType.STANDARD, 'goat'),
+            (AcronymType.STANDARD, 'a'),
+            (AcronymType.WORK, 'synergy'),
+        ]
+        self.index = AcronymIndex(eng=self.mock_eng)
+
+    def test_guess(self):
+        guesses = self.index.guess(AcronymType.STANDARD, 'SGA1', n=5)
+        self.assertEqual(5, len(guesses))
+        for guess in guesses:
+            first, second, third, fourth = guess.split()
+            self.assertIn(first, ['sheep', 'soggy'])
+            self.assertEqual('goat', second)
+            # Single-letter words are skipped, so 'a' has nothing to draw from
+            self.assertEqual(['a', '1'], [third, fourth])
+        self.assertEqual(['synergy'], self.index.guess(AcronymType.WORK, 's', n=1))
+        self.assertIsNone(self.index.guess(AcronymType.URBAN, 'sga', n=1))
+        # Built once
+        self.assertEqual(1, self.mock_session.query.call_count)
+
+    def test_invalidate(self):
+        self.index.guess(AcronymType.STANDARD, 'sga', n=1)
+        self.index.invalidate()
+        self.index.guess(AcronymType.STANDARD, 'sga', n=1)
+        self.assertEqual(2, self.index.get_stats()['loads'])
+
+    def test_ttl(self):
+        index = AcronymIndex(eng=self.mock_eng, ttl_secs=0)
+        for _ in range(2):
+            index.guess(AcronymType.STANDARD, 'sga', n=1)
+        # Rebuilt once it's expired, even without being invalidated
+        self.assertEqual(2, index.get_stats()['loads'])
+
+
+if __name__ == '__main__':
+    main()
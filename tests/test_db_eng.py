@@ -40,6 +40,70 @@ class TestPSQLClient(TestCase):
         self.eng._dbsession().close.assert_called()
         self.assertIsNone(resp)
 
+    def test_get_setting_cached(self):
+        setting = MagicMock(setting_name=BotSettingType.IS_ALLOW_GLOBAL_REACTION, setting_int=1)
+        self.eng._dbsession().query().all.return_value = [setting]
+        self.eng._dbsession.reset_mock()
+        for _ in range(3):
+            self.assertTrue(self.eng.get_bot_setting(BotSettingType.IS_ALLOW_GLOBAL_REACTION))
+        self.assertIsNone(self.eng.get_bot_setting(BotSettingType.IS_POST_ERR_TRACEBACK))
+        # All settings are loaded once
+        self.assertEqual(1, self.eng._dbsession().query.call_count)
+        # Setting writes through to the cache
+        self.eng.set_bot_setting(BotSettingType.IS_ALLOW_GLOBAL_REACTION, False)
+        self.assertFalse(self.eng.get_bot_setting(BotSettingType.IS_ALLOW_GLOBAL_REACTION))
+        self.assertEqual(2, self.eng._dbsession().query.call_count)
+
+    def test_get_user_cached(self):
+        user = MagicMock(slack_user_hash='UHUMAN', slack_bot_hash=None)
+        self.eng._dbsession().query().filter().one_or_none.return_value = user
+        self.eng._dbsession.reset_mock()
+        for _ in range(3):
+            self.assertEqual(user, self.eng.get_user_from_hash('UHUMAN'))
+        self.assertEqual(1, self.eng._dbsession().query.call_count)
+        # Loading a user to change it skips the cache
+        self.eng.get_user_from_hash('UHUMAN', is_cached=False)
+        self.assertEqual(2, self.eng._dbsession().query.call_count)
+        self.eng.invalidate_user(user)
+        self.eng.get_user_from_hash('UHUMAN')
+        self.assertEqual(3, self.eng._dbsession().query.call_count)
+        stats = self.eng.user_cache.get_stats()
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(2, stats['misses'])
+
+    def test_get_bot_cached(self):
+        user = MagicMock(slack_user_hash='UBOT', slack_bot_hash='BBOT')
+        self.eng._dbsession().query().filter().one_or_none.return_value = user
+        self.eng._dbsession.reset_mock()
+        for _ in range(3):
+            self.assertEqual(user, self.eng.get_user_from_bot_hash('BBOT'))
+        self.assertEqual(user, self.eng.get_user_from_hash('UBOT'))
+        # One load under each key
+        self.assertEqual(2, self.eng._dbsession().query.call_count)
+        # Changing the user drops it under both
+        self.eng.invalidate_user(user)
+        self.eng.get_user_from_bot_hash('BBOT')
+        self.eng.get_user_from_hash('UBOT')
+        self.assertEqual(4, self.eng._dbsession().query.call_count)
+
+    def test_get_channel_cached(self):
+        self.eng._dbsession().query().filter().one_or_none.return_value = None
+        self.eng._dbsession.reset_mock()
+        for _ in range(3):
+            self.assertIsNone(self.eng.get_channel_from_hash('CUNKNOWN'))
+        # Only the first lookup should hit the db
+        self.assertEqual(1, self.eng._dbsession().query.call_count)
+        stats = self.eng.channel_cache.get_stats()
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(2, stats['negative_hits'])
+        self.eng.invalidate_channel('CUNKNOWN')
+        self.eng.get_channel_from_hash('CUNKNOWN')
+        self.assertEqual(2, self.eng._dbsession().query.call_count)
+        # Another process (e.g., the channel ETL) changed the channels
+        self.eng.changes._dispatch(ViktorPSQLClient.CHANNELS_KEY)
+        self.eng.get_channel_from_hash('CUNKNOWN')
+        self.assertEqual(3, self.eng._dbsession().query.call_count)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,41 @@
+from unittest import (
+    TestCase,
+    main,
+)
+from unittest.mock import patch
+
+from viktor.core.dedup import ExpiringKeyStore
+
+
+class TestExpiringKeyStore(TestCase):
+
+    def test_add_if_new(self):
+        store = ExpiringKeyStore(ttl_secs=60, max_keys=10)
+        self.assertTrue(store.add_if_new('a'))
+        self.assertFalse(store.add_if_new('a'))
+        self.assertIn('a', store)
+        self.assertNotIn('b', store)
+
+    def test_expiry(self):
+        store = ExpiringKeyStore(ttl_secs=60, max_keys=10)
+        with patch('viktor.core.dedup.time.monotonic', return_value=100.):
+            store.add('a')
+        with patch('viktor.core.dedup.time.monotonic', return_value=161.):
+            self.assertNotIn('a', store)
+            self.assertTrue(store.add_if_new('b'))
+            self.assertEqual(1, len(store))
+            self.assertEqual(1, store.get_stats()['expired'])
+
+    def test_capacity(self):
+        store = ExpiringKeyStore(ttl_secs=60, max_keys=3)
+        for key in 'abcde':
+            store.add(key)
+        stats = store.get_stats()
+        self.assertEqual(3, stats['size'])
+        self.assertEqual(2, stats['evicted'])
+        self.assertNotIn('a', store)
+        self.assertIn('e', store)
+
+
+if __name__ == '__main__':
+    main()
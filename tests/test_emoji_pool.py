@@ -0,0 +1,72 @@
+from unittest import (
+    TestCase,
+    main,
+)
+from unittest.mock import MagicMock
+
+from tests.common import get_test_logger
+from viktor.core.emoji_pool import EmojiPool
+
+
+class TestEmojiPool(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.log = get_test_logger()
+
+    def setUp(self) -> None:
+        self.mock_eng = MagicMock(name='PSQLClient')
+        mock_session = self.mock_eng.session_mgr.return_value.__enter__.return_value
+        rows = []
+        for name in ['sheep', 'party-parrot', 'blank', 'sheep']:
+            row = MagicMock(name='row')
+            row.name = name
+            rows.append(row)
+        mock_session.query.return_value.filter.return_value.all.return_value = rows
+        self.pool = EmojiPool(eng=self.mock_eng, parent_log=self.log)
+        self.pool.refresh()
+
+    def test_refresh(self):
+        self.assertEqual(3, len(self.pool))
+        self.assertIn('sheep', self.pool)
+
+    def test_incremental_changes(self):
+        self.pool.add('new-one')
+        self.pool.remove(['sheep', 'not-there'])
+        self.pool.rename('blank', 'blankest')
+        self.assertEqual({'party-parrot', 'new-one', 'blankest'}, set(self.pool.sample(10)))
+        self.assertNotIn('sheep', self.pool)
+        self.assertNotIn('blank', self.pool)
+
+    def test_rename_onto_existing(self):
+        self.pool.rename('blank', 'sheep')
+        self.assertEqual(2, len(self.pool))
+        self.assertEqual({'party-parrot', 'sheep'}, set(self.pool.sample(10)))
+
+    def test_changes_during_refresh(self):
+        mock_all = self.mock_eng.session_mgr.return_value.__enter__.return_value.query.return_value.filter.\
+            return_value.all
+        rows = mock_all.return_value
+
+        def read_rows():
+            # The emoji_changed handler gets in while the table is being read
+            self.pool.add('new-one')
+            self.pool.remove(['sheep'])
+            self.pool.rename('blank', 'blankest')
+            return rows
+        mock_all.side_effect = read_rows
+        self.pool.refresh()
+        self.assertEqual({'party-parrot', 'new-one', 'blankest'}, set(self.pool.sample(10)))
+        # Nothing's held onto once the refresh is done
+        mock_all.side_effect = None
+        self.pool.refresh()
+        self.assertEqual({'sheep', 'party-parrot', 'blank'}, set(self.pool.sample(10)))
+
+    def test_choice(self):
+        self.assertIn(self.pool.choice(), {'sheep', 'party-parrot', 'blank'})
+        self.pool.remove(['sheep', 'party-parrot', 'blank'])
+        self.assertIsNone(self.pool.choice())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+from pathlib import Path
+import tempfile
+from unittest import (
+    TestCase,
+    main,
+)
+from unittest.mock import MagicMock
+
+from tests.common import get_test_logger
+from viktor.core.error_sink import ErrorSink
+from viktor.model import ErrorType
+
+
+def raise_error(msg: str) -> Exception:
+    try:
+        raise ValueError(msg)
+    except ValueError as e:
+        return e
+
+
+class TestErrorSink(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.log = get_test_logger()
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.mock_eng = MagicMock(name='PSQLClient')
+        self.mock_session = self.mock_eng.session_mgr.return_value.__enter__.return_value
+        self.sink = ErrorSink(eng=self.mock_eng, parent_log=self.log, flush_secs=60, flush_events=3,
+                              spool_path=Path(self.tmpdir.name).joinpath('spool.jsonl'))
+        # Keeps record() from writing each error right away
+        self.sink._thread = MagicMock()
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_repeats_are_counted(self):
+        for _ in range(5):
+            self.sink.record(raise_error('bad input'), error_type=ErrorType.INPUT_ERROR)
+        self.sink.record(raise_error('other input'), error_type=ErrorType.INPUT_ERROR)
+        self.mock_session.execute.assert_not_called()
+        self.assertEqual(2, self.sink.flush())
+        rows = self.mock_session.execute.call_args[0][1]
+        self.assertListEqual([5, 1], [x['occurrence_count'] for x in rows])
+        self.assertEqual(ErrorType.INPUT_ERROR, rows[0]['error_type'])
+
+    def test_spool_and_replay(self):
+        self.mock_session.execute.side_effect = Exception('db is down')
+        self.sink.record(raise_error('bad input'), error_type=ErrorType.INPUT_ERROR)
+        self.assertEqual(0, self.sink.flush())
+        self.assertTrue(self.sink.spool_path.exists())
+        self.assertEqual(1, self.sink.get_stats()['rows_spooled'])
+
+        self.mock_session.execute.side_effect = None
+        self.sink.record(raise_error('other input'), error_type=ErrorType.INPUT_ERROR)
+        # The spooled error goes out along with the new one
+        self.assertEqual(2, self.sink.flush())
+        self.assertFalse(self.sink.spool_path.exists())
+        self.assertEqual(0, self.sink.flush())
+
+
+if __name__ == '__main__':
+    main()
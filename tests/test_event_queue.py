@@ -0,0 +1,65 @@
+import threading
+from unittest import (
+    TestCase,
+    main,
+)
+from unittest.mock import MagicMock
+
+from tests.common import get_test_logger
+from viktor.core.event_queue import EventQueue
+
+
+class TestEventQueue(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.log = get_test_logger()
+
+    def setUp(self) -> None:
+        self.event_queue = EventQueue(parent_log=self.log, n_workers=2, max_size=5)
+
+    def tearDown(self) -> None:
+        self.event_queue.shutdown()
+
+    def test_submit_runs_in_worker(self):
+        done = threading.Event()
+        thread_names = []
+
+        def process(event_data):
+            thread_names.append(threading.current_thread().name)
+            done.set()
+
+        self.event_queue.start()
+        self.assertTrue(self.event_queue.submit('message', process, {'event': {}}))
+        self.assertTrue(done.wait(5))
+        self.assertTrue(thread_names[0].startswith('event-worker'))
+
+    def test_join(self):
+        processed = []
+        self.event_queue.start()
+        for i in range(5):
+            self.event_queue.submit('message', processed.append, i)
+        self.event_queue.join()
+        self.assertListEqual(list(range(5)), sorted(processed))
+
+    def test_submit_inline_when_not_running(self):
+        func = MagicMock(name='process')
+        self.assertFalse(self.event_queue.submit('message', func, 'something'))
+        func.assert_called_with('something')
+        self.assertEqual(1, self.event_queue.get_stats()['processed_inline'])
+
+    def test_stats(self):
+        func = MagicMock(name='process', side_effect=ValueError('oops'))
+        self.event_queue.start()
+        self.event_queue.submit('reaction_added', func)
+        self.event_queue.submit('reaction_added', func)
+        self.event_queue.shutdown()
+        stats = self.event_queue.get_stats()
+        self.assertEqual(0, stats['depth'])
+        self.assertEqual(2, stats['wait']['count'])
+        self.assertEqual(2, stats['processing']['reaction_added']['count'])
+        self.assertEqual(2, stats['processing']['reaction_added']['errors'])
+
+
+if __name__ == '__main__':
+    main()
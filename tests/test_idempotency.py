@@ -0,0 +1,54 @@
+from unittest import (
+    TestCase,
+    main,
+)
+from unittest.mock import MagicMock
+
+from tests.common import get_test_logger
+from viktor.core.idempotency import EventIdempotencyStore
+from viktor.db_eng import ViktorPSQLClient
+from viktor.local_db import make_local_engine
+
+
+class TestEventIdempotencyStore(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.log = get_test_logger()
+
+    def test_in_memory(self):
+        store = EventIdempotencyStore(parent_log=self.log)
+        self.assertTrue(store.claim('Ev123', event_type='message'))
+        self.assertFalse(store.claim('Ev123', event_type='message', retry_num=1))
+        self.assertFalse(store.claim('Ev123', event_type='message', retry_num=2))
+        # No event_id, nothing to go on
+        self.assertTrue(store.claim(None))
+        stats = store.get_stats()
+        self.assertEqual(1, stats['claimed'])
+        self.assertEqual(2, stats['duplicates'])
+        self.assertEqual(2, stats['retries_absorbed'])
+
+    def test_db_backed(self):
+        mock_eng = MagicMock(name='PSQLClient')
+        mock_session = mock_eng.session_mgr.return_value.__enter__.return_value
+        # Another process already claimed this one
+        mock_session.execute.return_value.rowcount = 0
+        store = EventIdempotencyStore(parent_log=self.log, eng=mock_eng)
+        self.assertFalse(store.claim('Ev456', event_type='reaction_added', retry_num=1))
+        mock_session.execute.assert_called_once()
+        # Second time around it's caught in memory
+        self.assertFalse(store.claim('Ev456', event_type='reaction_added', retry_num=2))
+        mock_session.execute.assert_called_once()
+        self.assertEqual(2, store.get_stats()['retries_absorbed'])
+
+    def test_local_db(self):
+        engine = make_local_engine()
+        eng = ViktorPSQLClient(props={}, parent_log=self.log, engine=engine)
+        self.assertTrue(EventIdempotencyStore(parent_log=self.log, eng=eng).claim('Ev789', event_type='message'))
+        # As if from another process - only the db knows it's been claimed
+        self.assertFalse(EventIdempotencyStore(parent_log=self.log, eng=eng).claim('Ev789', event_type='message'))
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
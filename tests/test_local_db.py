@@ -0,0 +1,70 @@
+from unittest import (
+    TestCase,
+    main,
+)
+
+from sqlalchemy import event
+
+from tests.common import get_test_logger
+from viktor.db_eng import ViktorPSQLClient
+from viktor.local_db import (
+    make_local_engine,
+    seed_local_db,
+)
+from viktor.model import (
+    BotSettingType,
+    TableQuote,
+    TableSlackUser,
+)
+
+
+class TestLocalDb(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.log = get_test_logger()
+
+    def setUp(self) -> None:
+        self.engine = seed_local_db(make_local_engine(), n_users=5, n_quotes=20, seed=1)
+        self.eng = ViktorPSQLClient(props={}, parent_log=self.log, engine=self.engine)
+
+    def tearDown(self) -> None:
+        self.engine.dispose()
+
+    def test_client(self):
+        self.assertFalse(self.eng.get_bot_setting(BotSettingType.IS_ANNOUNCE_STARTUP))
+        self.assertEqual('user-3', self.eng.get_user_from_hash('U0003').display_name)
+        self.assertEqual('bench', self.eng.get_channel_from_hash('CBENCH').channel_name)
+        with self.eng.session_mgr() as session:
+            self.assertEqual(20, session.query(TableQuote).count())
+
+    def test_get_users_from_hashes(self):
+        with self.eng.session_mgr() as session:
+            session.add(TableSlackUser(slack_user_hash='UHOOK', slack_bot_hash='BHOOK', real_name='Webhook',
+                                       display_name='hook'))
+        n_stmts = []
+        event.listen(self.engine, 'before_cursor_execute', lambda *x: n_stmts.append(1))
+        users = self.eng.get_users_from_hashes(['U0001', 'BHOOK', 'BNAMED', 'UMISSING', None],
+                                               names={'BNAMED': 'WebHook'})
+        # Everything comes from one query
+        self.assertEqual(1, len(n_stmts))
+        self.assertDictEqual({
+            'U0001': 'U0001',
+            'BHOOK': 'UHOOK',
+            'BNAMED': 'UHOOK',
+            'UMISSING': 'UUNKNOWN',
+            None: 'UUNKNOWN',
+        }, {k: v.slack_user_hash for k, v in users.items()})
+        self.assertIsNone(self.eng.get_users_from_hashes(['UMISSING'], fallback_hash=None)['UMISSING'])
+
+    def test_session_rollback(self):
+        with self.assertRaises(ValueError):
+            with self.eng.session_mgr() as session:
+                session.add(TableSlackUser(slack_user_hash='UNEW', real_name='new', display_name='new'))
+                session.flush()
+                raise ValueError('nope')
+        self.assertIsNone(self.eng.get_user_from_hash('UNEW', is_cached=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import time
+from unittest import (
+    TestCase,
+    main,
+)
+from unittest.mock import MagicMock
+
+from flask import Flask
+
+from viktor.core.metrics import (
+    REGISTRY,
+    instrument_command,
+    instrument_flask_app,
+    instrument_slack_client,
+    record_route,
+    register_stats,
+)
+
+
+class TestMetrics(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.app = Flask(__name__)
+
+        @cls.app.route('/cron/<thing>', methods=['POST'])
+        def handle_thing(thing: str):
+            return thing
+
+        instrument_flask_app(cls.app)
+        register_stats(lambda: {'event_queue': {'depth': 3, 'wait': {'avg_secs': 0.5}, 'name': 'skipped'}})
+        cls.client = cls.app.test_client()
+
+    @staticmethod
+    def get_sample(name: str, labels: dict) -> float:
+        return REGISTRY.get_sample_value(name, labels)
+
+    def test_route_metrics(self):
+        labels = {'route': '/cron/<thing>', 'method': 'POST', 'status': '200'}
+        before = self.get_sample('viktor_http_request_seconds_count', labels) or 0
+        self.client.post('/cron/new-emojis')
+        self.assertEqual(before + 1, self.get_sample('viktor_http_request_seconds_count', labels))
+
+    def test_record_route(self):
+        # As the ASGI app does for the routes it serves without Flask
+        labels = {'route': '/api/slash', 'method': 'POST', 'status': '200'}
+        before = self.get_sample('viktor_http_request_seconds_count', labels) or 0
+        record_route('/api/slash', method='POST', status=200, start=time.perf_counter())
+        self.assertEqual(before + 1, self.get_sample('viktor_http_request_seconds_count', labels))
+
+    def test_metrics_endpoint(self):
+        resp = self.client.get('/metrics')
+        self.assertEqual(200, resp.status_code)
+        body = resp.get_data(as_text=True)
+        self.assertIn('viktor_component_stat{component="event_queue",stat="wait_avg_secs"} 0.5', body)
+        self.assertNotIn('stat="name"', body)
+
+    def test_instrument_command(self):
+        func = instrument_command('giggle', lambda: 'tihi')
+        self.assertEqual('tihi', func())
+        self.assertEqual(1, self.get_sample('viktor_command_seconds_count', {'command': 'giggle', 'outcome': 'ok'}))
+
+        def broken():
+            raise ValueError('oops')
+        func = instrument_command('broken', broken)
+        with self.assertRaises(ValueError):
+            func()
+        labels = {'command': 'broken', 'outcome': 'error'}
+        self.assertEqual(1, self.get_sample('viktor_command_seconds_count', labels))
+
+    def test_instrument_slack_client(self):
+        client = MagicMock(name='WebClient')
+        api_call = client.api_call
+        instrument_slack_client(client)
+        client.api_call('reactions.add', json={'name': 'sheep'})
+        api_call.assert_called_with('reactions.add', json={'name': 'sheep'})
+        labels = {'api_method': 'reactions.add', 'outcome': 'ok'}
+        self.assertEqual(1, self.get_sample('viktor_slack_api_seconds_count', labels))
+
+
+if __name__ == '__main__':
+    main()
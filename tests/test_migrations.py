@@ -0,0 +1,110 @@
+from datetime import datetime
+from unittest import (
+    TestCase,
+    main,
+)
+from unittest.mock import patch
+
+from sqlalchemy import (
+    Index,
+    func,
+)
+from sqlalchemy.orm import sessionmaker
+
+from tests.common import get_test_logger
+from viktor.etl.migrations import (
+    DIALECT_INDEXES,
+    apply_column_migrations,
+    apply_index_migrations,
+    check_hot_queries,
+    create_missing_tables,
+    get_declared_indexes,
+)
+from viktor.local_db import make_local_engine
+from viktor.model import (
+    TableProcessedEvent,
+    TableQuote,
+    TableSlackUser,
+    TableSlackUserChangeLog,
+)
+
+
+class TestMigrations(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.log = get_test_logger()
+
+    def setUp(self) -> None:
+        self.engine = make_local_engine()
+        # Make it look like a db from before the indexes were declared
+        for index in get_declared_indexes():
+            index.drop(bind=self.engine)
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql('CREATE INDEX viktor.ix_quote_message_timestamp_link ON quote (message_timestamp, link)')
+
+    def tearDown(self) -> None:
+        self.engine.dispose()
+
+    def test_migrate_and_check(self):
+        self.assertFalse(any(check_hot_queries(self.engine, log=self.log).values()))
+        created = apply_index_migrations(self.engine, log=self.log)
+        self.assertEqual(len(get_declared_indexes()), len(created))
+        # The unique index replaces the old one
+        with self.engine.connect() as conn:
+            self.assertFalse(self.engine.dialect.has_index(conn, 'quote', 'ix_quote_message_timestamp_link',
+                                                           schema='viktor'))
+        # Running it again shouldn't do anything
+        self.assertListEqual([], apply_index_migrations(self.engine, log=self.log))
+        results = check_hot_queries(self.engine, log=self.log)
+        self.assertTrue(all(results.values()), results)
+
+    def test_dialect_indexes(self):
+        index = Index('ix_quote_text_lower', func.lower(TableQuote.text))
+        TableQuote.__table__.indexes.discard(index)
+        # Postgres' has_index doesn't see indexes on expressions, so each run would try to create it again
+        with patch.dict(DIALECT_INDEXES, {'sqlite': [index]}), \
+                patch.object(type(self.engine.dialect), 'has_index', return_value=False):
+            self.assertIn(index.name, apply_index_migrations(self.engine, log=self.log))
+            self.assertListEqual([], apply_index_migrations(self.engine, log=self.log))
+
+    def test_dedupe_quotes(self):
+        session = sessionmaker(bind=self.engine)()
+        for i, link in enumerate(['a', 'a', 'b', None, None]):
+            session.add(TableQuote(text=f'quote {i}', message_timestamp=datetime(2022, 1, 1),
+                                   pin_timestamp=datetime(2022, 1, 1), link=link, author_user_key=1,
+                                   channel_key=1, pinner_user_key=1))
+        session.commit()
+        self.assertIn('uq_quote_message_timestamp_link', apply_index_migrations(self.engine, log=self.log))
+        # The first of the repeats is kept. Those without a link never clash, so they're left alone
+        self.assertListEqual(['quote 0', 'quote 2', 'quote 3', 'quote 4'],
+                             [x.text for x in session.query(TableQuote).order_by(TableQuote.quote_id)])
+        session.close()
+
+    def test_create_tables(self):
+        TableProcessedEvent.__table__.drop(bind=self.engine)
+        self.assertListEqual(['viktor.processed_event'], create_missing_tables(self.engine, log=self.log))
+        self.assertListEqual([], create_missing_tables(self.engine, log=self.log))
+
+    def test_add_columns(self):
+        session = sessionmaker(bind=self.engine)()
+        session.add(TableSlackUser(slack_user_hash='UONE', real_name='one', display_name='One'))
+        session.flush()
+        session.add(TableSlackUserChangeLog(user_key=1, real_name='one'))
+        session.commit()
+        session.close()
+        with self.engine.begin() as conn:
+            for col in ['is_full_snapshot', 'changed_attrs']:
+                conn.exec_driver_sql(f'ALTER TABLE viktor.slack_user_change_log DROP COLUMN {col}')
+        self.assertListEqual(['viktor.slack_user_change_log.is_full_snapshot',
+                              'viktor.slack_user_change_log.changed_attrs'],
+                             apply_column_migrations(self.engine, log=self.log))
+        self.assertListEqual([], apply_column_migrations(self.engine, log=self.log))
+        with self.engine.connect() as conn:
+            # Existing entries are treated as full snapshots
+            self.assertEqual((1, None), conn.exec_driver_sql(
+                'SELECT is_full_snapshot, changed_attrs FROM viktor.slack_user_change_log').one())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+from unittest import (
+    TestCase,
+    main,
+)
+from unittest.mock import MagicMock
+
+from slack.errors import SlackApiError
+
+from tests.common import get_test_logger
+from viktor.core.token_bucket import TokenBucket
+from viktor.etl.pin_backfill import (
+    PinBackfill,
+    get_retry_after,
+)
+
+
+class FakeClock:
+    """Time that only moves when something sleeps"""
+
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, secs: float):
+        self.now += secs
+
+
+def api_error(error: str, status_code: int, **kwargs) -> SlackApiError:
+    resp = MagicMock(status_code=status_code, **kwargs)
+    err = SlackApiError(error, resp)
+    err.response = resp
+    return err
+
+
+def rate_limited(retry_after: str = '2', header: str = 'Retry-After') -> SlackApiError:
+    return api_error('ratelimited', 429, headers={header: retry_after})
+
+
+class TestTokenBucket(TestCase):
+
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.bucket = TokenBucket.per_minute(60, capacity=2, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_acquire(self):
+        # The burst goes out right away, then one a second
+        self.assertListEqual([0, 0, 1, 1], [self.bucket.acquire() for _ in range(4)])
+        self.assertEqual(2, self.clock.now)
+
+    def test_pause(self):
+        self.bucket.pause(10)
+        self.bucket.acquire()
+        # Nothing banked during the pause
+        self.assertEqual(11, self.clock.now)
+        self.assertEqual(1, self.bucket.get_stats()['pauses'])
+
+
+class TestPinBackfill(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.log = get_test_logger()
+
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.bot = MagicMock(name='bot')
+        self.backfill = PinBackfill(bot=self.bot, parent_log=self.log, n_workers=1, max_retries=2, bucket=TokenBucket(
+            rate_per_sec=100, capacity=10, clock=self.clock, sleep=self.clock.sleep))
+
+    def test_retry_after(self):
+        self.bot.pins_list.side_effect = [rate_limited('5'), {'items': [{}, {}]}]
+        self.assertEqual(2, len(self.backfill.fetch(['C1'])))
+        # Waited out the Retry-After before trying again
+        self.assertGreaterEqual(self.clock.now, 5)
+        stats = self.backfill.get_stats()
+        self.assertEqual((2, 1, 0), (stats['calls'], stats['rate_limited'], stats['failed']))
+
+    def test_lowercase_retry_after(self):
+        self.bot.pins_list.side_effect = [rate_limited('5', header='retry-after'), {'items': [{}]}]
+        self.assertEqual(1, len(self.backfill.fetch(['C1'])))
+        self.assertGreaterEqual(self.clock.now, 5)
+        self.assertEqual(30., get_retry_after({'RETRY-AFTER': ['30']}))
+        self.assertEqual(1., get_retry_after({}))
+
+    def test_gives_up(self):
+        not_in_channel = api_error('not_in_channel', 200)
+        self.bot.pins_list.side_effect = [not_in_channel] + [rate_limited()] * 3 + [{'items': [{}]}]
+        self.assertEqual(1, len(self.backfill.fetch(['C1', 'C2', 'C3'])))
+        stats = self.backfill.get_stats()
+        # One call for the channel we're not in, three for the one that stayed rate limited
+        self.assertEqual((5, 3, 2), (stats['calls'], stats['rate_limited'], stats['failed']))
+
+
+if __name__ == '__main__':
+    main()
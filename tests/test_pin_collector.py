@@ -0,0 +1,119 @@
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import (
+    TestCase,
+    main,
+)
+
+import pytz
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+
+from tests.common import get_test_logger
+from viktor.core.pin_collector import (
+    US_CENTRAL,
+    _pg_insert_quotes,
+    _quote_identity,
+    collect_pins_batch,
+    insert_quotes,
+)
+from viktor.db_eng import ViktorPSQLClient
+from viktor.local_db import (
+    make_local_engine,
+    seed_local_db,
+)
+from viktor.model import (
+    TableQuote,
+    TableSlackUser,
+)
+
+
+def make_pin(author: str = None, bot_id: str = None, username: str = None, pinner: str = 'U0001',
+             channel: str = 'CBENCH') -> SimpleNamespace:
+    return SimpleNamespace(
+        created_by=pinner,
+        created=1650000100,
+        message=SimpleNamespace(user=author, bot_id=bot_id, username=username, channel=channel, text='hello',
+                                files=None, permalink='https://example.slack.com/archives/CBENCH/p1',
+                                ts='1650000000.000100')
+    )
+
+
+class TestPinCollector(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.log = get_test_logger()
+
+    def setUp(self) -> None:
+        self.engine = seed_local_db(make_local_engine(), n_users=3, n_quotes=0)
+        self.eng = ViktorPSQLClient(props={}, parent_log=self.log, engine=self.engine)
+        with self.eng.session_mgr() as session:
+            session.add(TableSlackUser(slack_user_hash='UHOOK', slack_bot_hash='BHOOK', real_name='Webhook',
+                                       display_name='hook'))
+            self.user_keys = dict(session.query(TableSlackUser.slack_user_hash, TableSlackUser.user_id).all())
+        self.n_stmts = 0
+
+        def count(*args):
+            self.n_stmts += 1
+        event.listen(self.engine, 'before_cursor_execute', count)
+
+    def tearDown(self) -> None:
+        self.engine.dispose()
+
+    def test_collect_pins_batch(self):
+        quotes = collect_pins_batch([
+            make_pin(author='U0000'),
+            # Bot known by its hash, bot known only by name, and a total stranger
+            make_pin(bot_id='BHOOK'),
+            make_pin(bot_id='BOTHER', username='webhook'),
+            make_pin(author='UNOPE', pinner='UNOPE', channel='CNOPE'),
+        ], psql_client=self.eng, log=self.log, is_event=False)
+        # Everything gets resolved in one go
+        self.assertEqual(1, self.n_stmts)
+        self.assertListEqual(
+            [self.user_keys[x] for x in ['U0000', 'UHOOK', 'UHOOK', 'UUNKNOWN']],
+            [x.author_user_key for x in quotes]
+        )
+        self.assertListEqual([self.user_keys['U0001']] * 3 + [self.user_keys['UUNKNOWN']],
+                             [x.pinner_user_key for x in quotes])
+        self.assertIsNone(quotes[-1].channel_key)
+        self.assertEqual(self.eng.get_channel_from_hash('CBENCH').channel_id, quotes[0].channel_key)
+
+    def test_insert_quotes(self):
+        pins = [make_pin(author='U0000'), make_pin(author='U0001')]
+        pins[1].message.permalink += '0'
+        quotes = collect_pins_batch(pins, psql_client=self.eng, log=self.log, is_event=False)
+        with self.eng.session_mgr() as session:
+            self.assertListEqual([True, True], insert_quotes(session, quotes))
+        # A redelivery, along with a new pin
+        pins.append(make_pin(author='U0002'))
+        pins[2].message.permalink += '1'
+        quotes = collect_pins_batch(pins, psql_client=self.eng, log=self.log, is_event=False)
+        with self.eng.session_mgr() as session:
+            self.assertListEqual([False, False, True], insert_quotes(session, quotes))
+            self.assertEqual(3, session.query(TableQuote).count())
+            # Unpinned, then pinned again
+            session.query(TableQuote).filter(TableQuote.link == pins[0].message.permalink).update(
+                {TableQuote.is_deleted: True})
+        with self.eng.session_mgr() as session:
+            self.assertListEqual([True, False, False], insert_quotes(session, quotes))
+            self.assertEqual(0, session.query(TableQuote).filter(TableQuote.is_deleted.is_(True)).count())
+
+    def test_pg_insert_quotes(self):
+        quotes = collect_pins_batch([make_pin(author='U0000')], psql_client=self.eng, log=self.log, is_event=False)
+        sql = str(_pg_insert_quotes([{'text': x.text, 'message_timestamp': x.message_timestamp, 'link': x.link}
+                                     for x in quotes]).compile(dialect=postgresql.dialect()))
+        self.assertIn('ON CONFLICT (message_timestamp, link) DO UPDATE SET is_deleted', sql)
+        self.assertIn('WHERE viktor.quote.is_deleted IS true', sql)
+        self.assertIn("RETURNING timezone(current_setting(%(current_setting_1)s), viktor.quote.message_timestamp)",
+                      sql)
+        # What comes back is in the session's timezone, but it's the same instant
+        sent = {'message_timestamp': US_CENTRAL.localize(datetime(2022, 1, 1, 6)), 'link': 'x'}
+        returned = {'message_timestamp': pytz.utc.localize(datetime(2022, 1, 1, 12)), 'link': 'x'}
+        self.assertEqual(_quote_identity(sent), _quote_identity(returned))
+        self.assertEqual(1, len({_quote_identity(sent), _quote_identity(returned)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+from datetime import datetime
+from unittest import (
+    TestCase,
+    main,
+)
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from tests.common import get_test_logger
+from viktor.core.quote_search import (
+    QuoteSearch,
+    parse_query,
+)
+from viktor.db_eng import ViktorPSQLClient
+from viktor.local_db import (
+    make_local_engine,
+    seed_local_db,
+)
+from viktor.model import (
+    QUOTE_TEXT_SEARCH_INDEX,
+    TableQuote,
+)
+
+QUOTES = [
+    'The sheep are in the barn',
+    'I have never seen a sheep drive a tractor',
+    'Goats are better than sheep, sheep are better than goats',
+    'The barn is on fire',
+    'Someone left the tractor in the barn again',
+]
+
+
+class TestQuoteSearch(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.log = get_test_logger()
+
+    def setUp(self) -> None:
+        self.engine = seed_local_db(make_local_engine(), n_users=3, n_quotes=0)
+        self.eng = ViktorPSQLClient(props={}, parent_log=self.log, engine=self.engine)
+        self.channel_key = self.eng.get_channel_from_hash('CBENCH').channel_id
+        with self.eng.session_mgr() as session:
+            for i, text in enumerate(QUOTES):
+                # The first two are from user 1, the rest from user 2
+                session.add(TableQuote(text=text, message_timestamp=datetime(2022, 1, 1, i),
+                                       pin_timestamp=datetime(2022, 1, 2), link=f'https://example.com/p{i}',
+                                       author_user_key=2 if i < 2 else 3, pinner_user_key=1,
+                                       channel_key=self.channel_key))
+        self.search = QuoteSearch(eng=self.eng, page_size=2)
+
+    def tearDown(self) -> None:
+        self.engine.dispose()
+
+    def test_parse_query(self):
+        self.assertEqual(('sheep barn', 'U0001', 'C0002'), parse_query('sheep -u <@U0001> barn -c <#C0002|general>'))
+        self.assertEqual(('sheep', None, None), parse_query('  sheep '))
+
+    def test_search(self):
+        results, cursor = self.search.search('sheep')
+        # Mentioned twice, so it comes first
+        self.assertEqual(QUOTES[2], results[0][1].text)
+        self.assertEqual('user-1', results[0][1].author.display_name)
+        self.assertIsNotNone(cursor)
+        # Every term has to be there, and stop words don't count
+        self.assertListEqual([QUOTES[4]], [x[1].text for x in self.search.search('the tractor barn')[0]])
+        self.assertListEqual([], self.search.search('sheep fire')[0])
+        self.assertListEqual([], self.search.search('the')[0])
+        # Filters
+        self.assertListEqual([QUOTES[0]], [x[1].text for x in self.search.search('barn', author_key=2)[0]])
+        self.assertListEqual([], self.search.search('barn', channel_key=self.channel_key + 1)[0])
+
+    def test_pagination(self):
+        pages = []
+        cursor = None
+        while True:
+            results, cursor = self.search.search('barn', after=cursor)
+            pages.append([x[1].text for x in results])
+            if cursor is None:
+                break
+        self.assertEqual([2, 1], [len(x) for x in pages])
+        self.assertSetEqual({QUOTES[0], QUOTES[3], QUOTES[4]}, {x for page in pages for x in page})
+
+    def test_invalidate(self):
+        self.assertListEqual([], self.search.search('llama')[0])
+        with self.eng.session_mgr() as session:
+            session.add(TableQuote(text='A llama', message_timestamp=datetime(2022, 2, 1),
+                                   pin_timestamp=datetime(2022, 2, 2), author_user_key=2, pinner_user_key=1,
+                                   channel_key=self.channel_key))
+        self.search.invalidate()
+        self.assertEqual(1, len(self.search.search('llama')[0]))
+        self.assertEqual(2, self.search.get_stats()['loads'])
+
+    def test_ttl(self):
+        search = QuoteSearch(eng=self.eng, ttl_secs=0)
+        self.assertListEqual([], search.search('llama')[0])
+        with self.eng.session_mgr() as session:
+            session.add(TableQuote(text='A llama', message_timestamp=datetime(2022, 2, 1),
+                                   pin_timestamp=datetime(2022, 2, 2), author_user_key=2, pinner_user_key=1,
+                                   channel_key=self.channel_key))
+        # Picked up once the index expires, even without being invalidated
+        self.assertEqual(1, len(search.search('llama')[0]))
+
+    def test_unpinned(self):
+        with self.eng.session_mgr() as session:
+            session.query(TableQuote).filter(TableQuote.text == QUOTES[3]).update({TableQuote.is_deleted: True})
+        self.search.invalidate()
+        self.assertListEqual([], self.search.search('fire')[0])
+
+    def test_full_text_index(self):
+        self.assertFalse(self.search.is_full_text)
+        ddl = str(CreateIndex(QUOTE_TEXT_SEARCH_INDEX).compile(dialect=postgresql.dialect()))
+        self.assertIn("USING gin (to_tsvector('english', text))", ddl)
+        # Left out of the SQLite db altogether
+        with self.engine.connect() as conn:
+            self.assertFalse(self.engine.dialect.has_index(conn, 'quote', QUOTE_TEXT_SEARCH_INDEX.name,
+                                                           schema='viktor'))
+
+
+if __name__ == '__main__':
+    main()
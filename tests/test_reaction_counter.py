@@ -0,0 +1,48 @@
+from unittest import (
+    TestCase,
+    main,
+)
+from unittest.mock import MagicMock
+
+from tests.common import get_test_logger
+from viktor.core.reaction_counter import ReactionCountBuffer
+
+
+class TestReactionCountBuffer(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.log = get_test_logger()
+
+    def setUp(self) -> None:
+        self.mock_eng = MagicMock(name='PSQLClient')
+        self.mock_session = self.mock_eng.session_mgr.return_value.__enter__.return_value
+        self.buffer = ReactionCountBuffer(eng=self.mock_eng, parent_log=self.log, flush_secs=60, flush_events=3)
+
+    def test_flush_on_event_threshold(self):
+        self.buffer.increment('party-parrot')
+        self.buffer.increment('party-parrot')
+        self.mock_session.execute.assert_not_called()
+        self.buffer.increment('sheep')
+        # One statement for all the emojis
+        self.mock_session.execute.assert_called_once()
+        stats = self.buffer.get_stats()
+        self.assertEqual(0, stats['pending_reactions'])
+        self.assertEqual(1, stats['flushes'])
+        self.assertEqual(2, stats['rows_flushed'])
+
+    def test_flush_failure_keeps_counts(self):
+        self.mock_session.execute.side_effect = Exception('db is down')
+        self.buffer.increment('sheep')
+        self.assertEqual(0, self.buffer.flush())
+        self.assertEqual(1, self.buffer.get_stats()['pending_reactions'])
+
+    def test_shutdown_flushes(self):
+        self.buffer.start()
+        self.buffer.increment('sheep')
+        self.buffer.shutdown()
+        self.mock_session.execute.assert_called_once()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+from unittest import (
+    TestCase,
+    main,
+)
+from unittest.mock import MagicMock
+
+from viktor.core.response_index import ResponseIndex
+from viktor.model import (
+    ResponseCategory,
+    ResponseType,
+    TableResponse,
+)
+
+
+class TestResponseIndex(TestCase):
+
+    def setUp(self) -> None:
+        self.mock_eng = MagicMock(name='PSQLClient')
+        self.mock_session = self.mock_eng.session_mgr.return_value.__enter__.return_value
+        self.mock_session.query.return_value.all.return_value = [
+            (1, ResponseType.GENERAL, ResponseCategory.SARCASTIC, 1, 'oh sure'),
+            (2, ResponseType.GENERAL, ResponseCategory.SARCASTIC, 1, 'yeah right'),
+            (3, ResponseType.FACT, ResponseCategory.STANDARD, 1, 'sheep are fluffy'),
+            (4, ResponseType.INSULT, ResponseCategory.STANDARD, 2, 'goat'),
+            (5, ResponseType.INSULT, ResponseCategory.STANDARD, 1, 'stinky'),
+            (6, ResponseType.INSULT, ResponseCategory.STANDARD, 2, 'sheep'),
+            (7, ResponseType.INSULT, ResponseCategory.STANDARD, 1, 'woolly'),
+            (8, ResponseType.INSULT, ResponseCategory.STANDARD, 1, 'soggy'),
+        ]
+        self.index = ResponseIndex(eng=self.mock_eng)
+
+    def test_choice(self):
+        for _ in range(10):
+            self.assertIn(self.index.choice(ResponseType.GENERAL, ResponseCategory.SARCASTIC),
+                          [(1, 'oh sure'), (2, 'yeah right')])
+        self.assertEqual((3, 'sheep are fluffy'), self.index.choice(ResponseType.FACT, ResponseCategory.STANDARD))
+        self.assertIsNone(self.index.choice(ResponseType.FACT, ResponseCategory.FOILHAT))
+        # Loaded once, lazily
+        self.assertEqual(1, self.mock_session.query.call_count)
+        self.assertEqual(8, self.index.get_stats()['size'])
+
+    def test_sample_staged(self):
+        word_lists = self.index.sample_staged(ResponseType.INSULT, ResponseCategory.STANDARD, n=3)
+        self.assertEqual(3, len(word_lists))
+        # Stage 2 only has 2 words, so the last list runs out
+        self.assertEqual([2, 2, 1], [len(x) for x in word_lists])
+        self.assertEqual({'stinky', 'woolly', 'soggy'}, {x[0] for x in word_lists})
+        self.assertEqual({'goat', 'sheep'}, {x[1] for x in word_lists[:2]})
+        self.assertListEqual([], self.index.sample_staged(ResponseType.PHRASE, ResponseCategory.WORK, n=3))
+
+    def test_add_and_invalidate(self):
+        self.index.choice(ResponseType.FACT, ResponseCategory.FOILHAT)
+        fact = TableResponse(response_type=ResponseType.FACT, category=ResponseCategory.FOILHAT, text='birds')
+        fact.response_id = 4
+        self.index.add(fact)
+        self.assertEqual((4, 'birds'), self.index.choice(ResponseType.FACT, ResponseCategory.FOILHAT))
+        self.index.invalidate()
+        self.assertIsNone(self.index.choice(ResponseType.FACT, ResponseCategory.FOILHAT))
+        self.assertEqual(2, self.index.get_stats()['loads'])
+
+    def test_ttl(self):
+        index = ResponseIndex(eng=self.mock_eng, ttl_secs=0)
+        for _ in range(2):
+            index.choice(ResponseType.GENERAL, ResponseCategory.SARCASTIC)
+        # Reloaded once it's expired, even without being invalidated
+        self.assertEqual(2, index.get_stats()['loads'])
+
+
+if __name__ == '__main__':
+    main()
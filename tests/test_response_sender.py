@@ -0,0 +1,42 @@
+from unittest import (
+    TestCase,
+    main,
+)
+from unittest.mock import MagicMock
+
+import requests
+
+from tests.common import get_test_logger
+from viktor.core.response_sender import ResponseUrlSender
+
+
+class TestResponseUrlSender(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.log = get_test_logger()
+
+    def setUp(self) -> None:
+        self.sender = ResponseUrlSender(parent_log=self.log, n_workers=1)
+        self.sender.session.post = MagicMock(name='post')
+
+    def test_send(self):
+        self.sender.start()
+        self.sender.send('https://hooks.slack.com/actions/abc', {'text': 'boop'})
+        self.sender.shutdown()
+        self.sender.session.post.assert_called_once()
+        _, kwargs = self.sender.session.post.call_args
+        self.assertEqual({'text': 'boop'}, kwargs['json'])
+        self.assertEqual(self.sender.timeout_secs, kwargs['timeout'])
+        self.assertEqual(1, self.sender.get_stats()['sent'])
+
+    def test_send_failure(self):
+        self.sender.session.post.side_effect = requests.ConnectionError('nope')
+        self.sender.send('https://hooks.slack.com/actions/abc', {'text': 'boop'})
+        stats = self.sender.get_stats()
+        self.assertEqual(0, stats['sent'])
+        self.assertEqual(1, stats['failed'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+from datetime import datetime
+from unittest import (
+    TestCase,
+    main,
+)
+
+from sqlalchemy.orm import sessionmaker
+
+from tests.common import get_test_logger
+from viktor.core.user_changes import (
+    diff_user_profiles,
+    get_profile_at,
+)
+from viktor.local_db import make_local_engine
+from viktor.model import (
+    TableSlackUser,
+    TableSlackUserChangeLog,
+)
+
+
+class TestUserChanges(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.log = get_test_logger()
+
+    def setUp(self) -> None:
+        self.engine = make_local_engine()
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.add_all([
+            TableSlackUser(slack_user_hash='UONE', real_name='one', display_name='One'),
+            TableSlackUser(slack_user_hash='UTWO', real_name='two', display_name='Two'),
+        ])
+        self.session.commit()
+
+    def tearDown(self) -> None:
+        self.session.close()
+        self.engine.dispose()
+
+    def n_changelogs(self) -> int:
+        return self.session.query(TableSlackUserChangeLog).count()
+
+    def test_diff_user_profiles(self):
+        # First pass just records everyone
+        self.assertListEqual([], diff_user_profiles(self.session, log=self.log))
+        self.assertEqual(2, self.n_changelogs())
+        self.assertListEqual([], diff_user_profiles(self.session, log=self.log))
+        self.assertEqual(2, self.n_changelogs())
+
+        user = self.session.query(TableSlackUser).filter(TableSlackUser.slack_user_hash == 'UTWO').one()
+        user.status_emoji = ':sheep:'
+        user.display_name = 'Deux'
+        self.session.flush()
+        self.assertListEqual([{
+            'user_hashname': 'Deux|UTWO',
+            'display_name': {'old': 'Two', 'new': 'Deux'},
+            'status_emoji': {'old': None, 'new': ':sheep:'},
+        }], diff_user_profiles(self.session, log=self.log))
+        self.assertEqual(3, self.n_changelogs())
+        # Now compared against the newest entry
+        self.assertListEqual([], diff_user_profiles(self.session, log=self.log))
+
+    def test_sparse_changelog(self):
+        diff_user_profiles(self.session, log=self.log, snapshot_every=2)
+        user = self.session.query(TableSlackUser).filter(TableSlackUser.slack_user_hash == 'UTWO').one()
+        user.status_emoji = ':sheep:'
+        self.session.flush()
+        self.assertEqual(1, len(diff_user_profiles(self.session, log=self.log, snapshot_every=2)))
+        entry = self.session.query(TableSlackUserChangeLog).order_by(TableSlackUserChangeLog.user_change_id.desc())\
+            .first()
+        self.assertFalse(entry.is_full_snapshot)
+        self.assertEqual('status_emoji', entry.changed_attrs)
+        self.assertIsNone(entry.display_name)
+        self.assertIn('changed=status_emoji', repr(entry))
+        # The sparse entry is applied on top of the snapshot
+        profile = get_profile_at(self.session, user_id=user.user_id)
+        self.assertEqual(('Two', ':sheep:'), (profile['display_name'], profile['status_emoji']))
+        self.assertListEqual([], diff_user_profiles(self.session, log=self.log, snapshot_every=2))
+
+        user.status_emoji = None
+        self.session.flush()
+        self.assertListEqual([{
+            'user_hashname': 'Two|UTWO',
+            'status_emoji': {'old': ':sheep:', 'new': None},
+        }], diff_user_profiles(self.session, log=self.log, snapshot_every=2))
+        # Second entry since the snapshot, so it's a full one this time
+        entry = self.session.query(TableSlackUserChangeLog).order_by(TableSlackUserChangeLog.user_change_id.desc())\
+            .first()
+        self.assertTrue(entry.is_full_snapshot)
+        self.assertEqual('Two', entry.display_name)
+        self.assertIsNone(get_profile_at(self.session, user_id=user.user_id)['status_emoji'])
+        self.assertIsNone(get_profile_at(self.session, user_id=user.user_id, as_of=datetime(2000, 1, 1)))
+
+
+if __name__ == '__main__':
+    main()
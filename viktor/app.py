@@ -1,14 +1,18 @@
 from datetime import datetime
 import json
 import signal
-from typing import Union
+from typing import (
+    Callable,
+    Dict,
+    Union,
+)
 
 from flask import (
     Flask,
+    jsonify,
     make_response,
     request,
 )
-import requests
 from slackeventsapi import SlackEventAdapter
 from slacktools.api.events.emoji_changed import (
     EmojiAdded,
@@ -25,17 +29,28 @@ from slacktools.api.events.types import (
 )
 from slacktools.api.slash.slash import SlashCommandEventType
 from slacktools.secretstore import SecretStore
-from sqlalchemy.sql import (
-    and_,
-    func,
-    not_,
-)
+from sqlalchemy.sql import and_
 
 from viktor.bot_base import Viktor
-from viktor.core.pin_collector import collect_pins
+from viktor.core.event_queue import EventQueue
+from viktor.core.idempotency import EventIdempotencyStore
+from viktor.core.metrics import (
+    instrument_flask_app,
+    register_stats,
+)
+from viktor.core.pin_collector import (
+    collect_pins,
+    insert_quotes,
+)
+from viktor.core.response_sender import ResponseUrlSender
 from viktor.core.user_changes import extract_user_change
 from viktor.crons import cron
 from viktor.db_eng import ViktorPSQLClient
+from viktor.local_db import (
+    MEMORY,
+    make_local_engine,
+    seed_local_db,
+)
 from viktor.logg import get_base_logger
 from viktor.model import (
     TableEmoji,
@@ -48,31 +63,117 @@ logg = get_base_logger()
 
 credstore = SecretStore('secretprops-davaiops.kdbx')
 # Set up database connection
-conn_dict = credstore.get_entry(f'davaidb-{auto_config.ENV.lower()}').custom_properties
+local_engine = None
+if auto_config.LOCAL_DB_PATH is None:
+    conn_dict = credstore.get_entry(f'davaidb-{auto_config.ENV.lower()}').custom_properties
+else:
+    logg.warning(f'Using the local SQLite db at {auto_config.LOCAL_DB_PATH} instead of Postgres')
+    conn_dict = {}
+    local_engine = make_local_engine(auto_config.LOCAL_DB_PATH)
+    if auto_config.LOCAL_DB_PATH == MEMORY:
+        seed_local_db(local_engine)
 vik_creds = credstore.get_key_and_make_ns(bot_name)
 
 logg.debug('Starting up app...')
 app = Flask(__name__)
 app.register_blueprint(cron, url_prefix='/cron')
+instrument_flask_app(app)
 
-eng = ViktorPSQLClient(props=conn_dict, parent_log=logg)
+eng = ViktorPSQLClient(props=conn_dict, parent_log=logg, settings_ttl=auto_config.BOT_SETTINGS_TTL_SECS,
+                       user_cache_ttl=auto_config.USER_CACHE_TTL_SECS, error_flush_secs=auto_config.ERROR_FLUSH_SECS,
+                       error_flush_events=auto_config.ERROR_FLUSH_EVENTS, error_spool_path=auto_config.ERROR_SPOOL_PATH,
+                       engine=local_engine)
+# Listens for changes made to cached data (e.g., bot settings) by other processes
+eng.changes.start()
+eng.error_sink.start()
 
 logg.debug('Instantiating bot...')
 Bot = Viktor(eng=eng, bot_cred_entry=vik_creds, parent_log=logg)
 
+logg.debug('Starting event workers...')
+event_queue = EventQueue(parent_log=logg, n_workers=auto_config.EVENT_WORKERS, max_size=auto_config.EVENT_QUEUE_SIZE)
+event_queue.start()
+response_sender = ResponseUrlSender(parent_log=logg)
+response_sender.start()
+event_ids = EventIdempotencyStore(parent_log=logg, eng=eng if auto_config.IS_EVENT_ID_DB_BACKED else None,
+                                  ttl_secs=auto_config.EVENT_ID_TTL_SECS)
+
+
+def shutdown(*args):
+    """Drains the event queue before handing off to the bot's cleanup routine"""
+    event_queue.shutdown()
+    response_sender.shutdown()
+    eng.changes.shutdown()
+    eng.error_sink.shutdown()
+    Bot.cleanup(*args)
+
+
 # Register the cleanup function as a signal handler
-signal.signal(signal.SIGINT, Bot.cleanup)
-signal.signal(signal.SIGTERM, Bot.cleanup)
+signal.signal(signal.SIGINT, shutdown)
+signal.signal(signal.SIGTERM, shutdown)
 
 # Events API listener
 bot_events = SlackEventAdapter(vik_creds.signing_secret, "/api/events", app)
 
 
+def enqueue_event(event_data: EventWrapperType, func: Callable):
+    """Validates the incoming event and hands it off to the worker pool so Slack gets its ack right away"""
+    event = event_data.get('event') if isinstance(event_data, dict) else None
+    if not isinstance(event, dict) or event.get('type') is None:
+        logg.warning(f'Received malformed event payload - skipping: {event_data}')
+        return
+    # Slack re-delivers events it thinks we didn't ack in time. Make sure we only handle each one once
+    retry_num = request.headers.get('X-Slack-Retry-Num', '0')
+    retry_num = int(retry_num) if retry_num.isnumeric() else 0
+    if not event_ids.claim(event_data.get('event_id'), event_type=event['type'], retry_num=retry_num):
+        return
+    event_queue.submit(event['type'], func, event_data)
+
+
+def collect_stats() -> Dict[str, Dict]:
+    """Collects the stats from all the in-process components"""
+    return {
+        'event_queue': event_queue.get_stats(),
+        'event_ids': event_ids.get_stats(),
+        'response_sender': response_sender.get_stats(),
+        'react_dedup': Bot.state_store['reacts'].get_stats(),
+        'reaction_counts': Bot.reaction_counter.get_stats(),
+        'emoji_pool': Bot.emoji_pool.get_stats(),
+        'response_index': Bot.response_index.get_stats(),
+        'acronym_index': Bot.acronym_index.get_stats(),
+        'quote_search': Bot.quote_search.get_stats(),
+        'channel_cache': eng.channel_cache.get_stats(),
+        'settings_cache': eng.settings_cache.get_stats(),
+        'user_cache': eng.user_cache.get_stats(),
+        'change_feed': eng.changes.get_stats(),
+        'error_sink': eng.error_sink.get_stats(),
+    }
+
+
+# Also expose these on /metrics
+register_stats(collect_stats)
+
+
+@app.route('/api/stats', methods=['GET'])
+@logg.catch
+def handle_stats():
+    """Reports the state of the in-process event pipeline"""
+    return jsonify(collect_stats())
+
+
 @app.route('/api/actions', methods=['GET', 'POST'])
 @logg.catch
 def handle_action():
     """Handle a response when a user clicks a button from a form Slack"""
     event_data = json.loads(request.form["payload"])
+    process_action(event_data)
+
+    # Send HTTP 200 response with an empty body so Slack knows we're done
+    return make_response('', 200)
+
+
+def process_action(event_data: Dict):
+    """Determines the action taken and routes it to the bot, then updates the original message"""
     user = event_data['user']['id']
     # if channel empty, it's a shortcut
     if event_data.get('channel') is None:
@@ -111,16 +212,16 @@ def handle_action():
     if response_url is not None:
         # Update original message
         if 'shortcut' not in action.get('type'):
-            _ = requests.post(event_data['response_url'], json=update_dict,
-                              headers={'Content-Type': 'application/json'})
-
-    # Send HTTP 200 response with an empty body so Slack knows we're done
-    return make_response('', 200)
+            response_sender.send(response_url, update_dict)
 
 
 @bot_events.on('reaction_added')
 @logg.catch
 def reaction(event_data: EventWrapperType):
+    enqueue_event(event_data, process_reaction)
+
+
+def process_reaction(event_data: EventWrapperType):
     event = ReactionEvent(event_data['event'])
 
     # This is the timestamp of the reaction
@@ -128,39 +229,34 @@ def reaction(event_data: EventWrapperType):
     # This is the timestamp of the message
     msg_ts = event.item.ts
     unique_event_key = f'{event.item.channel}|{event.user}|{msg_ts}|{datetime.now():%F %H}'
-    if unique_event_key in Bot.state_store['reacts']:
+    # Check and store the new react event in one go so concurrent workers don't both process it
+    if not Bot.state_store['reacts'].add_if_new(unique_event_key):
         # Event's already been processed
         logg.debug(f'Bypassing react to preexisting event key: {unique_event_key}')
-        return make_response('', 200)
-    else:
-        # Store new react event first
-        logg.debug(f'Registering react in {event.item.channel}: {unique_event_key}')
-        Bot.state_store['reacts'].add(unique_event_key)
+        return
+    logg.debug(f'Registered react in {event.item.channel}: {unique_event_key}')
 
-    channel_obj = eng.get_channel_from_hash(channel_hash=event.item.channel)
+    logg.debug('Counting react...')
+    Bot.reaction_counter.increment(event.reaction)
 
-    with eng.session_mgr() as session:
-        logg.debug('Counting react in db...')
-        session.query(TableEmoji).filter(TableEmoji.name == event.reaction).update({
-            'reaction_count': TableEmoji.reaction_count + 1
-        })
-        logg.debug('Determining if channel allows bot reactions')
-        if channel_obj is not None and not channel_obj.is_allow_bot_react:
-            logg.debug('Channel is denylisted for bot reactions. Do nothing...')
-            # Channel doesn't allow reactions
-            return make_response('', 200)
+    channel_obj = eng.get_channel_from_hash(channel_hash=event.item.channel)
+    logg.debug('Determining if channel allows bot reactions')
+    if channel_obj is not None and not channel_obj.is_allow_bot_react:
+        logg.debug('Channel is denylisted for bot reactions. Do nothing...')
+        # Channel doesn't allow reactions
+        return
     if event.user in [Bot.bot_id, Bot.user_id]:
         logg.debug('Bypassing bot react...')
         # Don't allow this infinite loop
-        return make_response('', 200)
+        return
 
+    logg.debug('Randomly selecting an emoji to react with.')
+    emoji_name = Bot.emoji_pool.choice()
+    if emoji_name is None:
+        logg.warning('Emoji pool is empty - unable to react.')
+        return
     try:
-        with eng.session_mgr() as session:
-            logg.debug('Randomly selecting an emoji to react with.')
-            emoji = session.query(TableEmoji).filter(not_(TableEmoji.is_react_denylisted)).\
-                order_by(func.random()).limit(1).one()
-            _ = Bot.st.bot.reactions_add(channel=event.item.channel, name=emoji.name, timestamp=msg_ts)
-        return make_response('', 200)
+        _ = Bot.st.bot.reactions_add(channel=event.item.channel, name=emoji_name, timestamp=msg_ts)
     except Exception:
         # Sometimes we'll get a 'too_many_reactions' error. Disregard in that case
         pass
@@ -169,7 +265,7 @@ def reaction(event_data: EventWrapperType):
 @bot_events.on('message')
 @logg.catch
 def scan_message(event_data: Union[StandardMessageEventType, ThreadedMessageEventType]):
-    Bot.process_event(event_data)
+    enqueue_event(event_data, Bot.process_event)
 
 
 @app.route('/api/slash', methods=['GET', 'POST'])
@@ -178,15 +274,23 @@ def handle_slash():
     """Handles a slash command"""
     event_data = request.form  # type: SlashCommandEventType
     # Handle the command
-    Bot.process_slash_command(event_data)
+    process_slash(event_data)
 
     # Send HTTP 200 response with an empty body so Slack knows we're done
     return make_response('', 200)
 
 
+def process_slash(event_data: SlashCommandEventType):
+    Bot.process_slash_command(event_data)
+
+
 @bot_events.on('emoji_changed')
 @logg.catch
 def record_new_emojis(event_data: EventWrapperType):
+    enqueue_event(event_data, process_emoji_change)
+
+
+def process_emoji_change(event_data: EventWrapperType):
     event = decide_emoji_event_class(event_dict=event_data['event'])
     # Make a post about a new emoji being added in the #emoji_suggestions channel
     logg.debug(f'Emoji change detected: {event.subtype}')
@@ -196,37 +300,41 @@ def record_new_emojis(event_data: EventWrapperType):
             logg.debug('Attempting to add new emoji')
             with eng.session_mgr() as session:
                 session.add(TableEmoji(name=event.name))
+            Bot.emoji_pool.add(event.name)
         case 'rename':
             event: EmojiRenamed
             logg.debug('Attempting to rename an emoji.')
             with eng.session_mgr() as session:
                 session.query(TableEmoji).filter(TableEmoji.name == event.old_name).update({'name': event.new_name})
+            Bot.emoji_pool.rename(event.old_name, event.new_name)
         case 'remove':
             event: EmojiRemoved
             logg.debug('Attempting to remove an emoji')
             with eng.session_mgr() as session:
                 session.query(TableEmoji).filter(TableEmoji.name.in_(event.names)).update({'is_deleted': True})
+            Bot.emoji_pool.remove(event.names)
 
 
 @bot_events.on('pin_added')
 @logg.catch
 def store_pins(event_data: EventWrapperType):
+    enqueue_event(event_data, process_pin_added)
+
+
+def process_pin_added(event_data: EventWrapperType):
     pin_obj = PinEvent(event_dict=event_data['event'])
-    tbl_obj = collect_pins(pin_obj=pin_obj, psql_client=eng, log=logg, is_event=True)
-    # Add to db
     with eng.session_mgr() as session:
-        matches = session.query(TableQuote).filter(and_(
-            TableQuote.message_timestamp == tbl_obj.message_timestamp,
-            TableQuote.link == tbl_obj.link
-        )).all()
-        if len(matches) == 0:
-            logg.debug('No duplicates found for item - proceeding with pin')
-            session.add(tbl_obj)
-            msg = 'Pin successfully added, kommanderovnik o7'
-        else:
-            logg.debug(f'{len(matches)} quote item(s) with duplicate link and message timestamp found '
-                       f'- aborting pin')
-            msg = 'o7 KOMMANDEROVNIK! ...pin... was not added...  I... have failed you.'
+        tbl_obj = collect_pins(pin_obj=pin_obj, psql_client=eng, log=logg, is_event=True, session=session)
+        # Add to db, unless it's already there
+        is_new = insert_quotes(session, [tbl_obj])[0]
+    if is_new:
+        logg.debug('No duplicates found for item - pin added')
+        Bot.quote_search.invalidate()
+        eng.changes.publish(ViktorPSQLClient.QUOTES_KEY)
+        msg = 'Pin successfully added, kommanderovnik o7'
+    else:
+        logg.debug('Quote item with duplicate link and message timestamp found - pin not added')
+        msg = 'o7 KOMMANDEROVNIK! ...pin... was not added...  I... have failed you.'
 
     Bot.st.send_message(channel=pin_obj.item.message.channel, message=msg)
 
@@ -234,14 +342,19 @@ def store_pins(event_data: EventWrapperType):
 @bot_events.on('pin_removed')
 @logg.catch
 def remove_pins(event_data: EventWrapperType):
+    enqueue_event(event_data, process_pin_removed)
+
+
+def process_pin_removed(event_data: EventWrapperType):
     pin_obj = PinEvent(event_dict=event_data['event'])
-    tbl_obj = collect_pins(pin_obj=pin_obj, psql_client=eng, log=logg, is_event=True)
-    # Add to db
     with eng.session_mgr() as session:
+        tbl_obj = collect_pins(pin_obj=pin_obj, psql_client=eng, log=logg, is_event=True, session=session)
         session.query(TableQuote).filter(and_(
             TableQuote.message_timestamp == tbl_obj.message_timestamp,
             TableQuote.link == tbl_obj.link
         )).update({TableQuote.is_deleted: True})
+    Bot.quote_search.invalidate()
+    eng.changes.publish(ViktorPSQLClient.QUOTES_KEY)
 
     Bot.st.send_message(channel=pin_obj.item.message.channel,
                         message='Pin successfully removed, kommanderovnik o7')
@@ -252,6 +365,10 @@ def remove_pins(event_data: EventWrapperType):
 def notify_new_statuses(event_data: EventWrapperType):
     """Triggered when a user updates their profile info. Gets saved to global dict
     where we then report it in #general"""
+    enqueue_event(event_data, process_user_change)
+
+
+def process_user_change(event_data: EventWrapperType):
     event = event_data['event']
     user_info = event['user']
     extract_user_change(eng=eng, user_info_dict=user_info, log=logg)
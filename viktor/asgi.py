@@ -0,0 +1,123 @@
+"""
+ASGI serving mode for the bot's HTTP endpoints.
+
+The Flask app keeps doing what it does (/api/events, /api/stats, /cron/*), just bridged onto a thread pool
+by a2wsgi so that slow requests no longer tie up the server itself. Slash commands and block actions -
+the paths that trigger the slowest outbound calls (Slack API, etymonline, EKI, inspirobot, etc.) - are acked
+right away on the event loop, with the command awaited in the background on a separate executor.
+
+Run with:
+    python3 run_asgi.py
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import time
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Set,
+)
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+
+import viktor.app as mainapp
+from viktor.core.metrics import record_route
+from viktor.settings import auto_config
+
+Scope = Dict
+Receive = Callable[[], Awaitable[Dict]]
+Send = Callable[[Dict], Awaitable[None]]
+
+
+class AsyncViktor:
+    """ASGI app that serves Viktor's endpoints with the same handler semantics as the Flask app"""
+
+    def __init__(self, n_wsgi_workers: int = 10, n_handler_workers: int = 16):
+        self.log = mainapp.logg.bind(child_name=self.__class__.__name__)
+        self.wsgi = WSGIMiddleware(mainapp.app, workers=n_wsgi_workers)
+        self.executor = ThreadPoolExecutor(max_workers=n_handler_workers, thread_name_prefix='async-handler')
+        self._tasks: Set[asyncio.Task] = set()
+        # path -> (form parser, handler)
+        self.async_routes = {
+            '/api/actions': (lambda form: json.loads(form['payload']), mainapp.process_action),
+            '/api/slash': (lambda form: form, mainapp.process_slash),
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['path'] in self.async_routes and scope['method'] == 'POST':
+            await self._handle_async_route(scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive: Receive, send: Send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self._wait_for_tasks()
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, mainapp.shutdown)
+                except SystemExit:
+                    # Bot.cleanup exits the process when run as a signal handler. Here the server handles that
+                    pass
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _read_body(receive: Receive) -> bytes:
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body', False):
+                return body
+
+    async def _handle_async_route(self, scope: Scope, receive: Receive, send: Send):
+        """Acks the request and awaits the handler in the background"""
+        # These skip Flask, so they're timed here. Like the Flask routes, that's up to the response going out
+        start = time.perf_counter()
+        form = {k: v[0] for k, v in parse_qs((await self._read_body(receive)).decode('utf-8')).items()}
+        parser, handler = self.async_routes[scope['path']]
+        try:
+            event_data = parser(form)
+        except (KeyError, ValueError) as e:
+            self.log.warning(f'Unable to parse request to {scope["path"]}: {e}')
+            await self._respond(send, status=400)
+            record_route(scope['path'], method=scope['method'], status=400, start=start)
+            return
+        # Send HTTP 200 response with an empty body so Slack knows we're done
+        await self._respond(send, status=200)
+        record_route(scope['path'], method=scope['method'], status=200, start=start)
+        task = asyncio.create_task(self._run_handler(scope['path'], handler, event_data))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_handler(self, path: str, handler: Callable, event_data: Dict):
+        start = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, handler, event_data)
+        except Exception as e:
+            self.log.exception(f'Error handling request to {path}: {e}')
+        self.log.debug(f'Handled {path} in {time.perf_counter() - start:.3f}s')
+
+    async def _wait_for_tasks(self, timeout: float = 10):
+        if len(self._tasks) > 0:
+            self.log.debug(f'Waiting on {len(self._tasks)} in-flight handlers...')
+            await asyncio.wait(self._tasks, timeout=timeout)
+
+    @staticmethod
+    async def _respond(send: Send, status: int):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'text/html; charset=utf-8'), (b'content-length', b'0')]})
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+asgi_app = AsyncViktor(n_wsgi_workers=auto_config.ASGI_WSGI_WORKERS,
+                       n_handler_workers=auto_config.ASGI_HANDLER_WORKERS)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from datetime import datetime
+import json
 import os
 from pathlib import Path
 from random import (
@@ -17,6 +18,7 @@ from typing import (
     Dict,
     List,
     Optional,
+    Tuple,
     Union,
 )
 from urllib.parse import urlparse
@@ -31,17 +33,25 @@ from slacktools import SlackBotBase
 from slacktools.api.events.types import AllMessageEventTypes
 from slacktools.api.slash.slash import SlashCommandEventType
 from slacktools.tools import build_commands
-from sqlalchemy.sql import (
-    and_,
-    func,
-)
+import yaml
 
 from viktor import ROOT_PATH
+from viktor.core.dedup import ExpiringKeyStore
+from viktor.core.emoji_pool import EmojiPool
 from viktor.core.linguistics import Linguistics
+from viktor.core.metrics import (
+    instrument_command,
+    instrument_slack_client,
+)
 from viktor.core.phrases import (
     PhraseBuilders,
     recursive_uwu,
 )
+from viktor.core.quote_search import (
+    QuoteSearch,
+    parse_query,
+)
+from viktor.core.reaction_counter import ReactionCountBuffer
 from viktor.db_eng import ViktorPSQLClient
 from viktor.forms import Forms
 from viktor.model import (
@@ -76,11 +86,13 @@ class Viktor(Linguistics, PhraseBuilders, Forms):
         self.version = auto_config.VERSION
         self.update_date = auto_config.UPDATE_DATE
 
-        super().__init__(eng=eng)
+        super().__init__(eng=eng, response_ttl_secs=auto_config.RESPONSE_INDEX_TTL_SECS,
+                         acronym_ttl_secs=auto_config.ACRONYM_INDEX_TTL_SECS)
 
         # Begin loading and organizing commands after all methods are accounted for above
-        self.commands = build_commands(self, cmd_yaml_path=ROOT_PATH.parent.joinpath('commands.yaml'),
-                                       log=self.log)
+        cmd_yaml_path = ROOT_PATH.parent.joinpath('commands.yaml')
+        self._instrument_commands(cmd_yaml_path=cmd_yaml_path)
+        self.commands = build_commands(self, cmd_yaml_path=cmd_yaml_path, log=self.log)
 
         # Initate the bot, which comes with common tools for interacting with Slack's API
         self.log.debug('Spinning up SlackBotBase')
@@ -91,7 +103,7 @@ class Viktor(Linguistics, PhraseBuilders, Forms):
         self.st.update_commands(commands=self.commands)
         self.bot_id = self.st.bot_id
         self.user_id = self.st.user_id
-        self.bot = self.st.bot
+        self.bot = instrument_slack_client(self.st.bot)
 
         if self.eng.get_bot_setting(BotSettingType.IS_ANNOUNCE_STARTUP):
             self.log.debug('IS_ANNOUNCE_STARTUP was enabled, so sending message to main channel')
@@ -99,13 +111,41 @@ class Viktor(Linguistics, PhraseBuilders, Forms):
 
         # Place to temporarily store things. Typical structure is activity -> user -> data
         self.state_store = {
-            'reacts': set(),
+            'reacts': ExpiringKeyStore(ttl_secs=auto_config.REACT_DEDUP_TTL_SECS,
+                                       max_keys=auto_config.REACT_DEDUP_MAX_KEYS),
             'new-emoji': {},
             'new-ltit-req': {}
         }
 
+        # Reaction counts are buffered and written to the db in batches
+        self.reaction_counter = ReactionCountBuffer(eng=self.eng, parent_log=self.log,
+                                                    flush_secs=auto_config.REACTION_FLUSH_SECS,
+                                                    flush_events=auto_config.REACTION_FLUSH_EVENTS)
+        self.reaction_counter.start()
+        # Emojis available for random reactions & the button game
+        self.emoji_pool = EmojiPool(eng=self.eng, parent_log=self.log,
+                                    refresh_secs=auto_config.EMOJI_POOL_REFRESH_SECS)
+        self.emoji_pool.start()
+        # Responses & the staged words for insults/compliments/phrases
+        self.response_index.load()
+        self.quote_search = QuoteSearch(eng=self.eng, page_size=auto_config.QUOTE_SEARCH_PAGE_SIZE,
+                                        ttl_secs=auto_config.QUOTE_INDEX_TTL_SECS)
+
         self.log.debug(f'{self.bot_name} booted up!')
 
+    def _instrument_commands(self, cmd_yaml_path: Path):
+        """Wraps each command callable listed in the commands yaml so its latency gets recorded"""
+        with cmd_yaml_path.open() as f:
+            cmd_groups = yaml.safe_load(f).get('commands', {})
+        instrumented = set()
+        for group in cmd_groups.values():
+            for cmd_dict in group.values():
+                name = cmd_dict.get('response_cmd', {}).get('callable')
+                if name is None or name in instrumented or not hasattr(self, name):
+                    continue
+                setattr(self, name, instrument_command(name, getattr(self, name)))
+                instrumented.add(name)
+
     def get_bootup_msg(self) -> List[Dict]:
         return [
             BKitB.make_context_block([
@@ -146,6 +186,9 @@ class Viktor(Linguistics, PhraseBuilders, Forms):
         ]
         if self.eng.get_bot_setting(BotSettingType.IS_ANNOUNCE_SHUTDOWN):
             self.st.message_main_channel(blocks=notify_block)
+        self.log.debug('Flushing buffered reaction counts...')
+        self.reaction_counter.shutdown()
+        self.emoji_pool.shutdown()
         self.log.info('Bot shutting down...')
         sys.exit(0)
 
@@ -175,17 +218,26 @@ class Viktor(Linguistics, PhraseBuilders, Forms):
                 resp = self.update_user_ltips(channel, self.approved_users[0], target_user=user, ltits=game_value)
                 if resp is not None:
                     self.st.send_message(channel, resp, thread_ts=thread_ts)
+        elif action_id == 'quote-search-more':
+            search = json.loads(action_value)
+            resp = self.build_quote_search_page(search['q'], author_key=search['u'], channel_key=search['c'],
+                                                after=tuple(search['after']))
+            if isinstance(resp, str):
+                self.st.send_message(channel=channel, message=resp, thread_ts=thread_ts)
+            else:
+                self.st.send_message(channel=channel, message='More quotes', blocks=resp, thread_ts=thread_ts)
         elif action_id == 'new-ifact':
             self.add_ifact(user=user, channel=channel, txt=action_value)
         elif action_id == 'new-role-p1':
             self.new_role_form_p2(user=user, channel=channel, new_title=action_value)
         elif action_id == 'new-role-p2':
             # Update the description part of the role. Title should already be updated in p1
-            user_obj = self.eng.get_user_from_hash(user)
+            user_obj = self.eng.get_user_from_hash(user, is_cached=False)
             if action_value != user_obj.role_desc:
                 with self.eng.session_mgr() as session:
                     session.add(user_obj)
                     user_obj.role_desc = action_value
+                self.eng.invalidate_user(user_obj)
             self.build_role_txt(channel=channel, user=user)
         elif action_id == 'levelup-user':
             self.update_user_level(channel=channel, requesting_user=user,
@@ -377,12 +429,7 @@ class Viktor(Linguistics, PhraseBuilders, Forms):
     # ====================================================
     def sarcastic_response(self) -> str:
         """Sends back a sarcastic response when user is not allowed to use the action requested"""
-        with self.eng.session_mgr() as session:
-            resp = session.query(TableResponse.text).filter(and_(
-                TableResponse.type == ResponseType.GENERAL,
-                TableResponse.category == ResponseCategory.SARCASTIC
-            )).order_by(func.random()).limit(1).one().text
-            return resp
+        return self._get_random_response(ResponseType.GENERAL, category=ResponseCategory.SARCASTIC)
 
     @staticmethod
     def giggle() -> str:
@@ -571,8 +618,7 @@ class Viktor(Linguistics, PhraseBuilders, Forms):
         n_buttons = randint(5, 12)
         items = list(range(1, n_buttons + 1))
 
-        with self.eng.session_mgr() as session:
-            emojis = [x.name for x in session.query(TableEmoji).order_by(func.random()).limit(n_buttons).all()]
+        emojis = self.emoji_pool.sample(n_buttons)
         rand_val = randint(1, n_buttons)
         # Pick two places where negative values should go
         neg_items = list(np.random.choice([x for x in items if x != rand_val], int(n_buttons * .8), False))
@@ -613,6 +659,49 @@ class Viktor(Linguistics, PhraseBuilders, Forms):
         msg = re.sub(match_pattern, '', message).strip()
         return self.st.build_phrase(msg)
 
+    def search_quotes(self, message: str, match_pattern: str) -> Union[List[Dict], str]:
+        """Searches the quotes, optionally only those by a user (-u @user) and/or from a channel (-c #channel)"""
+        query, author_hash, channel_hash = parse_query(re.sub(match_pattern, '', message).strip())
+        if query == '':
+            return 'Search for what? Try `quote search <terms> [-u @user] [-c #channel]`'
+        author_key = channel_key = None
+        if author_hash is not None:
+            author = self.eng.get_user_from_hash(author_hash)
+            if author is None:
+                return f'I don\'t know who <@{author_hash}> is :frowning:'
+            author_key = author.user_id
+        if channel_hash is not None:
+            channel = self.eng.get_channel_from_hash(channel_hash)
+            if channel is None:
+                return f'I don\'t know the channel <#{channel_hash}> :frowning:'
+            channel_key = channel.channel_id
+        return self.build_quote_search_page(query, author_key=author_key, channel_key=channel_key)
+
+    def build_quote_search_page(self, query: str, author_key: int = None, channel_key: int = None,
+                                after: Tuple[float, int] = None) -> Union[List[Dict], str]:
+        """Builds a page of quote search results, with a button for the next page if there is one"""
+        results, next_cursor = self.quote_search.search(query, author_key=author_key, channel_key=channel_key,
+                                                        after=after)
+        if len(results) == 0:
+            return f'No quotes found for `{query}` :frowning:' if after is None else 'That\'s all of them!'
+        blocks = [BKitB.make_context_block([BKitB.markdown_section(f'Quotes matching `{query}`:')])]
+        for _, quote in results:
+            # Keeps it under the section's text limit
+            text = quote.text if len(quote.text) <= 2500 else f'{quote.text[:2500]}...'
+            text = text.replace('\n', '\n>')
+            author = quote.author.display_name if quote.author is not None else 'someone'
+            where = f' in #{quote.channel.channel_name}' if quote.channel is not None else ''
+            date = f'{quote.message_timestamp:%Y-%m-%d}'
+            blocks.append(BKitB.make_section_block(BKitB.markdown_section(
+                f'>{text}\n- {author}{where}, {f"<{quote.link}|{date}>" if quote.link is not None else date}'
+            )))
+        if next_cursor is not None:
+            value = json.dumps({'q': query, 'u': author_key, 'c': channel_key, 'after': next_cursor})
+            blocks.append(BKitB.make_actions_block([
+                BKitB.make_button_element('More', value=value, action_id='quote-search-more')
+            ]))
+        return blocks
+
     def add_emoji_form_p1(self, user: str, channel: str, message: str):
         """Builds form to intake emoji and upload"""
         # If the message already contains a url, avoid sending the URL collection form and just process the
@@ -669,7 +758,8 @@ class Viktor(Linguistics, PhraseBuilders, Forms):
         fact = TableResponse(response_type=ResponseType.FACT, category=ResponseCategory.FOILHAT, text=txt)
         with self.eng.session_mgr() as session:
             session.add(fact)
-        self.st.send_message(channel=channel, message=f'Fact added! id:`{fact.id}`\n{fact.text}')
+        self.response_index.add(fact)
+        self.st.send_message(channel=channel, message=f'Fact added! id:`{fact.response_id}`\n{fact.text}')
 
     def get_fart(self, user: str, channel: str):
         fart_id = randint(1, 3000)
@@ -781,11 +871,12 @@ class Viktor(Linguistics, PhraseBuilders, Forms):
     def new_role_form_p2(self, user: str, channel: str, new_title: str):
         """Part 2 of new role intake"""
         # Load user
-        user_obj = self.eng.get_user_from_hash(user)
+        user_obj = self.eng.get_user_from_hash(user, is_cached=False)
         if new_title != user_obj.role_title:
             with self.eng.session_mgr() as session:
                 session.add(user_obj)
                 user_obj.role_title = new_title
+            self.eng.invalidate_user(user_obj)
         form2 = self.build_role_input_form_p2(title=new_title, existing_desc=user_obj.role_desc)
         _ = self.st.private_channel_message(user_id=user, channel=channel, message='New role form, p2',
                                             blocks=form2)
@@ -800,12 +891,13 @@ class Viktor(Linguistics, PhraseBuilders, Forms):
             # Some people should stay permanently at lvl 1
             return 'Hmm... that\'s weird. It says you can\'t be leveled up??'
 
-        user_obj = self.eng.get_user_from_hash(target_user)
+        user_obj = self.eng.get_user_from_hash(target_user, is_cached=False)
         if user_obj is None:
             return f'user <@{target_user}> not found in HR records... :nervous_peach:'
         with self.eng.session_mgr() as session:
             session.add(user_obj)
             user_obj.level += 1
+        self.eng.invalidate_user(user_obj)
         self.st.send_message(channel, f'Level for *`{user_obj.name}`* updated to *`{user_obj.level}`*.')
 
     def update_user_ltips(self, channel: str, requesting_user: str, target_user: str, ltits: float) -> \
@@ -815,12 +907,13 @@ class Viktor(Linguistics, PhraseBuilders, Forms):
         if requesting_user not in self.approved_users:
             return 'LOL sorry, LTIT distributions are SLT-approved only'
 
-        user_obj = self.eng.get_user_from_hash(target_user)
+        user_obj = self.eng.get_user_from_hash(target_user, is_cached=False)
         if user_obj is None:
             return f'user <@{target_user}> not found in HR records... :nervous_peach:'
         with self.eng.session_mgr() as session:
             session.add(user_obj)
             user_obj.ltits += ltits
+        self.eng.invalidate_user(user_obj)
         self.st.send_message(
             channel, f'LTITs for  *`{user_obj.name}`* updated by *`{ltits}`* to *`{user_obj.ltits}`*.')
 
@@ -0,0 +1,85 @@
+import random
+import threading
+import time
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from viktor.db_eng import ViktorPSQLClient
+from viktor.model import (
+    AcronymType,
+    TableAcronym,
+)
+
+
+class AcronymIndex:
+    """In-memory index of the acronym words, by acronym type and then by first letter.
+
+    Built once on first use, so guesses cost the same no matter how big the acronym table gets.
+    Dropped whenever the acronyms are reloaded (e.g., by the ETL), to be built again on the next guess.
+    In case that news never arrives, it's also rebuilt once it's older than `ttl_secs`.
+    """
+
+    def __init__(self, eng: ViktorPSQLClient, ttl_secs: float = 30 * 60):
+        self.eng = eng
+        self.ttl_secs = ttl_secs
+        self._expires_at = 0.
+        # type -> first letter -> words
+        self._index: Optional[Dict[AcronymType, Dict[str, Tuple[str, ...]]]] = None
+        self._lock = threading.Lock()
+        self.n_loads = 0
+        self.n_guesses = 0
+        eng.changes.subscribe(ViktorPSQLClient.ACRONYMS_KEY, self.invalidate)
+
+    def _get_index(self) -> Dict[AcronymType, Dict[str, Tuple[str, ...]]]:
+        index = self._index
+        if index is not None and time.monotonic() < self._expires_at:
+            return index
+        with self._lock:
+            if self._index is None or time.monotonic() >= self._expires_at:
+                self._index = self._build()
+                self._expires_at = time.monotonic() + self.ttl_secs
+                self.n_loads += 1
+            return self._index
+
+    def _build(self) -> Dict[AcronymType, Dict[str, Tuple[str, ...]]]:
+        with self.eng.session_mgr() as session:
+            rows = session.query(TableAcronym.type, TableAcronym.text).all()
+        words = {}
+        for acronym_type, text in rows:
+            word = text.replace('\n', '').lower()
+            if len(word) > 1:
+                words.setdefault(acronym_type, {}).setdefault(word[0], []).append(word)
+        return {k: {letter: tuple(x) for letter, x in v.items()} for k, v in words.items()}
+
+    def guess(self, acronym_type: AcronymType, acronym: str, n: int) -> Optional[List[str]]:
+        """Makes n guesses at what the acronym stands for. None if there are no words for the acronym type
+
+        Letters without any words, as well as anything that isn't a letter, are kept as-is
+        """
+        by_letter = self._get_index().get(acronym_type)
+        if by_letter is None:
+            return None
+        self.n_guesses += 1
+        # Draw all the guesses for each letter at once
+        columns = []
+        for letter in acronym.lower():
+            words = by_letter.get(letter) if letter.isalpha() else None
+            columns.append(random.choices(words, k=n) if words else [letter] * n)
+        return [' '.join(x) for x in zip(*columns)] if len(columns) > 0 else [''] * n
+
+    def invalidate(self):
+        """Drops the index, so it's built fresh on the next guess"""
+        with self._lock:
+            self._index = None
+
+    def get_stats(self) -> Dict[str, int]:
+        index = self._index or {}
+        return {
+            'size': sum(len(x) for by_letter in index.values() for x in by_letter.values()),
+            'loads': self.n_loads,
+            'guesses': self.n_guesses,
+        }
@@ -0,0 +1,133 @@
+from collections import defaultdict
+import select
+import threading
+from typing import (
+    Callable,
+    Dict,
+    List,
+)
+from uuid import uuid4
+
+from loguru import logger
+from sqlalchemy import func
+from sqlalchemy import select as sql_select
+
+
+class ChangeFeed:
+    """Lets the in-process caches know when the db-backed data they hold was changed by another process.
+
+    Changes are published by topic (e.g., 'bot_settings') over Postgres NOTIFY, and a listener thread LISTENs
+    for changes published by other processes (the ETL, other app instances), calling the topic's subscribers.
+    The publishing process is expected to have updated its own caches already. Without Postgres, the caches'
+    own TTLs pick up the change.
+    """
+    CHANNEL = 'viktor_changes'
+
+    def __init__(self, eng, parent_log: logger, reconnect_secs: float = 5):
+        self.eng = eng
+        self.log = parent_log.bind(child_name=self.__class__.__name__)
+        self.reconnect_secs = reconnect_secs
+        # Tags our own notifications so the listener can skip them
+        self.source_id = uuid4().hex[:8]
+        self._subscribers: Dict[str, List[Callable[[], None]]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.n_published = 0
+        self.n_received = 0
+
+    @property
+    def is_notify_supported(self) -> bool:
+        engine = getattr(self.eng, 'engine', None)
+        return engine is not None and engine.dialect.name == 'postgresql' and engine.dialect.driver == 'psycopg2'
+
+    def subscribe(self, topic: str, callback: Callable[[], None]):
+        with self._lock:
+            self._subscribers[topic].append(callback)
+
+    def publish(self, topic: str):
+        """Announces to other processes that the data behind a topic has changed"""
+        if not self.is_notify_supported:
+            return
+        try:
+            with self.eng.engine.begin() as conn:
+                conn.execute(sql_select(func.pg_notify(self.CHANNEL, f'{self.source_id}:{topic}')))
+            with self._lock:
+                self.n_published += 1
+        except Exception as e:
+            self.log.error(f'Unable to notify other processes of change to {topic}: {e}')
+
+    def _dispatch(self, topic: str):
+        with self._lock:
+            callbacks = list(self._subscribers.get(topic, []))
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                self.log.exception(f'Subscriber to {topic} failed: {e}')
+
+    def _dispatch_all(self):
+        with self._lock:
+            topics = list(self._subscribers.keys())
+        for topic in topics:
+            self._dispatch(topic)
+
+    def start(self):
+        if self._thread is not None or not self.is_notify_supported:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        conn = None
+        while not self._stop_event.is_set():
+            try:
+                if conn is None:
+                    conn = self._listen()
+                    # Anything could have changed while we weren't listening
+                    self._dispatch_all()
+                dbapi_conn = conn.connection
+                if select.select([dbapi_conn], [], [], self.reconnect_secs) == ([], [], []):
+                    continue
+                dbapi_conn.poll()
+                while dbapi_conn.notifies:
+                    source_id, topic = dbapi_conn.notifies.pop(0).payload.split(':', 1)
+                    if source_id == self.source_id:
+                        continue
+                    with self._lock:
+                        self.n_received += 1
+                    self.log.debug(f'Received change to {topic}')
+                    self._dispatch(topic)
+            except Exception as e:
+                self.log.error(f'Lost connection for change notifications - reconnecting: {e}')
+                if conn is not None:
+                    conn.invalidate()
+                    conn = None
+                self._stop_event.wait(self.reconnect_secs)
+        if conn is not None:
+            conn.close()
+
+    def _listen(self):
+        # This connection sits idle waiting on notifications, so keep it out of the pool
+        conn = self.eng.engine.raw_connection()
+        conn.detach()
+        conn.connection.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute(f'LISTEN {self.CHANNEL}')
+        cursor.close()
+        return conn
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'published': self.n_published,
+                'received': self.n_received,
+                'is_listening': self._thread is not None and self._thread.is_alive(),
+            }
+
+    def shutdown(self, timeout: float = 10):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import (
+    Dict,
+    Hashable,
+)
+
+
+class ExpiringKeyStore:
+    """A bounded set of keys that each expire after a fixed TTL.
+
+    Keys are kept in insertion order, so with a single TTL the oldest key is always the next to expire;
+    that lets both expiry and capacity eviction happen from the front in amortized O(1), while
+    membership checks stay O(1) dict lookups.
+    """
+
+    def __init__(self, ttl_secs: float = 7200, max_keys: int = 50000):
+        self.ttl_secs = ttl_secs
+        self.max_keys = max_keys
+        self._keys: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.n_expired = 0
+        self.n_evicted = 0
+
+    def _prune(self, now: float):
+        """Drops expired keys, then the oldest keys if we're still over capacity"""
+        while len(self._keys) > 0:
+            key, expires_at = next(iter(self._keys.items()))
+            if expires_at > now:
+                break
+            self._keys.popitem(last=False)
+            self.n_expired += 1
+        while len(self._keys) > self.max_keys:
+            self._keys.popitem(last=False)
+            self.n_evicted += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            expires_at = self._keys.get(key)
+            return expires_at is not None and expires_at > time.monotonic()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._keys)
+
+    def add(self, key: Hashable):
+        """Adds a key if it isn't already present"""
+        self.add_if_new(key)
+
+    def add_if_new(self, key: Hashable) -> bool:
+        """Atomically checks for and adds a key.
+
+        Returns:
+            True if the key was new (i.e., the caller should process it), False if it was already present
+        """
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._keys.get(key)
+            is_new = expires_at is None or expires_at <= now
+            if is_new:
+                # Re-add at the back so insertion order keeps matching expiry order
+                self._keys.pop(key, None)
+                self._keys[key] = now + self.ttl_secs
+            self._prune(now)
+            return is_new
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._prune(time.monotonic())
+            return {
+                'size': len(self._keys),
+                'max_keys': self.max_keys,
+                'expired': self.n_expired,
+                'evicted': self.n_evicted,
+            }
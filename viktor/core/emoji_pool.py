@@ -0,0 +1,160 @@
+import random
+import threading
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+from loguru import logger
+from sqlalchemy.sql import not_
+
+from viktor.db_eng import ViktorPSQLClient
+from viktor.model import TableEmoji
+
+
+class EmojiPool:
+    """Process-local catalog of the emojis the bot is allowed to react with.
+
+    Names are held in a list with a name -> position lookup alongside it, so random picks, additions
+    and (swap-)removals are all O(1). The pool is kept current by the emoji_changed event handler
+    and periodically reconciled against the emoji table. Changes made while the table is being read are
+    replayed on top of what was read, so the reconcile doesn't undo them.
+    """
+
+    def __init__(self, eng: ViktorPSQLClient, parent_log: logger, refresh_secs: float = 3600):
+        self.eng = eng
+        self.log = parent_log.bind(child_name=self.__class__.__name__)
+        self.refresh_secs = refresh_secs
+        self._names: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Held for the whole of a refresh, so only one at a time is collecting changes
+        self._refresh_lock = threading.Lock()
+        # The changes made since the current refresh started reading the db. None when there's no refresh
+        self._pending: Optional[List[Tuple[Callable, Tuple]]] = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.n_refreshes = 0
+
+    def start(self):
+        """Loads the pool and starts the periodic reconciliation thread"""
+        self.refresh()
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='emoji-pool-refresher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_secs):
+            try:
+                self.refresh()
+            except Exception as e:
+                self.log.error(f'Failed to reconcile emoji pool with db: {e}')
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def refresh(self):
+        """Reconciles the pool with the non-denylisted, non-deleted emojis in the db"""
+        with self._refresh_lock:
+            with self._lock:
+                self._pending = []
+            try:
+                with self.eng.session_mgr() as session:
+                    names = [x.name for x in session.query(TableEmoji.name).filter(
+                        not_(TableEmoji.is_react_denylisted),
+                        not_(TableEmoji.is_deleted)
+                    ).all()]
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            # Deduplicate while keeping order
+            names = list(dict.fromkeys(names))
+            with self._lock:
+                pending, self._pending = self._pending, None
+                self._names = names
+                self._positions = {name: i for i, name in enumerate(names)}
+                # The read may or may not have seen these, so they're all safe to apply again
+                for change, args in pending:
+                    change(*args)
+                self.n_refreshes += 1
+        self.log.debug(f'Emoji pool loaded with {len(names)} emojis ({len(pending)} changes during the load).')
+
+    def _record(self, change: Callable, *args):
+        """Applies a change, noting it down for the refresh in progress, if any. Expects the lock to be held"""
+        if self._pending is not None:
+            self._pending.append((change, args))
+        change(*args)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._positions
+
+    def add(self, name: str):
+        with self._lock:
+            self._record(self._add, name)
+
+    def _add(self, name: str):
+        if name not in self._positions:
+            self._positions[name] = len(self._names)
+            self._names.append(name)
+
+    def _remove(self, name: str):
+        """Swaps the name with the last item and pops it. Expects the lock to be held"""
+        pos = self._positions.pop(name, None)
+        if pos is None:
+            return
+        last = self._names.pop()
+        if pos < len(self._names):
+            self._names[pos] = last
+            self._positions[last] = pos
+
+    def remove(self, names: Iterable[str]):
+        with self._lock:
+            for name in names:
+                self._record(self._remove, name)
+
+    def rename(self, old_name: str, new_name: str):
+        with self._lock:
+            self._record(self._rename, old_name, new_name)
+
+    def _rename(self, old_name: str, new_name: str):
+        pos = self._positions.pop(old_name, None)
+        if pos is None:
+            return
+        if new_name in self._positions:
+            # New name's already in the pool - just drop the old one
+            self._positions[old_name] = pos
+            self._remove(old_name)
+            return
+        self._names[pos] = new_name
+        self._positions[new_name] = pos
+
+    def choice(self) -> Optional[str]:
+        """Returns a random emoji name, or None if the pool is empty"""
+        with self._lock:
+            if len(self._names) == 0:
+                return None
+            return self._names[random.randrange(len(self._names))]
+
+    def sample(self, n: int) -> List[str]:
+        """Returns up to n distinct random emoji names"""
+        with self._lock:
+            return random.sample(self._names, min(n, len(self._names)))
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._names),
+            'refreshes': self.n_refreshes,
+        }
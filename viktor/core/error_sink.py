@@ -0,0 +1,165 @@
+from hashlib import sha1
+import json
+from pathlib import Path
+import tempfile
+import threading
+import traceback
+from typing import (
+    Dict,
+    List,
+    Union,
+)
+
+from loguru import logger
+from sqlalchemy import insert
+
+from viktor.model import (
+    ErrorType,
+    TableError,
+)
+
+
+class ErrorSink:
+    """Non-blocking sink for the error table.
+
+    Errors are buffered in memory and written in one bulk insert every `flush_secs` seconds or once `flush_events`
+    distinct errors have piled up, so recording one never waits on the db - which may well be the thing failing.
+    Repeats of an error (same type, class, message & place in the code) are folded into a single row with a count.
+    If the db can't be reached, the rows are appended to a spool file on disk and replayed with the next
+    flush that gets through. Until `start` is called, errors are written as they're recorded.
+    """
+    MAX_TEXT_LEN = 255
+
+    def __init__(self, eng, parent_log: logger, flush_secs: float = 10, flush_events: int = 50,
+                 max_pending: int = 1000, spool_path: Union[str, Path] = None):
+        self.eng = eng
+        self.log = parent_log.bind(child_name=self.__class__.__name__)
+        self.flush_secs = flush_secs
+        self.flush_events = flush_events
+        self.max_pending = max_pending
+        if spool_path is None:
+            spool_path = Path(tempfile.gettempdir()).joinpath('viktor-error-spool.jsonl')
+        self.spool_path = Path(spool_path)
+        # fingerprint -> row
+        self._pending: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.n_recorded = 0
+        self.n_dropped = 0
+        self.n_flushes = 0
+        self.n_rows_flushed = 0
+        self.n_rows_spooled = 0
+
+    def start(self):
+        """Starts the periodic flush thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='error-sink-flusher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_secs):
+            self.flush()
+
+    @staticmethod
+    def fingerprint(e: Exception, error_type: ErrorType) -> str:
+        """Identifies repeats of an error by its type, class, message and where in the code it was raised"""
+        frames = [f'{x.filename}:{x.lineno}' for x in traceback.extract_tb(e.__traceback__)]
+        parts = [error_type.name, e.__class__.__name__, str(e)[:ErrorSink.MAX_TEXT_LEN]] + frames
+        return sha1('|'.join(parts).encode()).hexdigest()
+
+    def record(self, e: Exception, error_type: ErrorType, user_key: int = None, channel_key: int = None):
+        """Buffers the error, counting it against an earlier one if it's a repeat"""
+        fingerprint = self.fingerprint(e, error_type)
+        with self._lock:
+            self.n_recorded += 1
+            row = self._pending.get(fingerprint)
+            if row is not None:
+                row['occurrence_count'] += 1
+                return
+            if len(self._pending) >= self.max_pending:
+                self.n_dropped += 1
+                return
+            self._pending[fingerprint] = {
+                'error_type': error_type.name,
+                'error_class': e.__class__.__name__[:150],
+                'error_text': str(e)[:self.MAX_TEXT_LEN],
+                'error_traceback': ''.join(traceback.format_exception(type(e), e, e.__traceback__)),
+                'user_key': user_key,
+                'channel_key': channel_key,
+                'fingerprint': fingerprint,
+                'occurrence_count': 1,
+            }
+            # Without the flush thread (e.g., in scripts), nothing else would write it out
+            is_flush = len(self._pending) >= self.flush_events or self._thread is None
+        if is_flush:
+            self.flush()
+
+    def _read_spool(self) -> List[Dict]:
+        if not self.spool_path.exists():
+            return []
+        try:
+            with self.spool_path.open() as f:
+                return [json.loads(x) for x in f if x.strip() != '']
+        except (OSError, ValueError) as e:
+            self.log.error(f'Unable to read the error spool at {self.spool_path}: {e}')
+            return []
+
+    def _spool(self, rows: List[Dict]):
+        try:
+            with self.spool_path.open('a') as f:
+                f.writelines(f'{json.dumps(x)}\n' for x in rows)
+            self.n_rows_spooled += len(rows)
+        except OSError as e:
+            self.log.error(f'Unable to spool {len(rows)} errors to {self.spool_path} - they\'re lost: {e}')
+
+    def flush(self) -> int:
+        """Writes the buffered errors, along with any spooled to disk earlier, in one bulk insert
+
+        Returns:
+            the number of rows written to the db
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self._pending.values())
+                self._pending.clear()
+            spooled = self._read_spool()
+            if len(rows) + len(spooled) == 0:
+                return 0
+            try:
+                with self.eng.session_mgr() as session:
+                    session.execute(insert(TableError), [
+                        dict(x, error_type=ErrorType[x['error_type']]) for x in spooled + rows
+                    ])
+            except Exception as e:
+                self.log.error(f'Failed to write {len(rows)} errors to the db - spooling them to disk: {e}')
+                self._spool(rows)
+                return 0
+            if len(spooled) > 0:
+                self.log.info(f'Replayed {len(spooled)} spooled errors.')
+                self.spool_path.unlink(missing_ok=True)
+            self.n_flushes += 1
+            self.n_rows_flushed += len(rows) + len(spooled)
+            return len(rows) + len(spooled)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'recorded': self.n_recorded,
+                'dropped': self.n_dropped,
+                'flushes': self.n_flushes,
+                'rows_flushed': self.n_rows_flushed,
+                'rows_spooled': self.n_rows_spooled,
+            }
+
+    def shutdown(self):
+        """Stops the flush thread and writes out whatever's left (to disk, if the db is unavailable)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
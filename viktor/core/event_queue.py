@@ -0,0 +1,154 @@
+from queue import (
+    Empty,
+    Full,
+    Queue,
+)
+import threading
+import time
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Optional,
+)
+
+from loguru import logger
+
+
+class EventQueue:
+    """In-process work queue for Slack events.
+
+    The Events API handlers only validate and enqueue the incoming payload so Slack gets its ack within
+    the 3-second window; a pool of worker threads then runs the actual processing (db writes, outbound
+    Slack calls) in the background.
+    """
+
+    def __init__(self, parent_log: logger, n_workers: int = 4, max_size: int = 1000):
+        self.log = parent_log.bind(child_name=self.__class__.__name__)
+        self.n_workers = n_workers
+        self._queue = Queue(maxsize=max_size)
+        self._workers: List[threading.Thread] = []
+        self._is_running = False
+        self._stats_lock = threading.Lock()
+        self._n_enqueued = 0
+        self._n_inline = 0
+        self._wait_stats = self._new_timing()
+        self._process_stats: Dict[str, Dict[str, float]] = {}
+
+    @staticmethod
+    def _new_timing() -> Dict[str, float]:
+        return {'count': 0, 'errors': 0, 'total_secs': 0., 'max_secs': 0.}
+
+    def start(self):
+        """Spins up the worker pool. With no workers, events are processed inline as they come in"""
+        if self._is_running or self.n_workers < 1:
+            return
+        self._is_running = True
+        self.log.debug(f'Starting {self.n_workers} event workers...')
+        for i in range(self.n_workers):
+            worker = threading.Thread(target=self._work, name=f'event-worker-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, event_type: str, func: Callable, *args, **kwargs) -> bool:
+        """Places an event on the queue for the worker pool.
+
+        If the pool isn't running or the queue is full, the event is processed inline instead
+        so that it isn't lost.
+
+        Returns:
+            True if the event was queued, False if it was processed inline
+        """
+        item = (event_type, func, args, kwargs, time.perf_counter())
+        if self._is_running:
+            try:
+                self._queue.put_nowait(item)
+                with self._stats_lock:
+                    self._n_enqueued += 1
+                return True
+            except Full:
+                self.log.warning(f'Event queue is full ({self._queue.qsize()}) - '
+                                 f'processing {event_type} event inline')
+        with self._stats_lock:
+            self._n_inline += 1
+        self._run(*item)
+        return False
+
+    def _work(self):
+        """Worker loop - pulls events off the queue until shutdown"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                # Shutdown sentinel
+                self._queue.task_done()
+                break
+            try:
+                self._run(*item)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, event_type: str, func: Callable, args: tuple, kwargs: dict, enqueued_at: float):
+        """Runs a single event's processing, recording wait and processing times"""
+        start = time.perf_counter()
+        is_error = False
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            is_error = True
+            self.log.exception(f'Error processing {event_type} event: {e}')
+        end = time.perf_counter()
+        with self._stats_lock:
+            self._record(self._wait_stats, start - enqueued_at)
+            proc_stats = self._process_stats.setdefault(event_type, self._new_timing())
+            self._record(proc_stats, end - start, is_error=is_error)
+
+    @staticmethod
+    def _record(timing: Dict[str, float], secs: float, is_error: bool = False):
+        timing['count'] += 1
+        timing['total_secs'] += secs
+        timing['max_secs'] = max(timing['max_secs'], secs)
+        if is_error:
+            timing['errors'] += 1
+
+    def get_stats(self) -> Dict:
+        """Returns queue depth, wait times and per-event-type processing times"""
+        def summarise(timing: Dict[str, float]) -> Dict[str, float]:
+            count = timing['count']
+            return dict(timing, avg_secs=timing['total_secs'] / count if count > 0 else 0.)
+
+        with self._stats_lock:
+            return {
+                'workers': self.n_workers,
+                'depth': self._queue.qsize(),
+                'enqueued': self._n_enqueued,
+                'processed_inline': self._n_inline,
+                'wait': summarise(self._wait_stats),
+                'processing': {k: summarise(v) for k, v in self._process_stats.items()},
+            }
+
+    def join(self):
+        """Blocks until every event queued so far has been processed, leaving the workers running"""
+        self._queue.join()
+
+    def shutdown(self, timeout: Optional[float] = 10.):
+        """Stops accepting events and lets the workers drain what's left in the queue"""
+        if not self._is_running:
+            return
+        self._is_running = False
+        self.log.debug(f'Draining event queue ({self._queue.qsize()} remaining)...')
+        for _ in self._workers:
+            self._queue.put(None)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+        self._workers = []
+        # Anything left over at this point gets dropped - make a note of it
+        dropped = 0
+        while True:
+            try:
+                if self._queue.get_nowait() is not None:
+                    dropped += 1
+            except Empty:
+                break
+        if dropped > 0:
+            self.log.warning(f'Dropped {dropped} unprocessed events on shutdown')
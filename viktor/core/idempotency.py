@@ -0,0 +1,112 @@
+from datetime import (
+    datetime,
+    timedelta,
+)
+import threading
+import time
+from typing import (
+    Dict,
+    Optional,
+)
+
+from loguru import logger
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from viktor.core.dedup import ExpiringKeyStore
+from viktor.db_eng import ViktorPSQLClient
+from viktor.model import TableProcessedEvent
+
+
+class EventIdempotencyStore:
+    """Tracks Events API envelope event_ids so re-deliveries from Slack get short-circuited.
+
+    event_ids are always claimed in memory first (with a TTL). When a db client is provided, claims are
+    also recorded in the processed_event table via INSERT ... ON CONFLICT DO NOTHING, so that duplicates
+    are caught across restarts and multiple processes.
+    """
+
+    def __init__(self, parent_log: logger, eng: ViktorPSQLClient = None, ttl_secs: float = 3600,
+                 max_keys: int = 50000):
+        self.log = parent_log.bind(child_name=self.__class__.__name__)
+        self.eng = eng
+        self.ttl_secs = ttl_secs
+        self._seen = ExpiringKeyStore(ttl_secs=ttl_secs, max_keys=max_keys)
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+        self.n_claimed = 0
+        self.n_duplicates = 0
+        self.n_retries_seen = 0
+        self.n_retries_absorbed = 0
+
+    def claim(self, event_id: Optional[str], event_type: str = None, retry_num: int = 0) -> bool:
+        """Attempts to claim an event_id for processing.
+
+        Args:
+            event_id: the envelope event_id
+            event_type: the inner event's type (only used for the db record)
+            retry_num: the value of the X-Slack-Retry-Num header, if any
+        Returns:
+            True if this is the first time we've seen the event (i.e., go ahead and process it),
+            False if it's a duplicate
+        """
+        if event_id is None:
+            # Nothing to de-duplicate on
+            return True
+        is_new = self._seen.add_if_new(event_id)
+        if is_new and self.eng is not None:
+            is_new = self._claim_in_db(event_id, event_type=event_type, retry_num=retry_num)
+        with self._lock:
+            if retry_num > 0:
+                self.n_retries_seen += 1
+            if is_new:
+                self.n_claimed += 1
+            else:
+                self.n_duplicates += 1
+                if retry_num > 0:
+                    self.n_retries_absorbed += 1
+        if not is_new:
+            self.log.debug(f'Skipping duplicate event {event_id} (retry #{retry_num})')
+        return is_new
+
+    def _claim_in_db(self, event_id: str, event_type: str = None, retry_num: int = 0) -> bool:
+        try:
+            with self.eng.session_mgr() as session:
+                # Both have the same ON CONFLICT, it just has to be built for the right one
+                insert = pg_insert if session.get_bind().dialect.name == 'postgresql' else sqlite_insert
+                result = session.execute(
+                    insert(TableProcessedEvent).values(event_id=event_id, event_type=event_type,
+                                                       retry_num=retry_num)
+                    .on_conflict_do_nothing(index_elements=['event_id'])
+                )
+                is_new = result.rowcount > 0
+        except Exception as e:
+            # Don't drop events just because the db is having a bad time - the in-memory claim still holds
+            self.log.error(f'Unable to record event {event_id} in the db: {e}')
+            return True
+        self._maybe_prune()
+        return is_new
+
+    def _maybe_prune(self):
+        """Clears out expired event_ids from the db, at most once per TTL period"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_prune < self.ttl_secs:
+                return
+            self._last_prune = now
+        cutoff = datetime.now() - timedelta(seconds=self.ttl_secs)
+        with self.eng.session_mgr() as session:
+            n_pruned = session.query(TableProcessedEvent).filter(
+                TableProcessedEvent.created_date < cutoff).delete(synchronize_session=False)
+        self.log.debug(f'Pruned {n_pruned} expired event ids from the db.')
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'claimed': self.n_claimed,
+                'duplicates': self.n_duplicates,
+                'retries_seen': self.n_retries_seen,
+                'retries_absorbed': self.n_retries_absorbed,
+                'in_memory': len(self._seen),
+                'is_db_backed': self.eng is not None,
+            }
@@ -0,0 +1,134 @@
+"""Prometheus metrics for the bot, exposed at /metrics"""
+from contextlib import contextmanager
+from functools import wraps
+import time
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Tuple,
+)
+
+from flask import (
+    Flask,
+    Response,
+    g,
+    request,
+)
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+REGISTRY = CollectorRegistry()
+
+ROUTE_LATENCY = Histogram(
+    'viktor_http_request_seconds', 'Latency of requests to the Flask routes',
+    ['route', 'method', 'status'], registry=REGISTRY
+)
+COMMAND_LATENCY = Histogram(
+    'viktor_command_seconds', 'Latency of command callables dispatched from commands.yaml',
+    ['command', 'outcome'], registry=REGISTRY
+)
+DB_SESSION_LATENCY = Histogram(
+    'viktor_db_session_seconds', 'Time spent inside db sessions opened through session_mgr',
+    ['outcome'], registry=REGISTRY
+)
+SLACK_API_LATENCY = Histogram(
+    'viktor_slack_api_seconds', 'Latency of outbound calls to the Slack API',
+    ['api_method', 'outcome'], registry=REGISTRY
+)
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels) -> Iterator[None]:
+    """Observes the time spent in the block, labelling it with the outcome (ok/error)"""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        histogram.labels(outcome=outcome, **labels).observe(time.perf_counter() - start)
+
+
+def record_route(route: str, method: str, status: int, start: float):
+    """Records a request to a route, timed from `start` (a perf_counter reading)"""
+    ROUTE_LATENCY.labels(route=route, method=method, status=status).observe(time.perf_counter() - start)
+
+
+def instrument_command(name: str, func: Callable) -> Callable:
+    """Wraps a command callable so its latency gets recorded"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with timed(COMMAND_LATENCY, command=name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def instrument_slack_client(client):
+    """Patches a Slack WebClient instance so that every API call it makes gets timed.
+
+    All the WebClient's API methods funnel through api_call, so that's the only one we need to wrap
+    """
+    api_call = client.api_call
+
+    @wraps(api_call)
+    def wrapper(api_method: str, *args, **kwargs):
+        with timed(SLACK_API_LATENCY, api_method=api_method):
+            return api_call(api_method, *args, **kwargs)
+    client.api_call = wrapper
+    return client
+
+
+def instrument_flask_app(app: Flask):
+    """Records request counts and latency for every route, and adds the /metrics endpoint"""
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            record_route(route, method=request.method, status=response.status_code, start=start)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def handle_metrics():
+        return Response(generate_latest(REGISTRY), mimetype=CONTENT_TYPE_LATEST)
+
+
+class StatsCollector:
+    """Exposes the numeric values from a nested stats dict (e.g., what /api/stats reports) as gauges"""
+
+    def __init__(self, stats_func: Callable[[], Dict]):
+        self.stats_func = stats_func
+
+    @classmethod
+    def _flatten(cls, stats: Dict, prefix: str = '') -> List[Tuple[str, float]]:
+        items = []
+        for k, v in stats.items():
+            key = f'{prefix}{k}'
+            if isinstance(v, dict):
+                items += cls._flatten(v, prefix=f'{key}_')
+            elif isinstance(v, (int, float)):
+                items.append((key, float(v)))
+        return items
+
+    def collect(self):
+        gauge = GaugeMetricFamily('viktor_component_stat', 'Internal stats from the bot\'s in-process components',
+                                  labels=['component', 'stat'])
+        for component, stats in self.stats_func().items():
+            for stat, val in self._flatten(stats):
+                gauge.add_metric([component, stat], val)
+        yield gauge
+
+
+def register_stats(stats_func: Callable[[], Dict]):
+    REGISTRY.register(StatsCollector(stats_func))
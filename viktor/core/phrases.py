@@ -3,7 +3,6 @@ from random import (
     randint,
 )
 import re
-import string
 from typing import (
     Dict,
     List,
@@ -15,17 +14,15 @@ from typing import (
 import requests
 from slacktools import BlockKitBuilder as BKitB
 from slacktools.slack_input_parser import SlackInputParser
-from sqlalchemy.sql import (
-    and_,
-    func,
-)
+from sqlalchemy.sql import func
 
+from viktor.core.acronym_index import AcronymIndex
+from viktor.core.response_index import ResponseIndex
 from viktor.db_eng import ViktorPSQLClient
 from viktor.model import (
     AcronymType,
     ResponseCategory,
     ResponseType,
-    TableAcronym,
     TableResponse,
     TableUwu,
 )
@@ -62,8 +59,10 @@ class PhraseBuilders:
         'they': ['them', 'they', 'themselves']
     }
 
-    def __init__(self, eng: ViktorPSQLClient):
+    def __init__(self, eng: ViktorPSQLClient, response_ttl_secs: float = 30 * 60, acronym_ttl_secs: float = 30 * 60):
         self.eng = eng
+        self.response_index = ResponseIndex(eng=eng, ttl_secs=response_ttl_secs)
+        self.acronym_index = AcronymIndex(eng=eng, ttl_secs=acronym_ttl_secs)
 
     def uwu(self, msg: str) -> str:
         """uwu-fy a message"""
@@ -170,14 +169,10 @@ class PhraseBuilders:
     def _get_random_response(self, resp_type: ResponseType, category: ResponseCategory) -> str:
         """Retrieves a random response from the provided type/category combo. If no combo exists,
             will instead return a string saying that the pairing was not found"""
-        with self.eng.session_mgr() as session:
-            resp = session.query(TableResponse.text).filter(and_(
-                TableResponse.type == resp_type,
-                TableResponse.category == category
-            )).order_by(func.random()).limit(1).one_or_none()
-            if resp is None:
-                return f'Cannot find combo in table: {resp_type.name} + {category.name}'
-            return resp.text
+        resp = self.response_index.choice(resp_type, category)
+        if resp is None:
+            return f'Cannot find combo in table: {resp_type.name} + {category.name}'
+        return resp[1]
 
     def sh_response(self) -> str:
         return self._get_random_response(ResponseType.GENERAL, category=ResponseCategory.STAKEHOLDER)
@@ -202,32 +197,11 @@ class PhraseBuilders:
         # Number of guesses to make
         n_times = SlackInputParser.get_flag_from_command(message, flags=['n'], default='3')
         n_times = int(n_times) if n_times.isnumeric() else 3
-        # Select the acronym list to use, verify that we have some words in that group
-        with self.eng.session_mgr() as session:
-            words = [x.text for x in session.query(TableAcronym).filter(TableAcronym.type == acronym_group).all()]
-
-        if len(words) == 0:
+        # Build out the real acryonym meaning from the words in that group, if we have any
+        guesses = self.acronym_index.guess(acronym_group, acronym, n=n_times)
+        if guesses is None:
             return f'Unable to find an acronym group for {acronym_group_str}'
-
-        # Put the words into a dictionary, classified by first letter
-        a2z = string.ascii_lowercase
-        word_dict = {k: [] for k in a2z}
-        for word in words:
-            word = word.replace('\n', '')
-            if len(word) > 1:
-                word_dict[word[0].lower()].append(word.lower())
-
-        # Build out the real acryonym meaning
-        guesses = []
-        for guess in range(n_times):
-            meaning = []
-            for letter in list(acronym):
-                if letter.isalpha():
-                    word_list = word_dict[letter]
-                    meaning.append(word_list[randint(0, len(word_list) - 1)])
-                else:
-                    meaning.append(letter)
-            guesses.append(' '.join(list(map(str.title, meaning))))
+        guesses = [x.title() for x in guesses]
 
         guess_chunk = "\n_OR_\n".join(guesses)
         return f':robot-face: Here are my guesses for *`{acronym.upper()}`*!\n {guess_chunk}'
@@ -253,31 +227,10 @@ class PhraseBuilders:
         resp_type = getattr(ResponseType, cmd.upper(), ResponseType.COMPLIMENT)
         category = getattr(ResponseCategory, category_str.upper(), ResponseCategory.STANDARD)
 
-        with self.eng.session_mgr() as session:
-            subq = session.query(
-                TableResponse.text,
-                func.row_number().over(partition_by=TableResponse.stage, order_by=func.random()).label('row_no')
-            ).filter(and_(
-                TableResponse.type == resp_type,
-                TableResponse.category == category
-            )).subquery()
-            words = session.query(subq).filter(and_(
-                subq.c.row_no <= n_times
-            )).all()
-            session.expunge_all()
-
-        if len(words) == 0:
+        # Randomly select a word from each stage, n_times over
+        word_lists = self.response_index.sample_staged(resp_type, category, n=n_times)  # type: List[List[str]]
+        if len(word_lists) == 0:
             return f'Unable to find a(n) {cmd} group for {category_str}'
-        # Organize the words by stage
-        # Build a dictionary of the query results, organized by stage
-        word_dict = {}  # type: Dict[int, List[str]]
-        for word in words:
-            if word.row_no in word_dict.keys():
-                word_dict[word.row_no].append(word.text)
-            else:
-                word_dict[word.row_no] = [word.text]
-        # Use the word dict to randomly select words from each stage
-        word_lists = list(word_dict.values())  # type: List[List[str]]
 
         # Build the phrases
         if cmd == 'insult':
@@ -358,23 +311,17 @@ class PhraseBuilders:
 
     def facts(self, category: ResponseCategory = ResponseCategory.STANDARD) -> Union[str, List[Dict]]:
         """Gives the user a random fact at their request"""
-        # Extract all related words from db
-        with self.eng.session_mgr() as session:
-            randfact = session.query(TableResponse).filter(and_(
-                TableResponse.type == ResponseType.FACT,
-                TableResponse.category == category
-            )).order_by(func.random()).limit(1).one_or_none()
-            if randfact is None:
-                return 'Couldn\'t find a fact for that category?'
-            session.expunge(randfact)
+        randfact = self.response_index.choice(ResponseType.FACT, category)
+        if randfact is None:
+            return 'Couldn\'t find a fact for that category?'
 
-        rf_id = randfact.response_id
+        rf_id, rf_text = randfact
 
         fact_header = f'{"Official" if category == ResponseCategory.STANDARD else "Conspiracy"} fact #{rf_id}'
 
         return [
             BKitB.make_header_block(fact_header),
-            BKitB.make_section_block(BKitB.markdown_section(randfact.text))
+            BKitB.make_section_block(BKitB.markdown_section(rf_text))
         ]
 
     def conspiracy_fact(self) -> Union[str, List[Dict]]:
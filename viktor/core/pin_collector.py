@@ -1,95 +1,199 @@
+from contextlib import nullcontext
 from datetime import datetime
-from typing import Union
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from loguru import logger
 import pytz
 from slacktools.api.events.pin_added_or_removed import PinEvent
 from slacktools.api.web.pins import PinApiObject
-from sqlalchemy.engine.row import Row
-from sqlalchemy.sql import (
-    func,
-    or_,
+from sqlalchemy import (
+    String,
+    literal,
+    select,
+    union_all,
 )
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from sqlalchemy.sql.dml import Insert
 
-from viktor.db_eng import ViktorPSQLClient
+from viktor.db_eng import (
+    RESOLVE_CHUNK_SIZE,
+    ViktorPSQLClient,
+    resolve_user_key,
+)
 from viktor.model import (
     TableQuote,
     TableSlackChannel,
-    TableSlackUser,
 )
 
+US_CENTRAL = pytz.timezone('US/Central')
+# Quotes inserted per statement
+INSERT_CHUNK_SIZE = 500
+QUOTE_COLS = ['text', 'author_user_key', 'channel_key', 'pinner_user_key', 'is_quotable', 'link',
+              'message_timestamp', 'pin_timestamp']
 
-def collect_pins(pin_obj: Union[PinEvent, PinApiObject], psql_client: ViktorPSQLClient, log: logger,
-                 is_event: bool) -> TableQuote:
-    """Attempts to load pinned message into the quotes db"""
-    us_ct = pytz.timezone('US/Central')
+
+def _get_pin_item(pin_obj: Union[PinEvent, PinApiObject], is_event: bool):
+    """Returns the pinned message and the pin timestamp, which live in different places for events & the web API"""
     if is_event:
         pin_obj: PinEvent
-        pin_item = pin_obj.item.message
-        pin_ts = pin_obj.event_ts
-    else:
-        pin_obj: PinApiObject
-        pin_item = pin_obj.message
-        pin_ts = pin_obj.created
-    author_uid = pin_item.user
-    author_name = pin_item.username
-    if author_uid is None:
+        return pin_obj.item.message, pin_obj.event_ts
+    pin_obj: PinApiObject
+    return pin_obj.message, pin_obj.created
+
+
+def _get_author_uid(pin_item) -> Optional[str]:
+    if pin_item.user is None:
         # Try getting bot id
-        author_uid = pin_item.bot_id
-
-    with psql_client.session_mgr() as session:
-        author = session.query(TableSlackUser).filter(or_(
-            TableSlackUser.slack_user_hash == author_uid,
-            TableSlackUser.slack_bot_hash == author_uid
-        )).one_or_none()
-
-        if author is None and author_uid.startswith('B') and author_name is not None:
-            # Probably a bot thing. Check if the user hash begins with 'b'.
-            #   If so, try to write that id to the db so next time it goes through
-            author = session.query(TableSlackUser).filter(
-                func.lower(TableSlackUser.real_name) == author_name.lower()
-            ).one_or_none()
-        if author is None:
-            # If author is still none, use the unknown user
-            author = session.query(TableSlackUser).filter(
-                TableSlackUser.slack_bot_hash == 'BUNKNOWN'
-            ).one_or_none()
-        session.expunge(author)
-
-    with psql_client.session_mgr() as session:
-        pinner = session.query(TableSlackUser).filter(
-            TableSlackUser.slack_user_hash == pin_obj.created_by
-        ).one_or_none()
-        if pinner is None:
-            pinner = session.query(TableSlackUser).filter(
-                TableSlackUser.slack_bot_hash == 'BUNKNOWN'
-            ).one_or_none()
-        session.expunge(pinner)
-    log.debug('Adding pinned message to table...')
-
-    text = pin_item.text
-    files = pin_item.files
-    if files is not None:
-        for file in files:
-            text += f'\n{file.get("url_private")}'
-    if text == '':
-        # Try getting attachment info
-        for att in getattr(pin_item, 'attachments', []):
-            text += att.get('image_url')
-    log.debug(f'Passing text: "{text[:10]}"')
-    with psql_client.session_mgr() as session:
-        channel_key = session.query(TableSlackChannel.channel_id).filter(
-            TableSlackChannel.slack_channel_hash == pin_item.channel
-        ).one_or_none()
-        if isinstance(channel_key, Row):
-            # Convert to id
-            channel_key = next(iter(channel_key), None)
-    return TableQuote(
-        text=text,
-        author_user_key=author.user_id,
-        channel_key=channel_key,
-        pinner_user_key=pinner.user_id if pinner is not None else None,
-        link=pin_item.permalink,
-        message_timestamp=datetime.fromtimestamp(float(pin_item.ts), us_ct),
-        pin_timestamp=datetime.fromtimestamp(float(pin_ts), us_ct)
+        return pin_item.bot_id
+    return pin_item.user
+
+
+def resolve_pin_keys(session: Session, pins: List[Tuple[Optional[str], Optional[str], Optional[str], str]]) -> \
+        List[Tuple[Optional[int], Optional[int], Optional[int]]]:
+    """Resolves the author, pinner & channel keys for many pins in a single query
+
+    Args:
+        session: the session to query with
+        pins: (author hash, name the author posted under, pinner hash, channel hash) for each pin.
+            The name is only used when the author is a bot (B...) that isn't otherwise known
+
+    Returns:
+        (author key, pinner key, channel key) for each pin, in the same order
+    """
+    keys: Dict[int, Tuple] = {}
+    for start in range(0, len(pins), RESOLVE_CHUNK_SIZE):
+        rows = [
+            select(literal(i).label('idx'), literal(author, String).label('author_uid'),
+                   literal(name.lower() if name is not None else None, String).label('author_name'),
+                   literal(pinner, String).label('pinner_uid'), literal(channel, String).label('channel_hash'))
+            for i, (author, name, pinner, channel) in enumerate(pins[start:start + RESOLVE_CHUNK_SIZE], start=start)
+        ]
+        pin_tbl = (rows[0] if len(rows) == 1 else union_all(*rows)).cte('pins')
+        stmt = select(
+            pin_tbl.c.idx,
+            resolve_user_key(pin_tbl.c.author_uid, name=pin_tbl.c.author_name),
+            resolve_user_key(pin_tbl.c.pinner_uid),
+            select(TableSlackChannel.channel_id).where(
+                TableSlackChannel.slack_channel_hash == pin_tbl.c.channel_hash
+            ).scalar_subquery()
+        )
+        keys.update({x[0]: tuple(x[1:]) for x in session.execute(stmt).all()})
+    return [keys[i] for i in range(len(pins))]
+
+
+def collect_pins(pin_obj: Union[PinEvent, PinApiObject], psql_client: ViktorPSQLClient, log: logger,
+                 is_event: bool, session: Session = None) -> TableQuote:
+    """Attempts to load pinned message into the quotes db"""
+    return collect_pins_batch([pin_obj], psql_client=psql_client, log=log, is_event=is_event, session=session)[0]
+
+
+def collect_pins_batch(pin_objs: List[Union[PinEvent, PinApiObject]], psql_client: ViktorPSQLClient,
+                       log: logger, is_event: bool, session: Session = None) -> List[TableQuote]:
+    """Converts pinned messages to quote objects, resolving all the authors, pinners and channels in one query
+
+    Args:
+        session: an open session to resolve the keys in, so the caller can keep working in it.
+            Otherwise, one gets opened just for this
+    """
+    pin_items = [_get_pin_item(x, is_event=is_event) for x in pin_objs]
+    pins = []
+    for pin_obj, (pin_item, _) in zip(pin_objs, pin_items):
+        author_uid = _get_author_uid(pin_item)
+        # A bot that isn't known by its hash can be found by the name it posted under
+        name = pin_item.username if author_uid is not None and author_uid.startswith('B') else None
+        pins.append((author_uid, name, pin_obj.created_by, pin_item.channel))
+    with psql_client.session_mgr() if session is None else nullcontext(session) as sess:
+        pin_keys = resolve_pin_keys(sess, pins)
+
+    tbl_objs = []
+    for (pin_item, pin_ts), (author_key, pinner_key, channel_key) in zip(pin_items, pin_keys):
+        log.debug('Adding pinned message to table...')
+
+        text = pin_item.text
+        files = pin_item.files
+        if files is not None:
+            for file in files:
+                text += f'\n{file.get("url_private")}'
+        if text == '':
+            # Try getting attachment info
+            for att in getattr(pin_item, 'attachments', []):
+                text += att.get('image_url')
+        log.debug(f'Passing text: "{text[:10]}"')
+        tbl_objs.append(TableQuote(
+            text=text,
+            author_user_key=author_key,
+            channel_key=channel_key,
+            pinner_user_key=pinner_key,
+            link=pin_item.permalink,
+            message_timestamp=datetime.fromtimestamp(float(pin_item.ts), US_CENTRAL),
+            pin_timestamp=datetime.fromtimestamp(float(pin_ts), US_CENTRAL)
+        ))
+    return tbl_objs
+
+
+def _quote_identity(quote: Dict) -> Tuple[Optional[datetime], Optional[str]]:
+    # Quotes carry aware timestamps, which compare (and hash) by the instant they stand for
+    return quote['message_timestamp'], quote['link']
+
+
+def _pg_insert_quotes(rows: List[Dict]) -> Insert:
+    """Inserts the rows, reviving any that were soft-deleted (i.e., unpinned, then pinned again).
+
+    Only the inserted & revived rows come back. The timestamp column drops the timezone, having converted the
+    value to the session's, so it's converted back to an instant to match up with what went in
+    """
+    stmt = pg_insert(TableQuote).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[TableQuote.message_timestamp, TableQuote.link],
+        set_={'is_deleted': False},
+        where=TableQuote.is_deleted.is_(True)
+    ).returning(
+        func.timezone(func.current_setting('TimeZone'), TableQuote.message_timestamp).label('message_timestamp'),
+        TableQuote.link
     )
+
+
+def insert_quotes(session: Session, quotes: List[TableQuote]) -> List[bool]:
+    """Inserts the quotes, skipping any that are already in the table (same message timestamp & link)
+
+    Uses INSERT ... ON CONFLICT against the quote's unique key, so concurrent redeliveries of the same pin
+    can't both get in. A quote that's in the table but was unpinned is marked as not deleted again, which
+    counts as added. Quotes without a link never conflict, as NULLs never clash in a unique index.
+
+    Returns:
+        whether each quote was newly inserted (or revived), in the same order
+    """
+    rows = [{x: getattr(quote, x) for x in QUOTE_COLS} for quote in quotes]
+    identity = [TableQuote.message_timestamp, TableQuote.link]
+    if session.get_bind().dialect.name != 'postgresql':
+        # No RETURNING here, so go row by row & check what got inserted
+        return [
+            session.execute(sqlite_insert(TableQuote).values(x).on_conflict_do_update(
+                index_elements=identity, set_={'is_deleted': False}, where=TableQuote.is_deleted.is_(True)
+            )).rowcount == 1 for x in rows
+        ]
+
+    # A row can't be hit twice by one upsert, so only the first of any repeats within the batch goes in
+    unique_rows = {}
+    for row in rows:
+        unique_rows.setdefault(_quote_identity(row), row)
+    unique_rows = list(unique_rows.values())
+    inserted = set()
+    for start in range(0, len(unique_rows), INSERT_CHUNK_SIZE):
+        result = session.execute(_pg_insert_quotes(unique_rows[start:start + INSERT_CHUNK_SIZE]))
+        inserted.update(_quote_identity(x._mapping) for x in result)
+    is_new = []
+    for row in rows:
+        key = _quote_identity(row)
+        is_new.append(key in inserted)
+        inserted.discard(key)
+    return is_new
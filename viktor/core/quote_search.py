@@ -0,0 +1,211 @@
+import heapq
+import math
+import re
+import threading
+import time
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from sqlalchemy import (
+    REAL,
+    and_,
+    cast,
+    func,
+    or_,
+)
+from sqlalchemy.orm import joinedload
+
+from viktor.db_eng import ViktorPSQLClient
+from viktor.model import (
+    QUOTE_SEARCH_CONFIG,
+    QUOTE_TEXT_VECTOR,
+    TableQuote,
+)
+
+# Where a page of results left off, i.e., the (rank, quote_id) of its last quote
+Cursor = Tuple[float, int]
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+# Roughly the words Postgres' english config drops, so both kinds of search match on the same terms
+STOP_WORDS = frozenset(
+    'a an and are as at be but by for from had has have he her his i if in into is it its me my no not of on or '
+    'our she so that the their them then there these they this to too us was we were what when which who will '
+    'with you your'.split()
+)
+USER_FLAG_PATTERN = re.compile(r'-u\s+<?@?(?P<hash>[UW][A-Z0-9]+)(\|[^>]*)?>?')
+CHANNEL_FLAG_PATTERN = re.compile(r'-c\s+<?#?(?P<hash>[CG][A-Z0-9]+)(\|[^>]*)?>?')
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits text into lowercased search terms, leaving out the stop words"""
+    return [x for x in TOKEN_PATTERN.findall(text.lower().replace("'", '')) if x not in STOP_WORDS]
+
+
+def parse_query(text: str) -> Tuple[str, Optional[str], Optional[str]]:
+    """Pulls the author (-u @user) and channel (-c #channel) filters out of a search
+
+    Returns:
+        the search terms, the author's slack user hash and the channel's hash
+    """
+    author_hash = channel_hash = None
+    user_match = USER_FLAG_PATTERN.search(text)
+    if user_match is not None:
+        author_hash = user_match.group('hash')
+        text = text.replace(user_match.group(), '')
+    channel_match = CHANNEL_FLAG_PATTERN.search(text)
+    if channel_match is not None:
+        channel_hash = channel_match.group('hash')
+        text = text.replace(channel_match.group(), '')
+    return ' '.join(text.split()), author_hash, channel_hash
+
+
+class QuoteSearch:
+    """Full-text search over the quotes, ranked and paged with a keyset (rank, quote_id) cursor, so later
+    pages cost the same as the first.
+
+    On Postgres this is a `@@` match against the GIN index on the quote text, ranked with ts_rank. Elsewhere
+    (e.g., the local SQLite db) it's an in-memory inverted index of term -> quote_id -> count, built on the
+    first search and dropped whenever quotes are added or removed, to be built again on the next one. In case
+    news of that never arrives (e.g., the ETL ran in another process), it's also rebuilt once older than `ttl_secs`.
+    """
+
+    def __init__(self, eng: ViktorPSQLClient, page_size: int = 5, ttl_secs: float = 10 * 60):
+        self.eng = eng
+        self.page_size = page_size
+        self.ttl_secs = ttl_secs
+        self._expires_at = 0.
+        self.is_full_text = eng.engine.dialect.name == 'postgresql'
+        # The postings, i.e., term -> quote_id -> times it appears in the quote
+        #   and the quotes, i.e., quote_id -> (author_user_key, channel_key, length norm)
+        self._index: Optional[Tuple[Dict[str, Dict[int, int]], Dict[int, Tuple[int, int, float]]]] = None
+        self._lock = threading.Lock()
+        self.n_loads = 0
+        self.n_searches = 0
+        eng.changes.subscribe(ViktorPSQLClient.QUOTES_KEY, self.invalidate)
+
+    def _get_index(self):
+        index = self._index
+        if index is not None and time.monotonic() < self._expires_at:
+            return index
+        with self._lock:
+            if self._index is None or time.monotonic() >= self._expires_at:
+                self._index = self._build()
+                self._expires_at = time.monotonic() + self.ttl_secs
+                self.n_loads += 1
+            return self._index
+
+    def _build(self):
+        postings = {}
+        quotes = {}
+        with self.eng.session_mgr() as session:
+            # Unpinned quotes are soft-deleted. Older rows may not have the flag set at all
+            rows = session.query(TableQuote.quote_id, TableQuote.author_user_key, TableQuote.channel_key,
+                                 TableQuote.text).filter(TableQuote.is_deleted.isnot(True)).all()
+        for quote_id, author_key, channel_key, text in rows:
+            terms = tokenize(text)
+            for term in terms:
+                counts = postings.setdefault(term, {})
+                counts[quote_id] = counts.get(quote_id, 0) + 1
+            # Same idea as ts_rank's normalization 1, so long quotes don't win just by being long
+            quotes[quote_id] = (author_key, channel_key, 1 + math.log(1 + len(terms)))
+        return postings, quotes
+
+    def search(self, query: str, author_key: int = None, channel_key: int = None,
+               after: Cursor = None) -> Tuple[List[Tuple[float, TableQuote]], Optional[Cursor]]:
+        """Finds the quotes with all the terms in the query, best match first
+
+        Args:
+            query: the search terms
+            author_key: only quotes by this user
+            channel_key: only quotes from this channel
+            after: the cursor of the previous page, to get the page after it
+
+        Returns:
+            the page of (rank, quote), with each quote's author & channel loaded, and the cursor for the
+            next page (None if this is the last one)
+        """
+        self.n_searches += 1
+        if self.is_full_text:
+            results = self._search_full_text(query, author_key=author_key, channel_key=channel_key, after=after)
+        else:
+            results = self._search_index(query, author_key=author_key, channel_key=channel_key, after=after)
+        if len(results) > self.page_size:
+            results = results[:self.page_size]
+            last_rank, last_quote = results[-1]
+            return results, (last_rank, last_quote.quote_id)
+        return results, None
+
+    def _search_full_text(self, query: str, author_key: Optional[int], channel_key: Optional[int],
+                          after: Optional[Cursor]) -> List[Tuple[float, TableQuote]]:
+        tsquery = func.plainto_tsquery(QUOTE_SEARCH_CONFIG, query)
+        rank = func.ts_rank(QUOTE_TEXT_VECTOR, tsquery, 1)
+        conditions = [QUOTE_TEXT_VECTOR.op('@@')(tsquery), TableQuote.is_deleted.isnot(True)]
+        if author_key is not None:
+            conditions.append(TableQuote.author_user_key == author_key)
+        if channel_key is not None:
+            conditions.append(TableQuote.channel_key == channel_key)
+        if after is not None:
+            # ts_rank is a real, so the cursor's rank has to be compared as one too
+            last_rank = cast(after[0], REAL)
+            conditions.append(or_(rank < last_rank, and_(rank == last_rank, TableQuote.quote_id < after[1])))
+        with self.eng.session_mgr() as session:
+            # One more than a page, to know whether there's another
+            results = session.query(rank, TableQuote).options(
+                joinedload(TableQuote.author), joinedload(TableQuote.channel)
+            ).filter(and_(*conditions)).order_by(rank.desc(), TableQuote.quote_id.desc()).limit(
+                self.page_size + 1).all()
+            session.expunge_all()
+        return [(x[0], x[1]) for x in results]
+
+    def _search_index(self, query: str, author_key: Optional[int], channel_key: Optional[int],
+                      after: Optional[Cursor]) -> List[Tuple[float, TableQuote]]:
+        terms = set(tokenize(query))
+        postings, quotes = self._get_index()
+        with self._lock:
+            term_postings = [postings.get(x) for x in terms]
+            if len(term_postings) == 0 or any(x is None for x in term_postings):
+                return []
+            # Walk the rarest term's quotes, checking they have the rest
+            term_postings.sort(key=len)
+            n_quotes = len(quotes)
+            idfs = [math.log(1 + n_quotes / len(x)) for x in term_postings]
+            ranked = []
+            for quote_id, count in term_postings[0].items():
+                quote_author, quote_channel, norm = quotes[quote_id]
+                if (author_key is not None and quote_author != author_key) or \
+                        (channel_key is not None and quote_channel != channel_key):
+                    continue
+                counts = [count] + [x.get(quote_id) for x in term_postings[1:]]
+                if None in counts:
+                    continue
+                rank = sum(x * idf for x, idf in zip(counts, idfs)) / norm
+                if after is not None and (rank, quote_id) >= after:
+                    continue
+                ranked.append((rank, quote_id))
+        page = heapq.nlargest(self.page_size + 1, ranked)
+        if len(page) == 0:
+            return []
+        with self.eng.session_mgr() as session:
+            tbl_objs = {x.quote_id: x for x in session.query(TableQuote).options(
+                joinedload(TableQuote.author), joinedload(TableQuote.channel)
+            ).filter(TableQuote.quote_id.in_([x[1] for x in page])).all()}
+            session.expunge_all()
+        return [(rank, tbl_objs[quote_id]) for rank, quote_id in page if quote_id in tbl_objs]
+
+    def invalidate(self):
+        """Drops the in-memory index, so it's built fresh on the next search"""
+        with self._lock:
+            self._index = None
+
+    def get_stats(self) -> Dict[str, int]:
+        index = self._index
+        postings, quotes = index if index is not None else ({}, {})
+        return {
+            'size': len(quotes),
+            'terms': len(postings),
+            'loads': self.n_loads,
+            'searches': self.n_searches,
+        }
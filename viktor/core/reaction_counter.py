@@ -0,0 +1,104 @@
+from collections import Counter
+import threading
+from typing import Dict
+
+from loguru import logger
+from sqlalchemy import (
+    case,
+    update,
+)
+
+from viktor.db_eng import ViktorPSQLClient
+from viktor.model import TableEmoji
+
+
+class ReactionCountBuffer:
+    """Write-behind buffer for emoji reaction counts.
+
+    Reactions are tallied in memory and the accumulated deltas are written to the emoji table in a single
+    UPDATE every `flush_secs` seconds or once `flush_events` reactions have piled up, whichever comes first.
+    """
+
+    def __init__(self, eng: ViktorPSQLClient, parent_log: logger, flush_secs: float = 30,
+                 flush_events: int = 100):
+        self.eng = eng
+        self.log = parent_log.bind(child_name=self.__class__.__name__)
+        self.flush_secs = flush_secs
+        self.flush_events = flush_events
+        self._counts = Counter()
+        self._n_pending = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.n_flushes = 0
+        self.n_rows_flushed = 0
+
+    def start(self):
+        """Starts the periodic flush thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='reaction-count-flusher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_secs):
+            self.flush()
+
+    def increment(self, emoji_name: str, n: int = 1):
+        """Records a reaction, flushing immediately if enough have accumulated"""
+        with self._lock:
+            self._counts[emoji_name] += n
+            self._n_pending += n
+            is_flush = self._n_pending >= self.flush_events
+        if is_flush:
+            self.flush()
+
+    def flush(self) -> int:
+        """Writes all accumulated deltas to the emoji table in one statement
+
+        Returns:
+            the number of distinct emojis that were updated
+        """
+        with self._flush_lock:
+            with self._lock:
+                if len(self._counts) == 0:
+                    return 0
+                deltas: Dict[str, int] = dict(self._counts)
+                self._counts.clear()
+                self._n_pending = 0
+            try:
+                with self.eng.session_mgr() as session:
+                    session.execute(
+                        update(TableEmoji).where(TableEmoji.name.in_(list(deltas.keys()))).values(
+                            reaction_count=TableEmoji.reaction_count + case(deltas, value=TableEmoji.name, else_=0)
+                        ).execution_options(synchronize_session=False)
+                    )
+            except Exception as e:
+                self.log.error(f'Failed to flush {len(deltas)} reaction counts - keeping them for next time: {e}')
+                with self._lock:
+                    self._counts.update(deltas)
+                    self._n_pending += sum(deltas.values())
+                return 0
+            self.n_flushes += 1
+            self.n_rows_flushed += len(deltas)
+            self.log.debug(f'Flushed reaction counts for {len(deltas)} emojis.')
+            return len(deltas)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'pending_reactions': self._n_pending,
+                'pending_emojis': len(self._counts),
+                'flushes': self.n_flushes,
+                'rows_flushed': self.n_rows_flushed,
+            }
+
+    def shutdown(self):
+        """Stops the flush thread and writes out whatever's left"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
@@ -0,0 +1,112 @@
+import random
+import threading
+import time
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from viktor.db_eng import ViktorPSQLClient
+from viktor.model import (
+    ResponseCategory,
+    ResponseType,
+    TableResponse,
+)
+
+BucketKey = Tuple[ResponseType, ResponseCategory]
+
+
+class ResponseIndex:
+    """In-memory index of the response table, bucketed by (type, category) for constant-time random picks.
+
+    Alongside that, the words for the generated responses (insults, compliments, phrases) are precompiled
+    into one tuple per stage, so building those is done without going to the db.
+
+    The index is loaded on first use and dropped whenever the responses are reloaded (e.g., by the ETL),
+    to be loaded again on the next pick. In case that news never arrives (no NOTIFY, or the listener was
+    disconnected), it's also reloaded once it's older than `ttl_secs`.
+    """
+
+    def __init__(self, eng: ViktorPSQLClient, ttl_secs: float = 30 * 60):
+        self.eng = eng
+        self.ttl_secs = ttl_secs
+        self._expires_at = 0.
+        # The buckets, i.e., (type, category) -> list of (response_id, text)
+        #   and the staged words, i.e., (type, category) -> words for each stage, in stage order
+        self._index: Optional[Tuple[Dict[BucketKey, List[Tuple[int, str]]],
+                                    Dict[BucketKey, Tuple[Tuple[str, ...], ...]]]] = None
+        self._lock = threading.Lock()
+        self.n_loads = 0
+        self.n_picks = 0
+        eng.changes.subscribe(ViktorPSQLClient.RESPONSES_KEY, self.invalidate)
+
+    def load(self):
+        """Loads the index, if it's not already loaded"""
+        self._get_index()
+
+    def _get_index(self):
+        index = self._index
+        if index is not None and time.monotonic() < self._expires_at:
+            return index
+        with self._lock:
+            if self._index is None or time.monotonic() >= self._expires_at:
+                self._index = self._build()
+                self._expires_at = time.monotonic() + self.ttl_secs
+                self.n_loads += 1
+            return self._index
+
+    def _build(self):
+        buckets = {}
+        stages = {}
+        with self.eng.session_mgr() as session:
+            rows = session.query(TableResponse.response_id, TableResponse.type, TableResponse.category,
+                                 TableResponse.stage, TableResponse.text).all()
+        for response_id, resp_type, category, stage, text in rows:
+            buckets.setdefault((resp_type, category), []).append((response_id, text))
+            stages.setdefault((resp_type, category), {}).setdefault(stage, []).append(text)
+        staged = {k: tuple(tuple(v[x]) for x in sorted(v.keys())) for k, v in stages.items()}
+        return buckets, staged
+
+    def choice(self, resp_type: ResponseType, category: ResponseCategory) -> Optional[Tuple[int, str]]:
+        """Picks a random (response_id, text) from the type/category combo, if there are any"""
+        bucket = self._get_index()[0].get((resp_type, category))
+        self.n_picks += 1
+        if not bucket:
+            return None
+        return random.choice(bucket)
+
+    def sample_staged(self, resp_type: ResponseType, category: ResponseCategory, n: int) -> List[List[str]]:
+        """Draws up to n word lists from the type/category combo, each with one word per stage.
+
+        Words aren't repeated within a stage, so a stage with fewer than n words runs out before the others
+        """
+        stages = self._get_index()[1].get((resp_type, category), ())
+        self.n_picks += 1
+        draws = [random.sample(x, min(n, len(x))) for x in stages]
+        word_lists = [[x[i] for x in draws if i < len(x)] for i in range(n)]
+        return [x for x in word_lists if len(x) > 0]
+
+    def add(self, response: TableResponse):
+        """Adds a newly-stored response to the index (if it's loaded)"""
+        with self._lock:
+            if self._index is not None:
+                # Only single-stage responses (e.g., facts) get added this way, so the staged words stay as-is
+                self._index[0].setdefault((response.type, response.category), []).append(
+                    (response.response_id, response.text))
+
+    def invalidate(self):
+        """Drops the index, so it's loaded fresh on the next pick"""
+        with self._lock:
+            self._index = None
+
+    def get_stats(self) -> Dict[str, int]:
+        index = self._index
+        buckets = index[0] if index is not None else {}
+        return {
+            'size': sum(len(x) for x in buckets.values()),
+            'buckets': len(buckets),
+            'loads': self.n_loads,
+            'picks': self.n_picks,
+        }
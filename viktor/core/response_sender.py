@@ -0,0 +1,78 @@
+import threading
+import time
+from typing import Dict
+
+from loguru import logger
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from viktor.core.event_queue import EventQueue
+from viktor.core.metrics import SLACK_API_LATENCY
+
+
+class ResponseUrlSender:
+    """Sends follow-up updates to Slack's response_url in the background.
+
+    Posts go out on a small worker pool over a pooled HTTP session (with timeouts and retries on
+    connection errors, 429s and 5xxs), so the action endpoint can return its 200 right away.
+    """
+
+    def __init__(self, parent_log: logger, n_workers: int = 2, timeout_secs: float = 5, n_retries: int = 3):
+        self.log = parent_log.bind(child_name=self.__class__.__name__)
+        self.timeout_secs = timeout_secs
+        self.session = requests.Session()
+        retries = Retry(total=n_retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                        allowed_methods=frozenset(['POST']))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(n_workers, 4), max_retries=retries)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.queue = EventQueue(parent_log=self.log, n_workers=n_workers, max_size=500)
+        self._lock = threading.Lock()
+        self.n_sent = 0
+        self.n_failed = 0
+        self.total_secs = 0.
+        self.max_secs = 0.
+
+    def start(self):
+        self.queue.start()
+
+    def send(self, response_url: str, payload: Dict):
+        """Queues a json payload to be posted to the response_url"""
+        self.queue.submit('response_url', self._post, response_url, payload)
+
+    def _post(self, response_url: str, payload: Dict):
+        start = time.perf_counter()
+        is_success = False
+        try:
+            resp = self.session.post(response_url, json=payload, headers={'Content-Type': 'application/json'},
+                                     timeout=self.timeout_secs)
+            is_success = resp.ok
+            if not is_success:
+                self.log.warning(f'response_url update failed with status {resp.status_code}: {resp.text[:100]}')
+        except requests.RequestException as e:
+            self.log.error(f'response_url update failed: {e}')
+        elapsed = time.perf_counter() - start
+        SLACK_API_LATENCY.labels(api_method='response_url', outcome='ok' if is_success else 'error').observe(elapsed)
+        with self._lock:
+            if is_success:
+                self.n_sent += 1
+            else:
+                self.n_failed += 1
+            self.total_secs += elapsed
+            self.max_secs = max(self.max_secs, elapsed)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            n_total = self.n_sent + self.n_failed
+            return {
+                'sent': self.n_sent,
+                'failed': self.n_failed,
+                'avg_secs': self.total_secs / n_total if n_total > 0 else 0.,
+                'max_secs': self.max_secs,
+                'depth': self.queue.get_stats()['depth'],
+            }
+
+    def shutdown(self):
+        self.queue.shutdown()
+        self.session.close()
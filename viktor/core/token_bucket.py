@@ -0,0 +1,77 @@
+import threading
+import time
+from typing import (
+    Callable,
+    Dict,
+)
+
+
+class TokenBucket:
+    """Thread-safe token bucket for staying under an API's rate limit.
+
+    Tokens trickle in at `rate_per_sec` up to `capacity` (the burst size). `acquire` blocks until one's available.
+    When the API pushes back anyway (e.g., a 429 with Retry-After), `pause` holds everyone off until it's over.
+    """
+    # Leeway for float error in the refill, which could otherwise leave a token just out of reach
+    EPSILON = 1e-9
+
+    def __init__(self, rate_per_sec: float, capacity: float = 1, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate_per_sec = rate_per_sec
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = capacity
+        self._last = clock()
+        self._paused_until = 0.
+        self._lock = threading.Lock()
+        self.n_acquired = 0
+        self.n_pauses = 0
+        self.secs_waited = 0.
+
+    @classmethod
+    def per_minute(cls, n: float, capacity: float = 1, **kwargs) -> 'TokenBucket':
+        return cls(rate_per_sec=n / 60, capacity=capacity, **kwargs)
+
+    def _refill(self, now: float):
+        # Nothing accrues during a pause
+        if now > self._last:
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate_per_sec)
+            self._last = now
+
+    def acquire(self) -> float:
+        """Takes a token, waiting for one if need be
+
+        Returns:
+            the number of seconds waited
+        """
+        waited = 0.
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1 - self.EPSILON:
+                    self._tokens -= 1
+                    self.n_acquired += 1
+                    self.secs_waited += waited
+                    return waited
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate_per_sec)
+            self._sleep(wait)
+            waited += wait
+
+    def pause(self, secs: float):
+        """Hands out no tokens for the next `secs` seconds (and none banked in the meantime)"""
+        with self._lock:
+            now = self._clock()
+            self._paused_until = max(self._paused_until, now + secs)
+            self._tokens = 0
+            self._last = self._paused_until
+            self.n_pauses += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'acquired': self.n_acquired,
+                'pauses': self.n_pauses,
+                'secs_waited': round(self.secs_waited, 3),
+            }
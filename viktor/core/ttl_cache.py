@@ -0,0 +1,77 @@
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Optional,
+    Tuple,
+)
+
+
+class TTLCache:
+    """Thread-safe read-through cache whose entries expire after a fixed TTL.
+
+    Lookups that come back empty (None) are cached too, with their own (usually shorter) TTL, so that
+    repeated requests for unknown keys don't keep hitting the db.
+    """
+
+    def __init__(self, ttl_secs: float = 300, negative_ttl_secs: float = 60, max_size: int = 10000):
+        self.ttl_secs = ttl_secs
+        self.negative_ttl_secs = negative_ttl_secs
+        self.max_size = max_size
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self.n_hits = 0
+        self.n_negative_hits = 0
+        self.n_misses = 0
+        self.n_invalidations = 0
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Optional[Any]:
+        """Returns the cached value for the key, calling the loader to fill the cache on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                if entry[1] is None:
+                    self.n_negative_hits += 1
+                else:
+                    self.n_hits += 1
+                return entry[1]
+            self.n_misses += 1
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def set(self, key: Hashable, value: Optional[Any]):
+        ttl = self.negative_ttl_secs if value is None else self.ttl_secs
+        now = time.monotonic()
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_size:
+                # Make room - drop expired entries first, then the oldest one if that didn't help
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+                if len(self._entries) >= self.max_size:
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (now + ttl, value)
+
+    def invalidate(self, key: Hashable = None):
+        """Drops a single key from the cache, or everything if no key is provided"""
+        with self._lock:
+            self.n_invalidations += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.n_hits + self.n_negative_hits + self.n_misses
+            return {
+                'size': len(self._entries),
+                'hits': self.n_hits,
+                'negative_hits': self.n_negative_hits,
+                'misses': self.n_misses,
+                'invalidations': self.n_invalidations,
+                'hit_ratio': (self.n_hits + self.n_negative_hits) / lookups if lookups > 0 else 0.,
+            }
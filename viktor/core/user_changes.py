@@ -1,14 +1,26 @@
+from datetime import datetime
 from typing import (
+    Any,
     Dict,
     List,
     Optional,
+    Tuple,
     Union,
 )
 
 from loguru import logger
+import numpy as np
 from slacktools import BlockKitBuilder as BKitB
 from slacktools import SlackBotBase
+from sqlalchemy import (
+    insert,
+    select,
+)
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import (
+    and_,
+    func,
+)
 
 from viktor.db_eng import ViktorPSQLClient
 from viktor.model import (
@@ -28,13 +40,15 @@ SLACK_API_ATTR_MAP = {
 }
 
 ALL_IMPORTANT_ATTRS = list(SLACK_API_ATTR_MAP.values()) + ['role_title', 'role_desc']
+# A full snapshot is written every this many changelog entries for a user. 1 writes only full snapshots
+SNAPSHOT_EVERY = 10
 
 
 def extract_user_change(eng: ViktorPSQLClient, user_info_dict: Dict[str, Union[str, Dict]], log: logger):
     """Takes in a dictionary of recent user changes and processes them for logging into the database"""
     uid = user_info_dict['id']
     log.debug(f'User change detected for {uid}. Looking them up in database...')
-    user_obj = eng.get_user_from_hash(user_hash=uid)
+    user_obj = eng.get_user_from_hash(user_hash=uid, is_cached=False)
     if user_obj is None:
         log.warning(f'Couldn\'t find user: {uid} \n {user_info_dict}')
         return
@@ -53,39 +67,116 @@ def extract_user_change(eng: ViktorPSQLClient, user_info_dict: Dict[str, Union[s
             elif slack_attr != table_attr:
                 log.debug(f'Found attr "{slack_attr_name}" was different than what\'s in the table.')
                 setattr(user_obj, table_attr_name, slack_attr)
+    eng.invalidate_user(user_obj)
+
+
+def reconstruct_profiles(session: Session, user_ids: List[int] = None,
+                         as_of: datetime = None) -> Dict[int, Tuple[Dict[str, Any], int]]:
+    """Rebuilds each user's profile as of the given time from their changelog
+
+    Each user's latest full snapshot (up to as_of) is read along with the sparse entries after it,
+    all in one query, and the sparse entries are applied on top of it in order.
+
+    Args:
+        session: the session to query with
+        user_ids: limit to these users. Defaults to everyone with a changelog
+        as_of: ignore entries made after this time. Defaults to including everything
+
+    Returns:
+        user_id -> (the tracked attributes, the number of sparse entries since the snapshot)
+    """
+    snap_filters = [TableSlackUserChangeLog.is_full_snapshot]
+    entry_filters = []
+    if user_ids is not None:
+        snap_filters.append(TableSlackUserChangeLog.user_key.in_(user_ids))
+    if as_of is not None:
+        snap_filters.append(TableSlackUserChangeLog.created_date <= as_of)
+        entry_filters.append(TableSlackUserChangeLog.created_date <= as_of)
+    snaps = select(
+        TableSlackUserChangeLog.user_key,
+        func.max(TableSlackUserChangeLog.user_change_id).label('snap_id')
+    ).where(and_(*snap_filters)).group_by(TableSlackUserChangeLog.user_key).subquery()
+    entries = session.query(TableSlackUserChangeLog).join(snaps, and_(
+        TableSlackUserChangeLog.user_key == snaps.c.user_key,
+        TableSlackUserChangeLog.user_change_id >= snaps.c.snap_id
+    )).filter(*entry_filters).order_by(
+        TableSlackUserChangeLog.user_key,
+        TableSlackUserChangeLog.user_change_id
+    ).all()
+
+    profiles = {}
+    for entry in entries:
+        if entry.is_full_snapshot:
+            profiles[entry.user_key] = ({x: getattr(entry, x) for x in ALL_IMPORTANT_ATTRS}, 0)
+            continue
+        state, n_sparse = profiles[entry.user_key]
+        for attr in entry.changed_attrs.split(','):
+            state[attr] = getattr(entry, attr)
+        profiles[entry.user_key] = (state, n_sparse + 1)
+    return profiles
 
 
-def process_user_changes(session: Session, user: TableSlackUser, log: logger) -> Optional[Dict]:
-    """Processes the profile changes for a single user"""
-    # List all attributes we want to monitor - Slack + OKR roles
-    log.debug(f'Working on user: {user.display_name}.')
-    most_recent_changelog = session.query(TableSlackUserChangeLog).filter(
-        TableSlackUserChangeLog.user_key == user.user_id
-    ).order_by(TableSlackUserChangeLog.created_date.desc()).limit(1).one_or_none()
-    if most_recent_changelog is None:
-        log.debug('Recording details to changelog - no past changelog entry.')
-        attr_dict = {v: getattr(user, v) for v in ALL_IMPORTANT_ATTRS}
-        session.add(TableSlackUserChangeLog(user_key=user.user_id, **attr_dict))
-    else:
-        log.debug('Comparing user detail to most recent changelog entry')
-        change_dict = {
-            'user_hashname': f'{user.display_name}|{user.slack_user_hash}'
-        }
-        for attr in ALL_IMPORTANT_ATTRS:
-            last_chglog = most_recent_changelog.__dict__.get(attr)
-            cur_user = user.__dict__.get(attr)
-            if last_chglog != cur_user:
-                change_dict[attr] = {
-                    'old': last_chglog,
-                    'new': cur_user
-                }
-        if len(change_dict) > 1:
-            log.debug(f'Changes detected for {user.display_name}({user.user_id})')
-            # Update the changelog
-            attr_dict = {k: user.__dict__.get(k) for k in ALL_IMPORTANT_ATTRS}
-            session.add(TableSlackUserChangeLog(user_key=user.user_id, **attr_dict))
-            return change_dict
-    return None
+def get_profile_at(session: Session, user_id: int, as_of: datetime = None) -> Optional[Dict[str, Any]]:
+    """Returns the user's tracked attributes as they stood at the given time. None if nothing was logged by then"""
+    profile = reconstruct_profiles(session, user_ids=[user_id], as_of=as_of).get(user_id)
+    return None if profile is None else profile[0]
+
+
+def diff_user_profiles(session: Session, log: logger, attrs: List[str] = None,
+                       snapshot_every: int = SNAPSHOT_EVERY) -> List[Dict]:
+    """Compares every user against their profile as recorded in the changelog, logging any changes.
+
+    Users that changed get a sparse entry holding just the changed attributes, or a full snapshot once they've
+    built up snapshot_every - 1 sparse entries. Users that don't have a changelog yet just get their first
+    snapshot recorded. All the new entries go out in one bulk insert.
+
+    Returns:
+        a dict for each user with changes, holding the old & new values for each changed attribute
+    """
+    attrs = ALL_IMPORTANT_ATTRS if attrs is None else attrs
+    rows = session.query(
+        TableSlackUser.user_id,
+        TableSlackUser.slack_user_hash,
+        TableSlackUser.display_name,
+        *[getattr(TableSlackUser, x).label(f'cur_{x}') for x in ALL_IMPORTANT_ATTRS]
+    ).all()
+    if len(rows) == 0:
+        return []
+    profiles = reconstruct_profiles(session)
+
+    cur = np.array([[getattr(x, f'cur_{a}') for a in attrs] for x in rows], dtype=object)
+    old = np.array([[profiles[x.user_id][0][a] if x.user_id in profiles else None for a in attrs] for x in rows],
+                   dtype=object)
+    n_sparse = np.array([profiles[x.user_id][1] if x.user_id in profiles else 0 for x in rows])
+    is_logged = np.array([x.user_id in profiles for x in rows])
+    is_changed = cur != old
+    # Users without an entry get their first one recorded, but there's nothing to announce
+    is_announced = is_logged & is_changed.any(axis=1)
+    is_snapshot = ~is_logged | (is_announced & (n_sparse + 1 >= snapshot_every))
+    log.debug(f'Found {is_announced.sum()} users with changes and {(~is_logged).sum()} users without a changelog')
+
+    new_entries = []
+    for i in np.flatnonzero(is_snapshot | is_announced):
+        row = rows[i]
+        if is_snapshot[i]:
+            entry = {x: getattr(row, f'cur_{x}') for x in ALL_IMPORTANT_ATTRS}
+            entry.update(is_full_snapshot=True, changed_attrs=None)
+        else:
+            changed = [attrs[j] for j in np.flatnonzero(is_changed[i])]
+            # Every row in the bulk insert needs the same keys
+            entry = {x: getattr(row, f'cur_{x}') if x in changed else None for x in ALL_IMPORTANT_ATTRS}
+            entry.update(is_full_snapshot=False, changed_attrs=','.join(changed))
+        new_entries.append(dict(user_key=row.user_id, **entry))
+    if len(new_entries) > 0:
+        session.execute(insert(TableSlackUserChangeLog), new_entries)
+
+    updated_users = []
+    for i in np.flatnonzero(is_announced):
+        change_dict = {'user_hashname': f'{rows[i].display_name}|{rows[i].slack_user_hash}'}
+        for j in np.flatnonzero(is_changed[i]):
+            change_dict[attrs[j]] = {'old': old[i, j], 'new': cur[i, j]}
+        updated_users.append(change_dict)
+    return updated_users
 
 
 def build_profile_diff(blocks: List[Dict], updated_user_dict: Dict) -> List[Dict]:
@@ -106,13 +197,8 @@ def build_profile_diff(blocks: List[Dict], updated_user_dict: Dict) -> List[Dict
 
 def process_updated_profiles(eng: ViktorPSQLClient, st: SlackBotBase, log: logger):
     """Handles the periodic scanning of differences between the profile changelog and the user's current profile"""
-    updated_users = []
     with eng.session_mgr() as session:
-        users = session.query(TableSlackUser).all()
-        for user in users:
-            change_dict = process_user_changes(session=session, user=user, log=log)
-            if change_dict is not None:
-                updated_users.append(change_dict)
+        updated_users = diff_user_profiles(session=session, log=log)
     log.debug(f'Found {len(updated_users)} users with recent changes.')
     if len(updated_users) > 0:
         for updated_user in updated_users:
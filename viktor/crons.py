@@ -18,14 +18,16 @@ from flask import (
 from slacktools.block_kit import BlockKitBuilder as BKitB
 
 import viktor.app as mainapp
-from viktor.core.user_changes import build_profile_diff
+from viktor.core.user_changes import (
+    build_profile_diff,
+    diff_user_profiles,
+)
 from viktor.logg import get_base_logger
 from viktor.model import (
     TableEmoji,
     TablePotentialEmoji,
-    TableSlackUser,
-    TableSlackUserChangeLog,
 )
+from viktor.settings import auto_config
 
 cron = Blueprint('cron', __name__)
 logg = get_base_logger()
@@ -112,38 +114,9 @@ def handle_cron_profile_update():
         'role_desc',
         'avatar_link'
     ]
-    updated_users = []
     with mainapp.eng.session_mgr() as session:
-        users = session.query(TableSlackUser).all()
-
-        user: TableSlackUser
-        for user in users:
-            most_recent_changelog = session.query(TableSlackUserChangeLog).filter(
-                TableSlackUserChangeLog.user_key == user.user_id
-            ).order_by(TableSlackUserChangeLog.created_date.desc()).limit(1).one_or_none()
-            if most_recent_changelog is None:
-                # Record the user details without comparison - this is the first instance encountering this user
-                mainapp.logg.debug('Recording user details to changelog - no past changelog entry')
-                attr_dict = {k: user.__dict__.get(k) for k in attrs}
-                session.add(TableSlackUserChangeLog(user_key=user.user_id, **attr_dict))
-            else:
-                # Begin comparing to find what's new
-                change_dict = {'user_hashname': f'{user.display_name}|{user.slack_user_hash}'}
-                for attr in attrs:
-                    last_chglog = most_recent_changelog.__dict__.get(attr)
-                    cur_user = user.__dict__.get(attr)
-                    if last_chglog != cur_user:
-                        change_dict[attr] = {
-                            'old': last_chglog,
-                            'new': cur_user
-                        }
-                if len(change_dict) > 1:
-                    mainapp.logg.debug(f'{len(change_dict)} changes detected for '
-                                       f'{user.display_name}(uid:{user.user_id})')
-                    # Update the changelog
-                    attr_dict = {k: user.__dict__.get(k) for k in attrs}
-                    session.add(TableSlackUserChangeLog(user_key=user.user_id, **attr_dict))
-                    updated_users.append(change_dict)
+        updated_users = diff_user_profiles(session=session, log=mainapp.logg, attrs=attrs,
+                                           snapshot_every=auto_config.USER_CHANGELOG_SNAPSHOT_EVERY)
     # Now work on splitting the new/old info into a message
     for updated_user in updated_users:
         blocks = [
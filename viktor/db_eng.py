@@ -1,57 +1,224 @@
+from contextlib import contextmanager
 from typing import (
     Dict,
+    Iterable,
+    Iterator,
     Optional,
     Union,
 )
 
 from loguru import logger
 from slacktools.db_engine import PSQLClient
+from sqlalchemy import (
+    String,
+    literal,
+    select,
+    union_all,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import (
+    Session,
+    sessionmaker,
+)
+from sqlalchemy.sql import (
+    ColumnElement,
+    func,
+)
 
+from viktor.core.change_feed import ChangeFeed
+from viktor.core.error_sink import ErrorSink
+from viktor.core.metrics import (
+    DB_SESSION_LATENCY,
+    timed,
+)
+from viktor.core.ttl_cache import TTLCache
 from viktor.model import (
     BotSettingType,
     ErrorType,
     TableBotSetting,
-    TableError,
     TableSlackChannel,
     TableSlackUser,
 )
 
+# The user that anyone who can't be found gets attributed to
+FALLBACK_BOT_HASH = 'BUNKNOWN'
+# Hashes resolved per query. Keeps the compound SELECT under SQLite's limit
+RESOLVE_CHUNK_SIZE = 250
+
+
+def resolve_user_key(user_hash: ColumnElement, name: ColumnElement = None,
+                     fallback_hash: Optional[str] = FALLBACK_BOT_HASH) -> ColumnElement:
+    """Matches on slack_user_hash, then slack_bot_hash, then (when a name is given) the user's lowercased
+    real name, falling back to the user with the fallback bot hash"""
+    candidates = [
+        select(TableSlackUser.user_id).where(TableSlackUser.slack_user_hash == user_hash),
+        select(TableSlackUser.user_id).where(TableSlackUser.slack_bot_hash == user_hash),
+    ]
+    if name is not None:
+        candidates.append(select(TableSlackUser.user_id).where(func.lower(TableSlackUser.real_name) == name))
+    if fallback_hash is not None:
+        candidates.append(select(TableSlackUser.user_id).where(TableSlackUser.slack_bot_hash == fallback_hash))
+    return func.coalesce(*[x.limit(1).scalar_subquery() for x in candidates])
+
 
 class ViktorPSQLClient(PSQLClient):
-    """Creates Postgres connection engine"""
+    """Creates Postgres connection engine
+
+    Pass in an engine to use that instead of connecting to Postgres (e.g., the SQLite stand-in in viktor.local_db)
+    """
+
+    SETTINGS_KEY = 'bot_settings'
+    USERS_KEY = 'slack_users'
+    CHANNELS_KEY = 'slack_channels'
+    RESPONSES_KEY = 'responses'
+    ACRONYMS_KEY = 'acronyms'
+    QUOTES_KEY = 'quotes'
 
-    def __init__(self, props: Dict, parent_log: logger, **kwargs):
+    def __init__(self, props: Dict, parent_log: logger, channel_cache_ttl: float = 300,
+                 channel_cache_negative_ttl: float = 60, settings_ttl: float = 60, user_cache_ttl: float = 300,
+                 user_cache_negative_ttl: float = 60, error_flush_secs: float = 10, error_flush_events: int = 50,
+                 error_spool_path: str = None, engine: Engine = None, **kwargs):
         _ = kwargs
-        super().__init__(props=props, parent_log=parent_log)
+        self._local_session = None
+        if engine is None:
+            super().__init__(props=props, parent_log=parent_log)
+        else:
+            self.log = parent_log.bind(child_name=self.__class__.__name__)
+            self.engine = engine
+            self._local_session = sessionmaker(bind=engine, expire_on_commit=False)
+        # Channel rows keyed by slack_channel_hash. Unknown channels are cached as None
+        self.channel_cache = TTLCache(ttl_secs=channel_cache_ttl, negative_ttl_secs=channel_cache_negative_ttl)
+        # All the bot settings, held under a single key. The TTL acts as a poll for when NOTIFY isn't available
+        self.settings_cache = TTLCache(ttl_secs=settings_ttl, negative_ttl_secs=settings_ttl, max_size=1)
+        # User rows keyed by ('user', slack_user_hash) and ('bot', slack_bot_hash). Only for reading -
+        #   anything that changes a user should load it with is_cached=False, then call invalidate_user
+        self.user_cache = TTLCache(ttl_secs=user_cache_ttl, negative_ttl_secs=user_cache_negative_ttl)
+        self.changes = ChangeFeed(eng=self, parent_log=parent_log)
+        self.changes.subscribe(self.SETTINGS_KEY, lambda: self.settings_cache.invalidate(self.SETTINGS_KEY))
+        self.changes.subscribe(self.USERS_KEY, lambda: self.user_cache.invalidate())
+        self.changes.subscribe(self.CHANNELS_KEY, lambda: self.channel_cache.invalidate())
+        # Errors are written in the background, so logging one never blocks on the db
+        self.error_sink = ErrorSink(eng=self, parent_log=parent_log, flush_secs=error_flush_secs,
+                                    flush_events=error_flush_events, spool_path=error_spool_path)
+
+    @contextmanager
+    def session_mgr(self) -> Iterator[Session]:
+        """Wraps the base session manager to record how long each session is held open"""
+        with timed(DB_SESSION_LATENCY), self._session_scope() as session:
+            yield session
+
+    @contextmanager
+    def _session_scope(self) -> Iterator[Session]:
+        if self._local_session is None:
+            with super().session_mgr() as session:
+                yield session
+            return
+        session = self._local_session()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
 
     def get_bot_setting(self, setting: BotSettingType) -> Optional[Union[int, bool]]:
-        """Attempts to return a given bot setting"""
+        """Attempts to return a given bot setting. Settings are served from the cache, so this is cheap"""
+        result = self.settings_cache.get_or_load(self.SETTINGS_KEY, self._load_bot_settings).get(setting)
+        if result is None:
+            return result
+        if setting.name.startswith('IS_'):
+            # Boolean
+            return result == 1
+        return result
+
+    def _load_bot_settings(self) -> Dict[BotSettingType, int]:
         with self.session_mgr() as session:
-            result = session.query(TableBotSetting).filter(TableBotSetting.setting_name == setting).one_or_none()
-            if result is None:
-                return result
-            if setting.name.startswith('IS_'):
-                # Boolean
-                return result.setting_int == 1
-            return result.setting_int
+            return {x.setting_name: x.setting_int for x in session.query(TableBotSetting).all()}
 
     def set_bot_setting(self, setting: BotSettingType, setting_val: Union[int, bool]):
-        """Attempts to set a given setting"""
+        """Attempts to set a given setting, writing through to the cache & letting other processes know"""
         with self.session_mgr() as session:
             session.query(TableBotSetting).filter(TableBotSetting.setting_name == setting).update(
                 {TableBotSetting.setting_int: setting_val}
             )
+        settings = self.settings_cache.get_or_load(self.SETTINGS_KEY, self._load_bot_settings).copy()
+        settings[setting] = int(setting_val)
+        self.settings_cache.set(self.SETTINGS_KEY, settings)
+        self.changes.publish(self.SETTINGS_KEY)
+
+    def get_user_from_hash(self, user_hash: str, is_cached: bool = True) -> Optional[TableSlackUser]:
+        """Takes in a slack user hash, outputs the expunged object, if any.
+
+        Cached objects are shared, so set is_cached=False when loading a user to change it
+        """
+        if not is_cached:
+            return self._load_user(TableSlackUser.slack_user_hash == user_hash)
+        return self.user_cache.get_or_load(
+            ('user', user_hash), lambda: self._load_user(TableSlackUser.slack_user_hash == user_hash))
 
-    def get_user_from_hash(self, user_hash: str) -> Optional[TableSlackUser]:
-        """Takes in a slack user hash, outputs the expunged object, if any"""
+    def get_user_from_bot_hash(self, bot_hash: str) -> Optional[TableSlackUser]:
+        """Takes in a slack bot hash, outputs the (cached) expunged object, if any"""
+        return self.user_cache.get_or_load(
+            ('bot', bot_hash), lambda: self._load_user(TableSlackUser.slack_bot_hash == bot_hash))
+
+    def _load_user(self, condition) -> Optional[TableSlackUser]:
         with self.session_mgr() as session:
-            user = session.query(TableSlackUser).filter(TableSlackUser.slack_user_hash == user_hash).one_or_none()
+            user = session.query(TableSlackUser).filter(condition).one_or_none()
             if user is not None:
                 session.expunge(user)
         return user
 
+    def invalidate_user(self, user: TableSlackUser):
+        """Drops a user from the user cache after it's been changed, and lets other processes know"""
+        self.user_cache.invalidate(('user', user.slack_user_hash))
+        if user.slack_bot_hash is not None:
+            self.user_cache.invalidate(('bot', user.slack_bot_hash))
+        self.changes.publish(self.USERS_KEY)
+
+    def get_users_from_hashes(self, user_hashes: Iterable[Optional[str]], names: Dict[str, str] = None,
+                              fallback_hash: Optional[str] = FALLBACK_BOT_HASH) -> \
+            Dict[Optional[str], Optional[TableSlackUser]]:
+        """Resolves many user/bot hashes to expunged user objects in a single query
+
+        Each hash is matched on slack_user_hash, then slack_bot_hash, then - for bot hashes (B...) that have
+        a name in `names` - on the user's real name. Anything still unmatched (including None hashes)
+        gets the user with the `fallback_hash` bot hash, if provided. The fallbacks happen in SQL,
+        the same way they do for pins (see resolve_user_key)
+
+        Args:
+            user_hashes: the user and/or bot hashes to resolve
+            names: optional mapping of bot hash to the name the bot posted under
+            fallback_hash: bot hash of the user to fall back to
+        """
+        user_hashes = list(dict.fromkeys(user_hashes))
+        names = {k: v.lower() for k, v in (names or {}).items() if k.startswith('B') and v is not None}
+        resolved = {}
+        if len(user_hashes) == 0:
+            return resolved
+        with self.session_mgr() as session:
+            for start in range(0, len(user_hashes), RESOLVE_CHUNK_SIZE):
+                rows = [
+                    select(literal(x, String).label('user_hash'), literal(names.get(x), String).label('name'))
+                    for x in user_hashes[start:start + RESOLVE_CHUNK_SIZE]
+                ]
+                hash_tbl = (rows[0] if len(rows) == 1 else union_all(*rows)).cte('hashes')
+                # Keys first, so the lookups don't get correlated with the users joined on after
+                keys = select(hash_tbl.c.user_hash, resolve_user_key(
+                    hash_tbl.c.user_hash, name=hash_tbl.c.name, fallback_hash=fallback_hash
+                ).label('user_key')).subquery()
+                resolved.update(session.query(keys.c.user_hash, TableSlackUser).outerjoin(
+                    TableSlackUser, TableSlackUser.user_id == keys.c.user_key
+                ).all())
+            session.expunge_all()
+        return resolved
+
     def get_channel_from_hash(self, channel_hash: str) -> Optional[TableSlackChannel]:
-        """Takes in a slack user hash, outputs the expunged object, if any"""
+        """Takes in a slack channel hash, outputs the expunged object, if any. Results are cached"""
+        return self.channel_cache.get_or_load(channel_hash, lambda: self._load_channel_from_hash(channel_hash))
+
+    def _load_channel_from_hash(self, channel_hash: str) -> Optional[TableSlackChannel]:
         with self.session_mgr() as session:
             channel = session.query(TableSlackChannel).\
                 filter(TableSlackChannel.slack_channel_hash == channel_hash).one_or_none()
@@ -59,8 +226,11 @@ class ViktorPSQLClient(PSQLClient):
                 session.expunge(channel)
         return channel
 
+    def invalidate_channel(self, channel_hash: str = None):
+        """Drops a channel (or all channels, if no hash is provided) from the channel cache"""
+        self.channel_cache.invalidate(channel_hash)
+
     def log_viktor_error_to_db(self, e: Exception, error_type: ErrorType, user_key: int = None,
                                channel_key: int = None):
-        """Logs error info to the service_error_log table"""
-        self.log_error_to_db(e=e, err_tbl=TableError, error_type=error_type, user_key=user_key,
-                             channel_key=channel_key)
+        """Queues error info for the error table. Doesn't block - the error sink writes it out in the background"""
+        self.error_sink.record(e=e, error_type=error_type, user_key=user_key, channel_key=channel_key)
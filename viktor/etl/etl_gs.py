@@ -1,21 +1,23 @@
 import re
 import sys
-import time
 from typing import (
     Dict,
     List,
 )
 
 from loguru import logger
-from slack.errors import SlackApiError
 from slacktools import (
     SecretStore,
     SlackTools,
 )
 from slacktools.gsheet import GSheetAgent
 
-from viktor.core.pin_collector import collect_pins
+from viktor.core.pin_collector import (
+    collect_pins_batch,
+    insert_quotes,
+)
 from viktor.db_eng import ViktorPSQLClient
+from viktor.etl.pin_backfill import PinBackfill
 from viktor.model import (
     AcronymType,
     Base,
@@ -28,6 +30,7 @@ from viktor.model import (
     TableError,
     TablePerk,
     TablePotentialEmoji,
+    TableProcessedEvent,
     TableQuote,
     TableResponse,
     TableSlackChannel,
@@ -47,6 +50,7 @@ class ETL:
         TableError,
         TablePerk,
         TablePotentialEmoji,
+        TableProcessedEvent,
         TableQuote,
         TableResponse,
         TableSlackChannel,
@@ -102,6 +106,7 @@ class ETL:
         with self.psql_client.session_mgr() as session:
             self.log.debug(f'Adding {len(bot_settings)} bot settings.')
             session.add_all(bot_settings)
+        self.psql_client.changes.publish(ViktorPSQLClient.SETTINGS_KEY)
 
     def etl_acronyms(self):
         self.log.debug('Working on acronyms...')
@@ -120,6 +125,7 @@ class ETL:
         with self.psql_client.session_mgr() as session:
             self.log.debug(f'Adding {len(acro_objs)} acronym entries...')
             session.add_all(acro_objs)
+        self.psql_client.changes.publish(ViktorPSQLClient.ACRONYMS_KEY)
 
     def etl_emojis(self):
         """ETL for emojis"""
@@ -170,6 +176,7 @@ class ETL:
         with self.psql_client.session_mgr() as session:
             self.log.debug(f'Adding {len(usr_tbls)} user details to table...')
             session.add_all(usr_tbls)
+        self.psql_client.changes.publish(ViktorPSQLClient.USERS_KEY)
 
     def etl_okr_perks(self):
         # Perks
@@ -257,6 +264,7 @@ class ETL:
         }
         self.log.debug('Working on facts...')
         self._parse_df('facts', tbl_name='facts', col_mapping=col_mapping)
+        self.psql_client.changes.publish(ViktorPSQLClient.RESPONSES_KEY)
 
         # UWU
         self.log.debug('Working on uwu_graphics...')
@@ -281,44 +289,33 @@ class ETL:
         with self.psql_client.session_mgr() as session:
             self.log.debug(f'Adding {len(channels)} channels...')
             session.add_all(channels)
+        self.psql_client.invalidate_channel()
+        self.psql_client.changes.publish(ViktorPSQLClient.CHANNELS_KEY)
 
     def etl_quotes(self):
         # Users
         self.log.debug('Working on quotes...')
         # First we get all the channels
-        channels = []
-        prev_len = 0
+        channel_ids = []
         channels_resp = self.st.bot.conversations_list(limit=1000, types='public_channel,private_channel')
         for ch in channels_resp.get('channels'):
-            self.log.debug(f'Adding {ch["name"]}')
-            channels.append({'id': ch['id'], 'name': ch['name']})
-        # Then we iterate through the channels and collect the pins
-        tbl_objs = []
-        for i, chan in enumerate(channels):
-            self.log.debug(f'Working on channel {i}/{len(channels)}')
-            c_name = chan['name']
-            if c_name.startswith('shitpost'):
+            if ch['name'].startswith('shitpost'):
                 continue
-            c_id = chan['id']
-            self.log.debug(f'Getting pins for channel: {c_name} ({c_id})')
-            try:
-                pins_resp = self.st.bot.pins_list(channel=c_id)
-            except SlackApiError as err:
-                # Check if the error is associated with not being in the channel
-                resp = err.response.get('error')
-                self.log.error(f'Received error response: {resp}')
-                pins_resp = {'items': []}
-            pins = pins_resp.get('items')
-            for pin in pins:
-                tbl_objs.append(collect_pins(pin, psql_client=self.psql_client, log=self.log))
-            # Wait so we don't exceed call limits
-            if prev_len < len(tbl_objs):
-                self.log.debug('Cooling off')
-                time.sleep(3)
-            prev_len = len(tbl_objs)
+            self.log.debug(f'Adding {ch["name"]}')
+            channel_ids.append(ch['id'])
+        # Then we collect the pins from all of them concurrently, as fast as the rate limit allows
+        backfill = PinBackfill(bot=self.st.bot, parent_log=self.log, calls_per_min=auto_config.PINS_LIST_PER_MIN,
+                               burst=auto_config.PINS_LIST_BURST, n_workers=auto_config.PIN_BACKFILL_WORKERS)
+        pin_objs = backfill.fetch(channel_ids)
+        # Convert them all at once, so users & channels get looked up in bulk
         with self.psql_client.session_mgr() as session:
-            session.add_all(tbl_objs)
-        self.log.debug(f'Added {len(tbl_objs)} pins')
+            tbl_objs = collect_pins_batch(pin_objs, psql_client=self.psql_client, log=self.log, is_event=False,
+                                          session=session)
+            # Pins that are already in the table are skipped
+            n_new = sum(insert_quotes(session, tbl_objs))
+        self.log.debug(f'Added {n_new} pins ({len(tbl_objs) - n_new} were already there)')
+        if n_new > 0:
+            self.psql_client.changes.publish(ViktorPSQLClient.QUOTES_KEY)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,281 @@
+"""
+Brings the tables, columns & indexes of an existing database in line with the ones declared on the models, then confirms
+that the hot queries are able to use them.
+
+Run with:
+    python3 -m viktor.etl.migrations --env dev [--check-only]
+"""
+import argparse
+from datetime import datetime
+import sys
+from typing import (
+    Dict,
+    List,
+    Tuple,
+)
+
+from loguru import logger
+from sqlalchemy import (
+    Column,
+    Index,
+    Table,
+    and_,
+    delete,
+    func,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.sql import Select
+
+from viktor.model import (
+    QUOTE_SEARCH_CONFIG,
+    QUOTE_TEXT_SEARCH_INDEX,
+    QUOTE_TEXT_VECTOR,
+    Base,
+    TableBotSetting,
+    TableEmoji,
+    TablePotentialEmoji,
+    TableQuote,
+    TableSlackUser,
+    TableSlackUserChangeLog,
+)
+
+# Representative versions of the queries on the hot & cron paths, along with the index each should be using
+HOT_QUERIES: Dict[str, Tuple[Select, str]] = {
+    'emoji_by_name': (
+        select(TableEmoji.emoji_id).where(TableEmoji.name == 'sheep'),
+        'ix_emoji_name'
+    ),
+    'new_emojis': (
+        select(TableEmoji.emoji_id).where(TableEmoji.created_date >= datetime(2022, 1, 1)),
+        'ix_emoji_created_date'
+    ),
+    'new_potential_emojis': (
+        select(TablePotentialEmoji.pot_emoji_id).where(TablePotentialEmoji.created_date >= datetime(2022, 1, 1)),
+        'ix_potential_emoji_created_date'
+    ),
+    'quote_by_identity': (
+        select(TableQuote.quote_id).where(TableQuote.message_timestamp == datetime(2022, 1, 1),
+                                          TableQuote.link == 'https://example.slack.com/archives/C1/p1'),
+        'uq_quote_message_timestamp_link'
+    ),
+    'latest_user_changelog': (
+        select(TableSlackUserChangeLog.user_change_id).where(TableSlackUserChangeLog.user_key == 1)
+        .order_by(TableSlackUserChangeLog.created_date.desc()).limit(1),
+        'ix_slack_user_change_log_user_key_created_date'
+    ),
+    'user_by_bot_hash': (
+        select(TableSlackUser.user_id).where(TableSlackUser.slack_bot_hash == 'BUNKNOWN'),
+        'ix_slack_user_slack_bot_hash'
+    ),
+    'bot_setting_by_name': (
+        select(TableBotSetting.setting_int).where(TableBotSetting.setting_name == 'IS_ANNOUNCE_STARTUP'),
+        'uq_bot_setting_setting_name'
+    ),
+}
+# Same as above, for the indexes that only exist on some dialects
+DIALECT_HOT_QUERIES: Dict[str, Dict[str, Tuple[Select, str]]] = {
+    'postgresql': {
+        'quote_search': (
+            select(TableQuote.quote_id).where(
+                QUOTE_TEXT_VECTOR.op('@@')(func.plainto_tsquery(QUOTE_SEARCH_CONFIG, 'sheep'))),
+            QUOTE_TEXT_SEARCH_INDEX.name
+        ),
+    },
+}
+
+
+def create_missing_tables(engine: Engine, log: logger) -> List[str]:
+    """Creates any of the declared tables that aren't in the db yet (e.g., processed_event)
+
+    Returns:
+        the full names of the tables created
+    """
+    inspector = inspect(engine)
+    missing = [x for x in Base.metadata.sorted_tables if not inspector.has_table(x.name, schema=x.schema)]
+    for tbl in missing:
+        log.info(f'Creating table {tbl.fullname}...')
+    Base.metadata.create_all(engine, tables=missing)
+    return [x.fullname for x in missing]
+
+
+def apply_column_migrations(engine: Engine, log: logger) -> List[str]:
+    """Adds any of the declared columns that are missing from the tables in the db
+
+    Returns:
+        the full names (table.column) of the columns added
+    """
+    added = []
+    inspector = inspect(engine)
+    for tbl in Base.metadata.sorted_tables:
+        if not inspector.has_table(tbl.name, schema=tbl.schema):
+            # New tables are left to create_missing_tables
+            continue
+        existing = {x['name'] for x in inspector.get_columns(tbl.name, schema=tbl.schema)}
+        for col in tbl.columns:
+            if col.name in existing:
+                continue
+            if not col.nullable and col.server_default is None:
+                log.error(f'Unable to add column {tbl.fullname}.{col.name}: it\'s NOT NULL without a server default.')
+                continue
+            log.info(f'Adding column {col.name} to {tbl.fullname}...')
+            with engine.begin() as conn:
+                conn.exec_driver_sql(f'ALTER TABLE {tbl.fullname} ADD COLUMN '
+                                     f'{CreateColumn(col).compile(dialect=engine.dialect)}')
+            added.append(f'{tbl.fullname}.{col.name}')
+    return added
+
+
+# Indexes that were replaced by a declared one. Dropped once their replacement exists
+SUPERSEDED_INDEXES: Dict[str, str] = {
+    # old name: replacement
+    'ix_quote_message_timestamp_link': 'uq_quote_message_timestamp_link',
+}
+
+
+# Indexes declared outside of the tables, as they're only created on these dialects
+DIALECT_INDEXES: Dict[str, List[Index]] = {
+    'postgresql': [QUOTE_TEXT_SEARCH_INDEX],
+}
+
+
+# Unique indexes whose duplicates can be cleared out before they're created, keeping the row with the lowest of
+#   this column. The quote key is what pins get inserted against with ON CONFLICT, which fails without it
+DEDUPE_BEFORE_CREATE: Dict[str, Column] = {
+    'uq_quote_message_timestamp_link': TableQuote.quote_id,
+}
+
+
+def get_declared_indexes(dialect: str = None) -> List[Index]:
+    """The indexes declared on the tables, plus those declared for the dialect, if one's given"""
+    return [idx for tbl in Base.metadata.sorted_tables for idx in sorted(tbl.indexes, key=lambda x: x.name)] + \
+        DIALECT_INDEXES.get(dialect, [])
+
+
+def _has_duplicates(engine: Engine, index: Index) -> bool:
+    cols = list(index.columns)
+    with engine.connect() as conn:
+        dupes = conn.execute(
+            # NULLs never clash in a unique index
+            select(*cols, func.count()).where(and_(*[x.isnot(None) for x in cols])).group_by(*cols)
+            .having(func.count() > 1).limit(1)
+        ).first()
+    return dupes is not None
+
+
+def _delete_duplicates(engine: Engine, index: Index, keep_col: Column) -> int:
+    """Deletes all but the first (lowest keep_col) of each set of rows with the same values for the index
+
+    Returns:
+        the number of rows deleted
+    """
+    cols = list(index.columns)
+    not_null = and_(*[x.isnot(None) for x in cols])
+    keep = select(func.min(keep_col)).where(not_null).group_by(*cols)
+    with engine.begin() as conn:
+        return conn.execute(delete(index.table).where(not_null, keep_col.notin_(keep))).rowcount
+
+
+def _is_existing(engine: Engine, table: Table, index_name: str) -> bool:
+    """Whether the index exists, looked up by name in the catalog. The dialect's has_index can't be relied on
+    here, as on Postgres it leaves out the indexes on expressions (e.g., the full-text one)
+    """
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            stmt = text('SELECT 1 FROM pg_indexes WHERE schemaname = :schema AND indexname = :name')
+            params = {'schema': table.schema or 'public', 'name': index_name}
+        elif engine.dialect.name == 'sqlite':
+            schema = table.schema or 'main'
+            stmt = text(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'index' AND name = :name")
+            params = {'name': index_name}
+        else:
+            return engine.dialect.has_index(conn, table.name, index_name, schema=table.schema)
+        return conn.execute(stmt, params).first() is not None
+
+
+def apply_index_migrations(engine: Engine, log: logger) -> List[str]:
+    """Creates any of the declared indexes that are missing from the db, then drops the ones they superseded
+
+    Returns:
+        the names of the indexes created
+    """
+    created = []
+    declared = {}
+    for index in get_declared_indexes(engine.dialect.name):
+        declared[index.name] = index
+        if _is_existing(engine, index.table, index.name):
+            log.debug(f'Index {index.name} already exists')
+            continue
+        if index.unique and index.name in DEDUPE_BEFORE_CREATE and _has_duplicates(engine, index):
+            n_deleted = _delete_duplicates(engine, index, keep_col=DEDUPE_BEFORE_CREATE[index.name])
+            log.warning(f'Deleted {n_deleted} duplicate rows from {index.table.fullname} '
+                        f'before creating {index.name}')
+        if index.unique and _has_duplicates(engine, index):
+            log.error(f'Unable to create unique index {index.name}: {index.table.fullname} has duplicate '
+                      f'values for {[x.name for x in index.columns]}. Clean those up first.')
+            continue
+        log.info(f'Creating index {index.name} on {index.table.fullname}...')
+        index.create(bind=engine)
+        created.append(index.name)
+
+    for old_name, new_name in SUPERSEDED_INDEXES.items():
+        table = declared[new_name].table
+        if _is_existing(engine, table, old_name) and _is_existing(engine, table, new_name):
+            log.info(f'Dropping index {old_name}, superseded by {new_name}...')
+            with engine.begin() as conn:
+                conn.exec_driver_sql(f'DROP INDEX {table.schema}.{old_name}')
+    return created
+
+
+def explain(engine: Engine, stmt: Select) -> str:
+    """Returns the query plan for the statement as a single string"""
+    compiled = stmt.compile(dialect=engine.dialect)
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[x] for x in compiled.positiontup)
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            with conn.begin():
+                # Small tables would always get a seq scan. We're after whether the index can be used at all
+                conn.exec_driver_sql('SET LOCAL enable_seqscan = off')
+                rows = conn.exec_driver_sql(f'EXPLAIN {compiled}', params).all()
+            return '\n'.join(x[0] for x in rows)
+        rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).all()
+        return '\n'.join(x[-1] for x in rows)
+
+
+def check_hot_queries(engine: Engine, log: logger) -> Dict[str, bool]:
+    """Confirms each of the hot queries gets planned with an index scan on its index"""
+    results = {}
+    for name, (stmt, index_name) in {**HOT_QUERIES, **DIALECT_HOT_QUERIES.get(engine.dialect.name, {})}.items():
+        plan = explain(engine, stmt)
+        results[name] = index_name in plan
+        if results[name]:
+            log.info(f'{name}: uses {index_name}')
+        else:
+            log.warning(f'{name}: does NOT use {index_name}. Plan:\n{plan}')
+    return results
+
+
+if __name__ == '__main__':
+    from slacktools import SecretStore
+
+    from viktor.db_eng import ViktorPSQLClient
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--env', default='dev')
+    parser.add_argument('--check-only', action='store_true', help='only run the EXPLAIN check')
+    args = parser.parse_args()
+
+    credstore = SecretStore('secretprops-davaiops.kdbx')
+    psql_client = ViktorPSQLClient(props=credstore.get_entry(f'davaidb-{args.env}').custom_properties,
+                                   parent_log=logger)
+    if not args.check_only:
+        create_missing_tables(psql_client.engine, log=logger)
+        apply_column_migrations(psql_client.engine, log=logger)
+        apply_index_migrations(psql_client.engine, log=logger)
+    results = check_hot_queries(psql_client.engine, log=logger)
+    sys.exit(0 if all(results.values()) else 1)
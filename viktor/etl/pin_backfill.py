@@ -0,0 +1,101 @@
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    as_completed,
+)
+import threading
+import time
+from typing import (
+    Dict,
+    List,
+)
+
+from loguru import logger
+from slack.errors import SlackApiError
+from slacktools.api.web.pins import PinApiObject
+
+from viktor.core.token_bucket import TokenBucket
+
+
+def get_retry_after(headers: Dict, default: float = 1) -> float:
+    """Reads Retry-After from a response's headers. The name's looked up ignoring case, as transports differ"""
+    for name, value in (headers or {}).items():
+        if name.lower() == 'retry-after':
+            # Some transports keep every header's values in a list
+            return float(value[0] if isinstance(value, (list, tuple)) else value)
+    return default
+
+
+class PinBackfill:
+    """Fetches the pins for many channels concurrently, as fast as Slack's rate limit for pins.list allows.
+
+    Calls are paced by a token bucket sized to the method's tier. If Slack still answers with a 429, every
+    worker holds off for the Retry-After it gave before the call is retried.
+    """
+
+    def __init__(self, bot, parent_log: logger, calls_per_min: float = 20, burst: int = 3, n_workers: int = 4,
+                 max_retries: int = 5, bucket: TokenBucket = None):
+        """
+        Args:
+            bot: the Slack web client (e.g., SlackTools.bot)
+            calls_per_min: the rate limit of the pins.list tier
+            burst: the number of calls that can go out back to back
+            n_workers: the number of concurrent calls
+            max_retries: the number of times to retry a channel that keeps getting rate-limited
+        """
+        self.bot = bot
+        self.log = parent_log.bind(child_name=self.__class__.__name__)
+        self.bucket = TokenBucket.per_minute(calls_per_min, capacity=burst) if bucket is None else bucket
+        self.n_workers = n_workers
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self.n_calls = 0
+        self.n_rate_limited = 0
+        self.n_failed = 0
+
+    def _get_pins(self, channel_id: str) -> List[Dict]:
+        for _ in range(self.max_retries + 1):
+            self.bucket.acquire()
+            with self._lock:
+                self.n_calls += 1
+            try:
+                return self.bot.pins_list(channel=channel_id).get('items', [])
+            except SlackApiError as err:
+                if getattr(err.response, 'status_code', None) != 429:
+                    # e.g., not in the channel
+                    self.log.error(f'Unable to get pins for {channel_id}: {err.response.get("error")}')
+                    break
+                retry_after = get_retry_after(err.response.headers)
+                self.log.warning(f'Rate limited getting pins for {channel_id}. Retrying in {retry_after}s')
+                with self._lock:
+                    self.n_rate_limited += 1
+                self.bucket.pause(retry_after)
+        else:
+            self.log.error(f'Gave up on pins for {channel_id} after {self.max_retries} retries')
+        with self._lock:
+            self.n_failed += 1
+        return []
+
+    def fetch(self, channel_ids: List[str]) -> List[PinApiObject]:
+        """Fetches all the pins in the channels, logging progress as channels finish"""
+        start = time.perf_counter()
+        pin_objs = []
+        with ThreadPoolExecutor(max_workers=self.n_workers, thread_name_prefix='pin-backfill') as executor:
+            futures = {executor.submit(self._get_pins, x): x for x in channel_ids}
+            for i, future in enumerate(as_completed(futures), start=1):
+                pin_objs += [PinApiObject(x) for x in future.result()]
+                elapsed = time.perf_counter() - start
+                self.log.debug(f'Got pins for {i}/{len(channel_ids)} channels ({len(pin_objs)} pins) - '
+                               f'{i / elapsed:.2f} channels/s')
+        elapsed = time.perf_counter() - start
+        self.log.info(f'Fetched {len(pin_objs)} pins from {len(channel_ids)} channels in {elapsed:.1f}s '
+                      f'({self.n_calls} calls, {self.n_rate_limited} rate limited, {self.n_failed} channels failed)')
+        return pin_objs
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'calls': self.n_calls,
+                'rate_limited': self.n_rate_limited,
+                'failed': self.n_failed,
+                **self.bucket.get_stats(),
+            }
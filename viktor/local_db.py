@@ -0,0 +1,159 @@
+"""
+A local SQLite stand-in for the Postgres db, for profiling & load testing the db-heavy paths on a dev box.
+
+The models all live in the `viktor` schema, so a database is attached under that name - schema-qualified
+tables (and raw SQL) then work unchanged. Point the app at one by setting VIKTOR_LOCAL_DB (a file path,
+or ':memory:'), or build a client directly:
+
+    eng = ViktorPSQLClient(props={}, parent_log=logger, engine=seed_local_db(make_local_engine()))
+
+To make a seeded file:
+    python3 -m viktor.local_db viktor-local.db --users 200 --quotes 5000
+"""
+import argparse
+from datetime import (
+    datetime,
+    timedelta,
+)
+from pathlib import Path
+import random
+import string
+from typing import (
+    Dict,
+    Union,
+)
+
+from sqlalchemy import (
+    create_engine,
+    event,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from viktor.model import (
+    AcronymType,
+    Base,
+    BotSettingType,
+    ResponseCategory,
+    ResponseType,
+    TableAcronym,
+    TableBotSetting,
+    TableEmoji,
+    TableQuote,
+    TableResponse,
+    TableSlackChannel,
+    TableSlackUser,
+)
+
+MEMORY = ':memory:'
+# Number of stages the insults, compliments & phrases are built from
+STAGED_RESPONSES: Dict[ResponseType, int] = {
+    ResponseType.INSULT: 3,
+    ResponseType.COMPLIMENT: 3,
+    ResponseType.PHRASE: 4,
+}
+
+
+def make_local_engine(db_path: Union[str, Path] = None) -> Engine:
+    """Makes a SQLite engine with the `viktor` schema attached and all the tables created
+
+    Args:
+        db_path: the file holding the `viktor` schema. Defaults to in-memory, which is shared by
+            every thread (and lost once the engine's disposed)
+    """
+    db_path = MEMORY if db_path is None else str(db_path)
+    kwargs = {'poolclass': StaticPool} if db_path == MEMORY else {}
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, **kwargs)
+
+    @event.listens_for(engine, 'connect')
+    def attach_schema(dbapi_conn, conn_record):
+        dbapi_conn.execute(f"ATTACH DATABASE '{db_path}' AS viktor")
+
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def _random_word(rng: random.Random, n_chars: int = 8) -> str:
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(n_chars))
+
+
+def seed_local_db(engine: Engine, n_users: int = 50, n_channels: int = 10, n_emojis: int = 500,
+                  n_words: int = 200, n_quotes: int = 500, seed: int = None) -> Engine:
+    """Fills the db with enough made-up data for the handlers, crons & phrase generation to have something to chew on
+
+    Always includes the 'unknown' user (UUNKNOWN/BUNKNOWN) that unresolvable pins fall back to, and a channel
+    with the hash CBENCH.
+
+    Args:
+        engine: the engine to seed
+        n_users: number of users, with hashes U0000, U0001, ...
+        n_channels: number of channels besides CBENCH, with hashes C0000, C0001, ...
+        n_emojis: number of emojis, named emoji-0, emoji-1, ...
+        n_words: number of words per stage for the staged responses, and per type for the other responses
+            & acronym words
+        n_quotes: number of quotes, spread across the users & channels
+        seed: makes the data reproducible
+    """
+    rng = random.Random(seed)
+    session = sessionmaker(bind=engine)()
+    session.add_all([TableBotSetting(setting_name=x, setting_int=0) for x in BotSettingType])
+    session.add_all([TableEmoji(name=f'emoji-{i}') for i in range(n_emojis)])
+    channels = [TableSlackChannel(slack_channel_hash='CBENCH', channel_name='bench')] + \
+        [TableSlackChannel(slack_channel_hash=f'C{i:04d}', channel_name=f'channel-{i}') for i in range(n_channels)]
+    users = [TableSlackUser(slack_user_hash='UUNKNOWN', slack_bot_hash='BUNKNOWN', real_name='abot',
+                            display_name='a-bot')] + \
+        [TableSlackUser(slack_user_hash=f'U{i:04d}', real_name=f'user {i}', display_name=f'user-{i}',
+                        status_emoji=f':emoji-{i % max(n_emojis, 1)}:', status_title=_random_word(rng))
+         for i in range(n_users)]
+    session.add_all(channels + users)
+    for resp_type, n_stages in STAGED_RESPONSES.items():
+        session.add_all([
+            TableResponse(response_type=resp_type, category=ResponseCategory.STANDARD, text=_random_word(rng),
+                          stage=stage)
+            for stage in range(1, n_stages + 1) for _ in range(n_words)
+        ])
+    for resp_type, category in [(ResponseType.GENERAL, ResponseCategory.SARCASTIC),
+                                (ResponseType.FACT, ResponseCategory.STANDARD),
+                                (ResponseType.FACT, ResponseCategory.FOILHAT)]:
+        session.add_all([
+            TableResponse(response_type=resp_type, category=category,
+                          text=' '.join(_random_word(rng) for _ in range(6)))
+            for _ in range(n_words)
+        ])
+    session.add_all([TableAcronym(acro_type=x, text=_random_word(rng)) for x in AcronymType for _ in range(n_words)])
+    session.flush()
+
+    start = datetime(2022, 1, 1)
+    quotes = []
+    for i in range(n_quotes):
+        ts = start + timedelta(minutes=i)
+        channel = rng.choice(channels)
+        quotes.append(TableQuote(
+            text=' '.join(_random_word(rng) for _ in range(rng.randint(3, 20))), message_timestamp=ts,
+            pin_timestamp=ts + timedelta(hours=1), is_quotable=True,
+            link=f'https://example.slack.com/archives/{channel.slack_channel_hash}/p{int(ts.timestamp() * 1e6)}',
+            author_user_key=rng.choice(users).user_id, pinner_user_key=rng.choice(users).user_id,
+            channel_key=channel.channel_id
+        ))
+    session.add_all(quotes)
+    session.commit()
+    session.close()
+    return engine
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', type=Path, help='the db file to make')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--channels', type=int, default=10)
+    parser.add_argument('--emojis', type=int, default=500)
+    parser.add_argument('--words', type=int, default=200)
+    parser.add_argument('--quotes', type=int, default=500)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    if args.path.exists():
+        parser.error(f'{args.path} already exists')
+    seed_local_db(make_local_engine(args.path), n_users=args.users, n_channels=args.channels, n_emojis=args.emojis,
+                  n_words=args.words, n_quotes=args.quotes, seed=args.seed)
+    print(f'Seeded {args.path}')
@@ -12,7 +12,11 @@ from .error import (
     ErrorType,
     TableError,
 )
+from .event import TableProcessedEvent
 from .okr import (
+    QUOTE_SEARCH_CONFIG,
+    QUOTE_TEXT_SEARCH_INDEX,
+    QUOTE_TEXT_VECTOR,
     TablePerk,
     TableQuote,
 )
@@ -5,6 +5,7 @@ from sqlalchemy import (
     VARCHAR,
     Boolean,
     Column,
+    Index,
     Integer,
 )
 
@@ -28,6 +29,11 @@ class TableEmoji(Base):
         return f'<TableEmoji(name={self.name}, is_react_denylisted={self.is_react_denylisted})>'
 
 
+# Names aren't unique - an emoji that gets removed and then re-added gets a new row
+Index('ix_emoji_name', TableEmoji.name)
+Index('ix_emoji_created_date', TableEmoji.created_date)
+
+
 class TablePotentialEmoji(Base):
     """potential_emoji table - stores emojis found by scraping slackmojis"""
 
@@ -45,3 +51,6 @@ class TablePotentialEmoji(Base):
 
     def __repr__(self) -> str:
         return f'<TablePotentialEmoji(name={self.name}, uploaded={self.upload_timestamp})>'
+
+
+Index('ix_potential_emoji_created_date', TablePotentialEmoji.created_date)
@@ -7,6 +7,7 @@ from sqlalchemy import (
     Enum,
     ForeignKey,
     Integer,
+    text,
 )
 
 # local imports
@@ -25,18 +26,24 @@ class TableError(Base):
     error_class = Column(VARCHAR(150), nullable=False)
     error_text = Column(VARCHAR(255), nullable=False)
     error_traceback = Column(TEXT)
+    # Repeats of the same error are folded into one row. See viktor.core.error_sink
+    fingerprint = Column(VARCHAR(40))
+    occurrence_count = Column(Integer, default=1, server_default=text('1'), nullable=False)
 
     user_key = Column(ForeignKey('viktor.slack_user.user_id'))
     channel_key = Column(ForeignKey('viktor.slack_channel.channel_id'))
 
     def __init__(self, error_type: ErrorType, error_class: str, error_text: str, error_traceback: str = None,
-                 user_key: int = None, channel_key: int = None):
+                 user_key: int = None, channel_key: int = None, fingerprint: str = None,
+                 occurrence_count: int = 1):
         self.error_type = error_type
         self.error_class = error_class
         self.error_text = error_text
         self.error_traceback = error_traceback
         self.user_key = user_key
         self.channel_key = channel_key
+        self.fingerprint = fingerprint
+        self.occurrence_count = occurrence_count
 
     def __repr__(self) -> str:
         return f'<TableError(type={self.error_type.name} class={self.error_class}, text={self.error_text[:20]})>'
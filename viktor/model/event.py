@@ -0,0 +1,25 @@
+from sqlalchemy import (
+    VARCHAR,
+    Column,
+    Integer,
+)
+
+# local imports
+from viktor.model.base import Base
+
+
+class TableProcessedEvent(Base):
+    """processed_event table - Events API event_ids that have already been handled, for de-duplicating retries"""
+
+    processed_event_id = Column(Integer, primary_key=True, autoincrement=True)
+    event_id = Column(VARCHAR(50), nullable=False, unique=True)
+    event_type = Column(VARCHAR(50))
+    retry_num = Column(Integer, default=0, nullable=False)
+
+    def __init__(self, event_id: str, event_type: str = None, retry_num: int = 0):
+        self.event_id = event_id
+        self.event_type = event_type
+        self.retry_num = retry_num
+
+    def __repr__(self) -> str:
+        return f'<TableProcessedEvent(event_id={self.event_id}, type={self.event_type})>'
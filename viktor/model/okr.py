@@ -7,9 +7,13 @@ from sqlalchemy import (
     Boolean,
     Column,
     ForeignKey,
+    Index,
     Integer,
+    event,
+    func,
 )
 from sqlalchemy.orm import relationship
+from sqlalchemy.schema import CreateIndex
 
 # local imports
 from viktor.model.base import Base
@@ -63,3 +67,17 @@ class TableQuote(Base):
     def __repr__(self) -> str:
         return f'<TableQuote(is_quotable={self.is_quotable}, text={self.text[:10]}, ' \
                f'message_ts={self.message_timestamp}, pin_ts={self.pin_timestamp})>'
+
+
+# A quote's identity. Pins are inserted with ON CONFLICT against this (see viktor.core.pin_collector.insert_quotes)
+Index('uq_quote_message_timestamp_link', TableQuote.message_timestamp, TableQuote.link, unique=True)
+
+# Full-text search over the text (see viktor.core.quote_search). GIN & to_tsvector only exist in Postgres, so
+#   this one's kept out of create_all and only created alongside the table there. Searches need to match on this
+#   same expression for the index to be used
+QUOTE_SEARCH_CONFIG = 'english'
+QUOTE_TEXT_VECTOR = func.to_tsvector(QUOTE_SEARCH_CONFIG, TableQuote.text)
+QUOTE_TEXT_SEARCH_INDEX = Index('ix_quote_text_search', QUOTE_TEXT_VECTOR, postgresql_using='gin')
+TableQuote.__table__.indexes.discard(QUOTE_TEXT_SEARCH_INDEX)
+event.listen(TableQuote.__table__, 'after_create',
+             CreateIndex(QUOTE_TEXT_SEARCH_INDEX).execute_if(dialect='postgresql'))
@@ -3,6 +3,7 @@ import enum
 from sqlalchemy import (
     Column,
     Enum,
+    Index,
     Integer,
 )
 
@@ -33,3 +34,6 @@ class TableBotSetting(Base):
 
     def __repr__(self) -> str:
         return f'<TableBotSetting(name={self.setting_name.name}, val={self.setting_int})>'
+
+
+Index('uq_bot_setting_setting_name', TableBotSetting.setting_name, unique=True)
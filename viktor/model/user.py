@@ -5,7 +5,9 @@ from sqlalchemy import (
     Column,
     Float,
     ForeignKey,
+    Index,
     Integer,
+    true,
 )
 from sqlalchemy.orm import relationship
 
@@ -66,8 +68,15 @@ class TableSlackUser(Base):
                f'ltits={self.ltits})>'
 
 
+Index('ix_slack_user_slack_bot_hash', TableSlackUser.slack_bot_hash)
+
+
 class TableSlackUserChangeLog(Base):
-    """slack_user_change_log - to store when a user's info changes"""
+    """slack_user_change_log - to store when a user's info changes
+
+    Full snapshots hold every tracked attribute. The entries between them only hold the attributes that changed
+    (listed in changed_attrs), with the rest left NULL. See viktor.core.user_changes.reconstruct_profiles
+    """
 
     user_change_id = Column(Integer, primary_key=True, autoincrement=True)
     user_key = Column(Integer, ForeignKey('viktor.slack_user.user_id'), nullable=False)
@@ -80,6 +89,9 @@ class TableSlackUserChangeLog(Base):
     role_title = Column(TEXT)
     role_desc = Column(TEXT)
     avatar_link = Column(VARCHAR(255))
+    is_full_snapshot = Column(Boolean, default=True, server_default=true(), nullable=False)
+    # Comma-separated names of the attributes stored in a sparse entry. NULL for full snapshots
+    changed_attrs = Column(VARCHAR(255))
 
     def __init__(self, real_name: str = None, display_name: str = None, status_title: str = None,
                  status_emoji: str = None, role_title: str = None,
@@ -98,4 +110,9 @@ class TableSlackUserChangeLog(Base):
 
     def __repr__(self) -> str:
         return f'<TableSlackUserChangeLog(name={self.real_name}, display_name={self.display_name}, ' \
-               f'status={self.status_title[:20]})>'
+               f'status={(self.status_title or "")[:20]}, changed={self.changed_attrs})>'
+
+
+# Serves the "latest changelog entry for a user" lookups
+Index('ix_slack_user_change_log_user_key_created_date', TableSlackUserChangeLog.user_key,
+      TableSlackUserChangeLog.created_date)
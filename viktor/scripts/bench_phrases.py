@@ -0,0 +1,107 @@
+"""
+Compares the word selection for insults, compliments and phrases between the old approach - a
+`row_number() OVER (PARTITION BY stage ORDER BY random())` query on every command - and the precompiled
+staged word lists in the ResponseIndex.
+
+The db is the local SQLite stand-in (viktor.local_db), seeded with a configurable number of words per stage.
+
+Usage:
+    python -m viktor.scripts.bench_phrases --words 2000 --iterations 500 -n 3
+"""
+import argparse
+import sys
+import time
+from typing import (
+    Callable,
+    List,
+)
+
+from loguru import logger
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.sql import (
+    and_,
+    func,
+)
+
+from viktor.core.response_index import ResponseIndex
+from viktor.db_eng import ViktorPSQLClient
+from viktor.local_db import (
+    STAGED_RESPONSES,
+    make_local_engine,
+    seed_local_db,
+)
+from viktor.model import (
+    ResponseCategory,
+    ResponseType,
+    TableResponse,
+)
+from viktor.scripts.bench_replay import StatementCounter
+
+
+def legacy_sample_staged(eng: ViktorPSQLClient, resp_type: ResponseType, category: ResponseCategory,
+                         n: int) -> List[List[str]]:
+    """The word selection as it was done before the staged word lists"""
+    with eng.session_mgr() as session:
+        subq = session.query(
+            TableResponse.text,
+            func.row_number().over(partition_by=TableResponse.stage, order_by=func.random()).label('row_no')
+        ).filter(and_(
+            TableResponse.type == resp_type,
+            TableResponse.category == category
+        )).subquery()
+        words = session.query(subq).filter(and_(
+            subq.c.row_no <= n
+        )).all()
+    word_dict = {}
+    for word in words:
+        word_dict.setdefault(word.row_no, []).append(word.text)
+    return list(word_dict.values())
+
+
+def time_calls(func_: Callable, counter: StatementCounter, n_iterations: int):
+    counter.reset_thread()
+    latencies = []
+    for _ in range(n_iterations):
+        start = time.perf_counter()
+        func_()
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000, counter.thread_count / n_iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--words', type=int, default=1000, help='words to seed per stage')
+    parser.add_argument('--iterations', type=int, default=500, help='calls to time per command')
+    parser.add_argument('-n', type=int, default=1, help='word lists to draw per call (the -n flag)')
+    args = parser.parse_args()
+    logger.configure(handlers=[{'sink': sys.stderr, 'level': 'WARNING'}])
+
+    counter = StatementCounter()
+    engine = seed_local_db(make_local_engine(), n_words=args.words)
+    event.listen(engine, 'before_cursor_execute', counter)
+    eng = ViktorPSQLClient(props={}, parent_log=logger, engine=engine)
+    index = ResponseIndex(eng=eng)
+    start = time.perf_counter()
+    index.load()
+    print(f'\nPrecompiled {index.get_stats()["size"]} responses in {time.perf_counter() - start:.3f}s\n')
+
+    header = f'{"command":<12}{"approach":<10}{"mean ms":>10}{"p50 ms":>10}{"p95 ms":>10}{"stmts/call":>12}'
+    print(header)
+    print('-' * len(header))
+    for resp_type in STAGED_RESPONSES.keys():
+        results = {}
+        for name, func_ in {
+            'legacy': lambda: legacy_sample_staged(eng, resp_type, ResponseCategory.STANDARD, n=args.n),
+            'staged': lambda: index.sample_staged(resp_type, ResponseCategory.STANDARD, n=args.n),
+        }.items():
+            latencies, stmts = time_calls(func_, counter, n_iterations=args.iterations)
+            results[name] = latencies.mean()
+            p50, p95 = np.percentile(latencies, [50, 95])
+            print(f'{resp_type.name.lower():<12}{name:<10}{latencies.mean():>10.3f}{p50:>10.3f}{p95:>10.3f}'
+                  f'{stmts:>12.2f}')
+        print(f'{"":<12}{"speedup":<10}{results["legacy"] / results["staged"]:>9.0f}x')
+
+
+if __name__ == '__main__':
+    main()
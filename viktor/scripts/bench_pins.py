@@ -0,0 +1,146 @@
+"""
+Compares the per-pin db time of resolving a pin's author, pinner & channel between the old approach - up to five
+queries over three sessions for every pin - and the single joined query in viktor.core.pin_collector, both pin by
+pin (as the pin_added event does) and in one batch (as the quote ETL does).
+
+Runs against the local SQLite stand-in (viktor.local_db). A share of the pins come from bots known only by the name
+they posted under, or from users that aren't in the db at all, so the fallbacks get exercised too. SQLite has no
+network round trip, so --rtt-ms adds one to every statement to stand in for the trip to Postgres.
+
+Usage:
+    python -m viktor.scripts.bench_pins --pins 1000 --users 500 --rtt-ms 0.5
+"""
+import argparse
+import random
+import sys
+import time
+from types import SimpleNamespace
+from typing import (
+    List,
+    Optional,
+    Tuple,
+)
+
+from loguru import logger
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.sql import (
+    func,
+    or_,
+)
+
+from viktor.core.pin_collector import (
+    collect_pins,
+    collect_pins_batch,
+)
+from viktor.db_eng import ViktorPSQLClient
+from viktor.local_db import (
+    make_local_engine,
+    seed_local_db,
+)
+from viktor.model import (
+    TableSlackChannel,
+    TableSlackUser,
+)
+from viktor.scripts.bench_replay import StatementCounter
+
+
+def make_pins(n_pins: int, n_users: int, n_channels: int, seed: int = 0) -> List[SimpleNamespace]:
+    """Makes pins shaped like the web API's, with the odd unknown author, pinner or channel thrown in"""
+    rng = random.Random(seed)
+    pins = []
+    for i in range(n_pins):
+        roll = rng.random()
+        author, bot_id, username = f'U{rng.randrange(n_users):04d}', None, None
+        if roll < 0.1:
+            # Bot that's only known by the name it posted under
+            author, bot_id, username = None, f'B{i:06d}', f'user {rng.randrange(n_users)}'
+        elif roll < 0.15:
+            author = f'UGONE{i}'
+        pins.append(SimpleNamespace(
+            created_by=f'U{rng.randrange(n_users):04d}' if roll > 0.02 else f'UGONE{i}',
+            created=1650000000 + i,
+            message=SimpleNamespace(user=author, bot_id=bot_id, username=username,
+                                    channel=f'C{rng.randrange(n_channels + 1):04d}', text=f'pin {i}', files=None,
+                                    permalink=f'https://example.slack.com/archives/C0000/p{i}',
+                                    ts=f'{1650000000 + i}.000100')
+        ))
+    return pins
+
+
+def legacy_resolve_pin_keys(eng: ViktorPSQLClient, pin) -> Tuple[int, Optional[int], Optional[int]]:
+    """Resolves the keys the way collect_pins used to, before the single query"""
+    pin_item = pin.message
+    author_uid = pin_item.user if pin_item.user is not None else pin_item.bot_id
+    with eng.session_mgr() as session:
+        author = session.query(TableSlackUser).filter(or_(
+            TableSlackUser.slack_user_hash == author_uid,
+            TableSlackUser.slack_bot_hash == author_uid
+        )).one_or_none()
+        if author is None and author_uid.startswith('B') and pin_item.username is not None:
+            author = session.query(TableSlackUser).filter(
+                func.lower(TableSlackUser.real_name) == pin_item.username.lower()
+            ).first()
+        if author is None:
+            author = session.query(TableSlackUser).filter(TableSlackUser.slack_bot_hash == 'BUNKNOWN').one_or_none()
+        session.expunge(author)
+    with eng.session_mgr() as session:
+        pinner = session.query(TableSlackUser).filter(
+            TableSlackUser.slack_user_hash == pin.created_by
+        ).one_or_none()
+        if pinner is None:
+            pinner = session.query(TableSlackUser).filter(TableSlackUser.slack_bot_hash == 'BUNKNOWN').one_or_none()
+        session.expunge(pinner)
+    with eng.session_mgr() as session:
+        channel_key = session.query(TableSlackChannel.channel_id).filter(
+            TableSlackChannel.slack_channel_hash == pin_item.channel
+        ).scalar()
+    return author.user_id, pinner.user_id if pinner is not None else None, channel_key
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pins', type=int, default=1000, help='pins to resolve')
+    parser.add_argument('--users', type=int, default=500, help='users to seed')
+    parser.add_argument('--channels', type=int, default=50, help='channels to seed')
+    parser.add_argument('--rtt-ms', type=float, default=0.5, help='simulated round trip per statement')
+    args = parser.parse_args()
+    logger.configure(handlers=[{'sink': sys.stderr, 'level': 'WARNING'}])
+
+    counter = StatementCounter()
+    engine = seed_local_db(make_local_engine(), n_users=args.users, n_channels=args.channels, n_quotes=0)
+    event.listen(engine, 'before_cursor_execute', counter)
+    if args.rtt_ms > 0:
+        event.listen(engine, 'before_cursor_execute', lambda *x: time.sleep(args.rtt_ms / 1000))
+    eng = ViktorPSQLClient(props={}, parent_log=logger, engine=engine)
+    pins = make_pins(args.pins, n_users=args.users, n_channels=args.channels)
+
+    header = f'{"approach":<12}{"ms/pin":>10}{"p50 ms":>10}{"p95 ms":>10}{"stmts/pin":>11}'
+    print(f'\n{header}\n{"-" * len(header)}')
+    results = {}
+    for name, func_ in {
+        'legacy': lambda x: legacy_resolve_pin_keys(eng, x),
+        'per-event': lambda x: collect_pins(x, psql_client=eng, log=logger, is_event=False),
+    }.items():
+        counter.reset_thread()
+        latencies = []
+        for pin in pins:
+            start = time.perf_counter()
+            func_(pin)
+            latencies.append(time.perf_counter() - start)
+        latencies = np.array(latencies) * 1000
+        results[name] = latencies.mean()
+        p50, p95 = np.percentile(latencies, [50, 95])
+        print(f'{name:<12}{latencies.mean():>10.3f}{p50:>10.3f}{p95:>10.3f}{counter.thread_count / len(pins):>11.3f}')
+
+    counter.reset_thread()
+    start = time.perf_counter()
+    collect_pins_batch(pins, psql_client=eng, log=logger, is_event=False)
+    results['batch'] = (time.perf_counter() - start) * 1000 / len(pins)
+    print(f'{"batch":<12}{results["batch"]:>10.3f}{"":>10}{"":>10}{counter.thread_count / len(pins):>11.3f}')
+    print(f'\nspeedup: {results["legacy"] / results["per-event"]:.1f}x per event, '
+          f'{results["legacy"] / results["batch"]:.1f}x batched')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+Replays recorded Slack payloads through the Flask app to catch regressions in the hot handlers before deploy.
+
+The Slack client and Postgres are swapped out for local stand-ins: SlackBotBase becomes a mock, the secret
+store hands back a throwaway signing secret and the db is a temporary, seeded SQLite file (see viktor.local_db).
+Requests are signed just like Slack signs them, so they go through the real Events API adapter.
+
+Each line of the input file is a json object like
+    {"kind": "events", "payload": {...}}
+where kind is one of `events` (Events API envelope), `actions` (block action/shortcut payload) or `slash`
+(slash command form fields). If kind is missing, it's guessed from the payload.
+
+Usage:
+    python -m viktor.scripts.bench_replay viktor/scripts/replay_sample.jsonl --rate 100 --concurrency 8 --repeat 20
+
+DB statements are counted on the request thread, so run with `--workers 0` to process events inline and have
+their statements attributed to the endpoint; with workers, the ack latency is measured instead and
+the statements run in the background are only reported in the overall total.
+"""
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import hmac
+import json
+from pathlib import Path
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from typing import (
+    Dict,
+    List,
+    Tuple,
+)
+from unittest.mock import (
+    MagicMock,
+    patch,
+)
+from urllib.parse import urlencode
+
+from loguru import logger
+import numpy as np
+from sqlalchemy import event
+
+from viktor.local_db import (
+    make_local_engine,
+    seed_local_db,
+)
+from viktor.settings import auto_config
+
+SIGNING_SECRET = 'bench-signing-secret'
+
+
+class StatementCounter:
+    """Counts SQL statements, both overall and for the current thread"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def __call__(self, *args, **kwargs):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+        with self._lock:
+            self.total += 1
+
+    def reset_thread(self):
+        self._local.count = 0
+
+    @property
+    def thread_count(self) -> int:
+        return getattr(self._local, 'count', 0)
+
+
+def load_app(db_path: Path, n_workers: int, counter: StatementCounter):
+    """Imports the Flask app with the Slack client, secret store and db swapped for local stand-ins"""
+    import slacktools.secretstore
+
+    credstore = MagicMock(name='SecretStore')
+    credstore.return_value.get_key_and_make_ns.return_value = SimpleNamespace(
+        signing_secret=SIGNING_SECRET, spreadsheet_key='', onboarding_key='')
+    auto_config.EVENT_WORKERS = n_workers
+    auto_config.LOCAL_DB_PATH = str(db_path)
+    with patch.object(slacktools.secretstore, 'SecretStore', credstore), \
+            patch('viktor.bot_base.SlackBotBase'):
+        import viktor.app as mainapp
+    event.listen(mainapp.eng.engine, 'before_cursor_execute', counter)
+    # The app sets up DEBUG logging on import; that would drown out the benchmark
+    logger.configure(handlers=[{'sink': sys.stderr, 'level': 'WARNING'}], extra={'child_name': 'main'})
+    return mainapp
+
+
+def guess_kind(payload: Dict) -> str:
+    if 'event' in payload:
+        return 'events'
+    if 'command' in payload:
+        return 'slash'
+    return 'actions'
+
+
+def build_request(record: Dict) -> Tuple[str, str, Dict]:
+    """Converts a recorded payload into (label, path, kwargs for the test client's post)"""
+    payload = record['payload']
+    kind = record.get('kind', guess_kind(payload))
+    if kind == 'events':
+        body = json.dumps(payload)
+        ts = str(int(time.time()))
+        sig = 'v0=' + hmac.new(SIGNING_SECRET.encode(), f'v0:{ts}:{body}'.encode(), hashlib.sha256).hexdigest()
+        return f'events:{payload["event"].get("type")}', '/api/events', {
+            'data': body,
+            'content_type': 'application/json',
+            'headers': {'X-Slack-Request-Timestamp': ts, 'X-Slack-Signature': sig},
+        }
+    elif kind == 'actions':
+        return 'actions', '/api/actions', {
+            'data': urlencode({'payload': json.dumps(payload)}),
+            'content_type': 'application/x-www-form-urlencoded',
+        }
+    elif kind == 'slash':
+        return 'slash', '/api/slash', {
+            'data': urlencode(payload),
+            'content_type': 'application/x-www-form-urlencoded',
+        }
+    raise ValueError(f'Unknown payload kind: {kind}')
+
+
+def replay(mainapp, counter: StatementCounter, records: List[Dict], rate: float, concurrency: int) -> \
+        Tuple[Dict[str, List[Tuple[float, int, int]]], float]:
+    """Replays the records at the given rate (requests/sec, 0 for as fast as possible)
+
+    Returns:
+        a dict of label -> list of (latency secs, status code, db statements), and the wall time taken
+    """
+    results = defaultdict(list)
+    results_lock = threading.Lock()
+    local = threading.local()
+
+    def send(i: int, record: Dict):
+        if rate > 0:
+            # Pace the requests so they go out at the requested rate
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if not hasattr(local, 'client'):
+            local.client = mainapp.app.test_client()
+        label, path, kwargs = build_request(record)
+        counter.reset_thread()
+        req_start = time.perf_counter()
+        resp = local.client.post(path, **kwargs)
+        elapsed = time.perf_counter() - req_start
+        with results_lock:
+            results[label].append((elapsed, resp.status_code, counter.thread_count))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i, record in enumerate(records):
+            executor.submit(send, i, record)
+    # Let the workers finish off what's been queued before stopping the clock
+    mainapp.event_queue.join()
+    return results, time.perf_counter() - start
+
+
+def report(results: Dict[str, List[Tuple[float, int, int]]], wall_secs: float, total_stmts: int):
+    n_total = sum(len(x) for x in results.values())
+    print(f'\n{n_total} requests in {wall_secs:.2f}s ({n_total / wall_secs:.1f} req/s), '
+          f'{total_stmts} db statements overall ({total_stmts / max(n_total, 1):.2f}/req)\n')
+    header = f'{"endpoint":<32}{"n":>7}{"errors":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"stmts/req":>11}'
+    print(header)
+    print('-' * len(header))
+    for label, items in sorted(results.items()):
+        latencies = np.array([x[0] for x in items]) * 1000
+        n_errors = sum(1 for x in items if x[1] >= 400)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        stmts = np.mean([x[2] for x in items])
+        print(f'{label:<32}{len(items):>7}{n_errors:>8}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}{stmts:>11.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', type=Path, help='JSONL file of recorded Slack payloads')
+    parser.add_argument('--rate', type=float, default=0, help='requests/sec to send at (0 = unthrottled)')
+    parser.add_argument('--concurrency', type=int, default=4, help='number of concurrent senders')
+    parser.add_argument('--repeat', type=int, default=1, help='number of times to replay the file')
+    parser.add_argument('--workers', type=int, default=auto_config.EVENT_WORKERS,
+                        help='event queue workers (0 = process events inline)')
+    args = parser.parse_args()
+
+    with args.path.open() as f:
+        records = [json.loads(x) for x in f if x.strip() != '']
+    all_records = []
+    for i in range(args.repeat):
+        for record in records:
+            record = json.loads(json.dumps(record))
+            if 'event_id' in record['payload']:
+                # Otherwise repeats would be (rightly) de-duplicated
+                record['payload']['event_id'] = f'{record["payload"]["event_id"]}-{i}'
+            all_records.append(record)
+
+    counter = StatementCounter()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = Path(tmpdir).joinpath('viktor.db')
+        seed_local_db(make_local_engine(db_path))
+        mainapp = load_app(db_path, n_workers=args.workers, counter=counter)
+        counter.total = 0
+        results, wall_secs = replay(mainapp, counter, all_records, rate=args.rate, concurrency=args.concurrency)
+        report(results, wall_secs, total_stmts=counter.total)
+        mainapp.event_queue.shutdown()
+        mainapp.Bot.reaction_counter.shutdown()
+        mainapp.Bot.emoji_pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
 """Configuration setup"""
+import os
+
 from viktor import (
     __update_date__,
     __version__,
@@ -19,6 +21,50 @@ class Common(object):
     EMOJI_CHANNEL = 'CLWCPQ2TV'
     GENERAL_CHANNEL = 'CMEND3W3H'
 
+    # Event processing
+    EVENT_WORKERS = 4
+    EVENT_QUEUE_SIZE = 1000
+    # Events API retries are de-duplicated on event_id. Set IS_EVENT_ID_DB_BACKED to also record them in the db
+    EVENT_ID_TTL_SECS = 60 * 60
+    IS_EVENT_ID_DB_BACKED = False
+    # ASGI mode (run_asgi.py) - threads for the bridged Flask app & for slash command/action handlers
+    ASGI_WSGI_WORKERS = 10
+    ASGI_HANDLER_WORKERS = 16
+    # Reaction de-duplication - keys are hour-bucketed, so keep them around a bit longer than that
+    REACT_DEDUP_TTL_SECS = 2 * 60 * 60
+    REACT_DEDUP_MAX_KEYS = 50000
+    # Reaction counts are written to the db in batches, whichever threshold is hit first
+    REACTION_FLUSH_SECS = 30
+    REACTION_FLUSH_EVENTS = 100
+    # How often the in-memory emoji pool gets reconciled with the db
+    EMOJI_POOL_REFRESH_SECS = 60 * 60
+    # Bot settings are cached in-process. Changes from other processes arrive over NOTIFY, or after this TTL
+    BOT_SETTINGS_TTL_SECS = 60
+    # Users looked up by hash are cached for reading. The bot's own changes to users invalidate them right away
+    USER_CACHE_TTL_SECS = 5 * 60
+    # In-memory indexes are dropped when the ETL reloads their tables (over NOTIFY). In case that's missed,
+    #   they're also reloaded once they're this old
+    RESPONSE_INDEX_TTL_SECS = 30 * 60
+    ACRONYM_INDEX_TTL_SECS = 30 * 60
+    # Profile changes are logged sparsely, with a full snapshot every this many entries per user (1 = always full)
+    USER_CHANGELOG_SNAPSHOT_EVERY = 10
+    # Errors are written to the db in batches, whichever threshold is hit first. If the db is down,
+    #   they're spooled to this file (None = the temp dir) and replayed once it's back
+    ERROR_FLUSH_SECS = 10
+    ERROR_FLUSH_EVENTS = 50
+    ERROR_SPOOL_PATH = None
+    # Runs against a local SQLite db at this path (or ':memory:', seeded on startup) instead of Postgres.
+    #   See viktor.local_db
+    LOCAL_DB_PATH = os.getenv('VIKTOR_LOCAL_DB')
+    # Pin backfill (ETL) - pins.list is a Tier 2 method (20+ calls/min)
+    PINS_LIST_PER_MIN = 20
+    PINS_LIST_BURST = 3
+    PIN_BACKFILL_WORKERS = 4
+    # Quotes shown per page of `quote search` results
+    QUOTE_SEARCH_PAGE_SIZE = 5
+    # Without Postgres, quote search runs off an in-memory index. Rebuilt at least this often
+    QUOTE_INDEX_TTL_SECS = 10 * 60
+
 
 class Development(Common):
     """Configuration for development environment"""